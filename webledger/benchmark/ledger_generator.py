@@ -0,0 +1,244 @@
+"""
+Ledger Generator
+
+Writes synthetic (but valid) ledger files of a chosen size for benchmarking.
+The generated transactions use the features the parser supports:
+	- expense and income accounts in a hierarchy with a configurable fan-out
+	- cleared/pending status, codes and notes
+	- auto-balanced lines (no amount on the last line)
+	- virtual unbalanced (budget) lines
+	- investment purchases tracked as commodity units in virtual Units
+		accounts next to the book value, as in input/stan.dat
+	- investment purchases and sales in commodity units with @ (per unit)
+		and @@ (total) costs, for multiple commodity balancing, lots and
+		returns
+	- P directives with each commodity's price at the start of every month,
+		for market values
+
+Usage:
+	python -m webledger.benchmark.ledger_generator output.dat 100000
+"""
+
+import random
+import datetime
+import argparse
+
+
+PAYEES = ["Fred Meyer", "Panda Express", "Kettleman Bagels", "Food Carts",
+	"Mio Sushi", "Taco Del Mar", "Roscoe's", "Safeway", "Powell's Books",
+	"Portland General Electric", "NW Natural", "Comcast", "Chevron",
+	"Apizza Scholls", "Stumptown Coffee", "REI", "Costco", "Amazon"]
+
+WORDS = ["Food", "Travel", "Home", "Utils", "Auto", "Health", "Gifts",
+	"Fees", "Books", "Music", "Clothing", "Sports", "Office", "Garden",
+	"Pets", "Kids", "Dining", "Coffee", "Repairs", "Phone"]
+
+
+class LedgerGenerator:
+	"""
+	Generates transactions until the requested number of postings is reached.
+		- fanout: number of child accounts under each parent account
+		- depth: number of levels under Expenses (ie depth 3 gives accounts
+			like Expenses:Food:Travel2:Home3)
+		- commodities: number of investment commodities
+	"""
+
+	def __init__(self, postings, fanout=5, depth=2, commodities=3,
+			start_date=datetime.date(2000, 1, 1), seed=0):
+		self.postings = postings
+		self.random = random.Random(seed)
+		self.start_date = start_date
+		self.expense_accounts = generate_accounts("Expenses", fanout, depth)
+		self.income_accounts = generate_accounts("Income", max(fanout / 2, 1), 1)
+		self.asset_accounts = ["Assets:Checking", "Assets:Savings", "Liabilities:CreditCard"]
+		self.commodities = ["FUND%d" % (i + 1) for i in range(commodities)]
+		self.prices = dict((commodity, 10.0 + 5 * i) for (i, commodity) in enumerate(self.commodities))
+		self.holdings = dict((commodity, 0.0) for commodity in self.commodities)
+
+
+	def write(self, f):
+		"""
+		Write the ledger to file object f. Returns the number of postings
+		written.
+		"""
+		f.write("; Generated ledger file\n\n")
+		f.write("%s * Opening Balances\n" % self.start_date.strftime("%Y/%m/%d"))
+		f.write("    Assets:Checking    $10,000.00\n")
+		f.write("    Equity:OpeningBalances\n\n")
+
+		written = 2
+		date = self.start_date
+		count = 0
+		month = None
+
+		while written < self.postings:
+			count += 1
+			if self.random.random() < 0.4:
+				date += datetime.timedelta(days=1)
+
+			if (date.year, date.month) != month:
+				month = (date.year, date.month)
+				f.write("\n".join(self.price_lines(date)))
+				f.write("\n\n" if len(self.commodities) > 0 else "")
+
+			lines = self.transaction(date, count)
+			f.write("\n".join(lines))
+			f.write("\n\n")
+			written += len(lines) - 1
+
+		return written
+
+
+	def transaction(self, date, count):
+		"""
+		Returns the lines of one transaction
+		"""
+		kind = self.random.random()
+
+		if len(self.commodities) > 0 and kind < 0.03:
+			return self.investment(date)
+		elif kind < 0.10:
+			return self.income(date)
+		elif kind < 0.14:
+			return self.transfer(date)
+		else:
+			return self.expense(date, count)
+
+
+	def header(self, date, description, code=None):
+		status = self.random.choice(["* ", "* ", "* ", "! ", ""])
+		code = "(%s) " % code if code != None else ""
+		return "%s %s%s%s" % (date.strftime("%Y/%m/%d"), status, code, description)
+
+
+	def expense(self, date, count):
+		code = str(1000 + count) if self.random.random() < 0.1 else None
+		lines = [self.header(date, self.random.choice(PAYEES), code)]
+
+		for i in range(self.random.choice([1, 1, 1, 2, 3])):
+			line = "    %s    %s" % (self.random.choice(self.expense_accounts), self.amount(5, 200))
+			if self.random.random() < 0.1:
+				line += "    ; " + self.random.choice(WORDS).lower() + " note"
+			lines.append(line)
+
+		if self.random.random() < 0.1:
+			# budget tracking line, does not need to balance
+			lines.append("    (Assets:Budget:%s)    %s" % (self.random.choice(WORDS), self.amount(5, 200, -1)))
+
+		lines.append("    " + self.random.choice(self.asset_accounts))
+		return lines
+
+
+	def income(self, date):
+		account = self.random.choice(self.income_accounts)
+		amount = self.random.uniform(1000, 5000)
+		return [self.header(date, "Salary"),
+			"    %s    %s" % (account, format_amount(-amount)),
+			"    Expenses:Taxes:Federal    %s" % format_amount(amount * 0.2),
+			"    Assets:Savings    %s" % format_amount(amount * 0.1),
+			"    Assets:Checking"]
+
+
+	def transfer(self, date):
+		amount = self.random.uniform(50, 500)
+		return [self.header(date, "Transfer to savings"),
+			"    Assets:Savings    %s" % format_amount(amount),
+			"    Assets:Checking    %s" % format_amount(-amount)]
+
+
+	def investment(self, date):
+		commodity = self.random.choice(self.commodities)
+		self.prices[commodity] *= self.random.uniform(0.97, 1.04)
+		price = round(self.prices[commodity], 2)
+		units = round(self.random.uniform(1, 50), 4)
+		kind = self.random.random()
+
+		if kind < 0.3:
+			# units in a virtual account, next to the book value
+			return [self.header(date, "Buy " + commodity, "INV"),
+				"    (Assets:Investments:Units:%s)    %.4f %s" % (commodity, units, commodity),
+				"    Assets:Investments:BookValue:%s    %s" % (commodity, format_amount(units * price)),
+				"    Assets:Savings"]
+		elif kind < 0.5 and self.holdings[commodity] > 1:
+			# sell part of what is held, at a per unit cost
+			units = round(self.holdings[commodity] * self.random.uniform(0.1, 0.5), 4)
+			self.holdings[commodity] -= units
+			return [self.header(date, "Sell " + commodity, "INV"),
+				"    Assets:Investments:Broker    %.4f %s @ %s" % (-units, commodity, format_amount(price)),
+				"    Assets:Savings"]
+
+		# buy, at a per unit or a total cost
+		self.holdings[commodity] += units
+		if kind < 0.75:
+			cost = "@ " + format_amount(price)
+		else:
+			cost = "@@ " + format_amount(units * price)
+		return [self.header(date, "Buy " + commodity, "INV"),
+			"    Assets:Investments:Broker    %.4f %s %s" % (units, commodity, cost),
+			"    Assets:Savings"]
+
+
+	def price_lines(self, date):
+		"""
+		Returns P directives with every commodity's current price
+		"""
+		return ["P %s %s %s" % (date.strftime("%Y/%m/%d"), commodity, format_amount(self.prices[commodity]))
+			for commodity in self.commodities]
+
+
+	def amount(self, low, high, sign=1):
+		return format_amount(sign * self.random.uniform(low, high))
+
+
+
+#========================================================
+#	Utility Functions
+#========================================================
+
+def generate_accounts(root, fanout, depth):
+	"""
+	Returns the leaf accounts of a tree with fanout children per account
+	"""
+	accounts = [root]
+
+	for level in range(depth):
+		accounts = ["%s:%s%s" % (account, WORDS[i % len(WORDS)], "" if level == 0 else str(i + 1))
+			for account in accounts
+			for i in range(fanout)]
+
+	return accounts
+
+
+def format_amount(amount):
+	return "$" + "{:,.2f}".format(amount)
+
+
+def generate_ledger(filename, postings, **kwargs):
+	"""
+	Write a generated ledger file with (about) postings postings. Keyword
+	arguments are passed to LedgerGenerator. Returns the number of postings
+	written.
+	"""
+	f = open(filename, "w")
+	try:
+		return LedgerGenerator(postings, **kwargs).write(f)
+	finally:
+		f.close()
+
+
+
+if __name__ == "__main__":
+	arg_parser = argparse.ArgumentParser(description="Generate a synthetic ledger file")
+	arg_parser.add_argument("filename")
+	arg_parser.add_argument("postings", type=int)
+	arg_parser.add_argument("--fanout", type=int, default=5)
+	arg_parser.add_argument("--depth", type=int, default=2)
+	arg_parser.add_argument("--commodities", type=int, default=3)
+	arg_parser.add_argument("--seed", type=int, default=0)
+	args = arg_parser.parse_args()
+
+	written = generate_ledger(args.filename, args.postings,
+		fanout=args.fanout, depth=args.depth,
+		commodities=args.commodities, seed=args.seed)
+
+	print "Wrote %d postings to %s" % (written, args.filename)
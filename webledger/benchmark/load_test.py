@@ -0,0 +1,400 @@
+"""
+Load Test
+
+Starts the web app against a ledger file (generated at one or more sizes, or
+an existing one) and replays a fixed mix of requests at a fixed concurrency.
+Reports throughput and latency percentiles for each way of reaching the app:
+	test_client - Flask's test client, in process (no sockets or HTTP parsing)
+	socket - a real HTTP server on a local port; either a threaded server in
+		this process, or the pre-fork server with --workers
+
+Every request is a full render: no conditional request headers are sent, so
+the ETag/Last-Modified shortcut never applies.
+
+Usage:
+	python -m webledger.benchmark.load_test --scales 10k,100k
+	python -m webledger.benchmark.load_test --file input/stan.dat --concurrency 8
+	python -m webledger.benchmark.load_test --workers 4 --transports socket
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import shutil
+import signal
+import socket
+import urllib
+import httplib
+import tempfile
+import argparse
+import threading
+import SocketServer
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+import webledger.run as run
+import webledger.journal.watcher as watcher
+import webledger.server.prefork as prefork
+import webledger.benchmark.stages as stages
+import webledger.benchmark.ledger_generator as ledger_generator
+
+
+# (path, weight); the commands avoid date periods as generated ledgers end at
+# an arbitrary date
+DEFAULT_MIX = [
+	("/", 4),
+	("/?cmd=" + urllib.quote("balance income expenses"), 2),
+	("/?cmd=" + urllib.quote("register checking"), 2),
+	("/networth", 1)
+]
+
+TRANSPORTS = ["test_client", "socket"]
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+#========================================================
+#	Load Generator
+#========================================================
+
+def build_schedule(mix):
+	"""
+	Expand a mix of (path, weight) into a list of paths that is cycled
+	through, so every run sends the same requests in the same order.
+	"""
+	schedule = list()
+	for (path, weight) in mix:
+		schedule.extend([path] * weight)
+	return schedule
+
+
+def run_load(send, schedule, requests, concurrency):
+	"""
+	Send requests requests from concurrency threads, each calling send(path)
+	which returns the HTTP status code. Returns a list of (path, seconds,
+	status) and the total elapsed seconds.
+	"""
+	samples = list()
+	lock = threading.Lock()
+	state = {"next": 0}
+
+	def worker():
+		while True:
+			with lock:
+				index = state["next"]
+				state["next"] += 1
+			if index >= requests:
+				return
+
+			path = schedule[index % len(schedule)]
+			t1 = time.time()
+			try:
+				status = send(path)
+			except Exception:
+				status = 0
+			seconds = time.time() - t1
+
+			with lock:
+				samples.append((path, seconds, status))
+
+	threads = [threading.Thread(target=worker) for i in range(concurrency)]
+
+	t1 = time.time()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	elapsed = time.time() - t1
+
+	return (samples, elapsed)
+
+
+def summarize(samples, elapsed):
+	"""
+	Returns the throughput, error count and latency percentiles of a run,
+	overall and for each path
+	"""
+	latencies = sorted([seconds for (path, seconds, status) in samples])
+	by_path = dict()
+	for (path, seconds, status) in samples:
+		by_path.setdefault(path, list()).append(seconds)
+
+	return {
+		"requests": len(samples),
+		"errors": len([status for (path, seconds, status) in samples if status == 0 or status >= 400]),
+		"seconds": elapsed,
+		"throughput": len(samples) / elapsed if elapsed > 0 else 0.0,
+		"latency": [percentile(latencies, quantile) for quantile in QUANTILES],
+		"max": latencies[-1] if len(latencies) > 0 else 0.0,
+		"paths": dict((path, {
+				"requests": len(values),
+				"latency": [percentile(sorted(values), quantile) for quantile in QUANTILES]
+			}) for (path, values) in by_path.iteritems())
+	}
+
+
+def percentile(values, quantile):
+	"""
+	Returns the value at quantile (0.0 - 1.0) of the sorted values
+	"""
+	if len(values) == 0:
+		return 0.0
+	return values[min(int(quantile * len(values)), len(values) - 1)]
+
+
+
+#========================================================
+#	Transports
+#========================================================
+
+class TestClientTransport:
+	"""
+	Sends requests through Flask's test client. Each thread gets its own client.
+	"""
+	name = "test_client"
+
+	def __init__(self, app):
+		self.app = app
+		self.local = threading.local()
+
+	def start(self):
+		pass
+
+	def send(self, path):
+		if not hasattr(self.local, "client"):
+			self.local.client = self.app.test_client()
+		response = self.local.client.get(path)
+		response.data
+		return response.status_code
+
+	def stop(self):
+		pass
+
+
+class SocketTransport:
+	"""
+	Sends requests over HTTP to a local server: a threaded server in this
+	process, or with workers > 0 the pre-fork server in a child process.
+	"""
+	name = "socket"
+
+	def __init__(self, app, journal_watcher, workers=0):
+		self.app = app
+		self.journal_watcher = journal_watcher
+		self.workers = workers
+		self.server = None
+		self.pid = None
+		self.port = None
+
+	def start(self):
+		if self.workers > 0:
+			self.port = find_free_port()
+			self.pid = os.fork()
+			if self.pid == 0:
+				serve_prefork(self.app, self.journal_watcher, self.workers, self.port)
+		else:
+			self.server = make_server("127.0.0.1", 0, self.app,
+				server_class=ThreadingWSGIServer, handler_class=QuietRequestHandler)
+			self.port = self.server.server_port
+			thread = threading.Thread(target=self.server.serve_forever)
+			thread.daemon = True
+			thread.start()
+
+		wait_for_port(self.port)
+
+	def send(self, path):
+		connection = httplib.HTTPConnection("127.0.0.1", self.port)
+		try:
+			connection.request("GET", path)
+			response = connection.getresponse()
+			response.read()
+			return response.status
+		finally:
+			connection.close()
+
+	def stop(self):
+		if self.server != None:
+			self.server.shutdown()
+			self.server.server_close()
+			self.server = None
+		if self.pid != None:
+			os.kill(self.pid, signal.SIGTERM)
+			os.waitpid(self.pid, 0)
+			self.pid = None
+
+
+class ThreadingWSGIServer(SocketServer.ThreadingMixIn, WSGIServer):
+	daemon_threads = True
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+	def log_message(self, format, *args):
+		pass
+
+
+def serve_prefork(app, journal_watcher, workers, port):
+	"""
+	Run the pre-fork server in this (forked) process until it is sent SIGTERM.
+	Request logging goes to /dev/null.
+	"""
+	try:
+		devnull = os.open(os.devnull, os.O_WRONLY)
+		os.dup2(devnull, sys.stderr.fileno())
+		prefork.PreforkServer(app, journal_watcher, workers, port=port).serve_forever()
+	finally:
+		os._exit(0)
+
+
+def find_free_port():
+	s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	try:
+		s.bind(("127.0.0.1", 0))
+		return s.getsockname()[1]
+	finally:
+		s.close()
+
+
+def wait_for_port(port, timeout=10.0):
+	"""
+	Wait until something accepts connections on port
+	"""
+	deadline = time.time() + timeout
+
+	while True:
+		try:
+			socket.create_connection(("127.0.0.1", port), timeout=1.0).close()
+			return
+		except socket.error, e:
+			if e.errno != errno.ECONNREFUSED or time.time() > deadline:
+				raise
+			time.sleep(0.05)
+
+
+
+#========================================================
+#	Running Load Tests
+#========================================================
+
+def load_test_file(filename, transports, mix, requests, concurrency, workers=0):
+	"""
+	Load filename into the app and run the load with each transport. Returns
+	a dict with the postings count and a summary per transport.
+	"""
+	run.app.debug = False
+	run.journal_watcher = watcher.JournalWatcher(filename, run.read_journal_data)
+	schedule = build_schedule(mix)
+
+	results = {
+		"postings": len(run.journal_watcher.snapshot.journal.entries),
+		"bytes": os.path.getsize(filename),
+		"transports": dict()
+	}
+
+	for name in transports:
+		if name == "test_client":
+			transport = TestClientTransport(run.app)
+		else:
+			transport = SocketTransport(run.app, run.journal_watcher, workers)
+
+		transport.start()
+		try:
+			# one untimed request per path, so first-request costs aren't counted
+			for (path, weight) in mix:
+				transport.send(path)
+			(samples, elapsed) = run_load(transport.send, schedule, requests, concurrency)
+		finally:
+			transport.stop()
+
+		results["transports"][name] = summarize(samples, elapsed)
+
+	return results
+
+
+def load_test_scales(scales, transports, mix, requests, concurrency, workers=0):
+	"""
+	Generate a ledger file for each scale (number of postings) and load test
+	it. Returns a list of results, one per scale.
+	"""
+	directory = tempfile.mkdtemp(prefix="webledger-load-test-")
+	results = list()
+
+	try:
+		for scale in scales:
+			filename = os.path.join(directory, "ledger-%d.dat" % scale)
+			ledger_generator.generate_ledger(filename, scale)
+			results.append(load_test_file(filename, transports, mix, requests, concurrency, workers))
+			os.remove(filename)
+	finally:
+		shutil.rmtree(directory)
+
+	return results
+
+
+
+#========================================================
+#	Output
+#========================================================
+
+def print_results(results, concurrency):
+	"""
+	Print a table per ledger size: throughput and latency per transport, then
+	latency per path
+	"""
+	for result in results:
+		print "%d postings, %0.1f MB file, concurrency %d" % (
+			result["postings"], result["bytes"] / 1048576.0, concurrency)
+		print "    %-12s %8s %7s %10s %9s %9s %9s %9s" % (
+			"transport", "requests", "errors", "req/sec", "p50 ms", "p95 ms", "p99 ms", "max ms")
+
+		for name in TRANSPORTS:
+			if name not in result["transports"]:
+				continue
+			summary = result["transports"][name]
+			print "    %-12s %8d %7d %10.1f %s %9.1f" % (name, summary["requests"], summary["errors"],
+				summary["throughput"], " ".join("%9.1f" % (l * 1000.0) for l in summary["latency"]),
+				summary["max"] * 1000.0)
+
+		for name in TRANSPORTS:
+			if name not in result["transports"]:
+				continue
+			print "    %s by path:" % name
+			for (path, summary) in sorted(result["transports"][name]["paths"].iteritems()):
+				print "        %-50s %6d %s" % (urllib.unquote(path), summary["requests"],
+					" ".join("%9.1f" % (l * 1000.0) for l in summary["latency"]))
+		print
+
+
+
+if __name__ == "__main__":
+	arg_parser = argparse.ArgumentParser(description="Load test the web app")
+	arg_parser.add_argument("--file", help="load test an existing ledger file instead of generated ones")
+	arg_parser.add_argument("--scales", default="10k",
+		help="comma separated numbers of postings to generate (ie 10k,100k)")
+	arg_parser.add_argument("--transports", default=",".join(TRANSPORTS),
+		help="comma separated transports to use (test_client, socket)")
+	arg_parser.add_argument("--requests", type=int, default=200, help="requests per transport")
+	arg_parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once")
+	arg_parser.add_argument("--workers", type=int, default=0,
+		help="serve the socket transport with the pre-fork server and this many workers")
+	arg_parser.add_argument("--url", action="append",
+		help="path to request (ie /?cmd=register+checking); repeat for a mix. Default: a fixed mix")
+	arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+	args = arg_parser.parse_args()
+
+	transports = [name.strip() for name in args.transports.split(",")]
+	for name in transports:
+		if name not in TRANSPORTS:
+			arg_parser.error("unknown transport: %s" % name)
+
+	mix = [(url, 1) for url in args.url] if args.url else DEFAULT_MIX
+
+	if args.file:
+		results = [load_test_file(args.file, transports, mix, args.requests, args.concurrency, args.workers)]
+	else:
+		results = load_test_scales([stages.parse_scale(scale) for scale in args.scales.split(",")],
+			transports, mix, args.requests, args.concurrency, args.workers)
+
+	if args.json:
+		print json.dumps(results)
+	else:
+		print_results(results, args.concurrency)
@@ -0,0 +1,162 @@
+"""
+Benchmark Regression Check
+
+Runs the stage benchmarks several times against a generated ledger, compares
+the median time of each stage to a stored baseline and fails (exit code 1) if
+any stage got slower than the allowed threshold.
+
+Timings depend on the machine, so the committed baseline is only meaningful
+on the machine it was recorded on. Record a new one with --update before
+making changes, then check against it after.
+
+Usage:
+	python -m webledger.benchmark.regression
+	python -m webledger.benchmark.regression --threshold 15
+	python -m webledger.benchmark.regression --update
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import argparse
+
+import webledger.benchmark.stages as stages
+import webledger.benchmark.ledger_generator as ledger_generator
+
+
+BASELINE_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# stages that take less than this are too noisy to compare
+MINIMUM_SECONDS = 0.005
+
+
+#========================================================
+#	Running
+#========================================================
+
+def run_benchmarks(postings, runs, seed=0):
+	"""
+	Generate a ledger file and benchmark it runs times, each in a fresh
+	process. Returns the median seconds of each stage, the postings count and
+	the median peak memory.
+	"""
+	directory = tempfile.mkdtemp(prefix="webledger-regression-")
+
+	try:
+		filename = os.path.join(directory, "ledger.dat")
+		ledger_generator.generate_ledger(filename, postings, seed=seed)
+
+		results = list()
+		for run in range(runs):
+			results.append(stages.benchmark_file_in_subprocess(filename))
+			sys.stdout.write(".")
+			sys.stdout.flush()
+		print
+	finally:
+		shutil.rmtree(directory)
+
+	return {
+		"requested_postings": postings,
+		"postings": results[0]["postings"],
+		"runs": runs,
+		"seed": seed,
+		"stages": dict((stage, stages.median([result[stage] for result in results]))
+			for stage in stages.STAGES),
+		"peak_memory": stages.median([result["peak_memory"] for result in results])
+	}
+
+
+def compare(baseline, current, threshold):
+	"""
+	Compare current stage medians to the baseline. Returns a list of tuples of
+	(stage, baseline seconds, current seconds, change in percent, regressed).
+	"""
+	comparison = list()
+
+	for stage in stages.STAGES:
+		if stage not in baseline["stages"]:
+			continue
+
+		before = baseline["stages"][stage]
+		after = current["stages"][stage]
+		change = ((after - before) / before * 100.0) if before > 0 else 0.0
+		regressed = change > threshold and after >= MINIMUM_SECONDS
+
+		comparison.append((stage, before, after, change, regressed))
+
+	return comparison
+
+
+
+#========================================================
+#	Baseline File
+#========================================================
+
+def read_baseline(filename):
+	f = open(filename)
+	try:
+		return json.load(f)
+	finally:
+		f.close()
+
+
+def write_baseline(filename, results):
+	f = open(filename, "w")
+	try:
+		json.dump(results, f, indent=4, sort_keys=True, separators=(',', ': '))
+		f.write("\n")
+	finally:
+		f.close()
+
+
+
+if __name__ == "__main__":
+	arg_parser = argparse.ArgumentParser(description="Check stage benchmarks against a stored baseline")
+	arg_parser.add_argument("--baseline", default=BASELINE_FILENAME, help="baseline JSON file")
+	arg_parser.add_argument("--threshold", type=float, default=20.0,
+		help="percent slower than the baseline that counts as a regression")
+	arg_parser.add_argument("--runs", type=int, help="benchmark runs (median is compared)")
+	arg_parser.add_argument("--postings", type=int, help="size of the generated ledger")
+	arg_parser.add_argument("--update", action="store_true", help="record the results as the new baseline")
+	args = arg_parser.parse_args()
+
+	baseline = read_baseline(args.baseline) if os.path.exists(args.baseline) else None
+
+	# use the same ledger as the baseline unless told otherwise
+	postings = args.postings or (baseline["requested_postings"] if baseline else 10000)
+	runs = args.runs or (baseline["runs"] if baseline else 5)
+	seed = baseline["seed"] if baseline else 0
+
+	print "Benchmarking %d postings, %d runs" % (postings, runs)
+	current = run_benchmarks(postings, runs, seed)
+
+	if args.update:
+		write_baseline(args.baseline, current)
+		print "Baseline written to %s" % args.baseline
+		sys.exit(0)
+
+	if baseline == None:
+		print "No baseline found at %s, run with --update to record one" % args.baseline
+		sys.exit(1)
+
+	if current["postings"] != baseline["postings"]:
+		print "Warning: baseline was recorded with %d postings, this run used %d" % (
+			baseline["postings"], current["postings"])
+
+	comparison = compare(baseline, current, args.threshold)
+
+	print "    %-18s %12s %12s %9s" % ("stage", "baseline ms", "current ms", "change")
+	for (stage, before, after, change, regressed) in comparison:
+		print "    %-18s %12.1f %12.1f %+8.1f%%%s" % (stage, before * 1000.0, after * 1000.0, change,
+			"  REGRESSION" if regressed else "")
+	print "    peak memory: %0.1f MB (baseline %0.1f MB)" % (
+		current["peak_memory"] / 1048576.0, baseline["peak_memory"] / 1048576.0)
+
+	regressions = [row for row in comparison if row[4]]
+	if len(regressions) > 0:
+		print "%d stage(s) regressed by more than %0.1f%%" % (len(regressions), args.threshold)
+		sys.exit(1)
+
+	print "No regressions"
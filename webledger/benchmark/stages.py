@@ -0,0 +1,266 @@
+"""
+Stage Benchmarks
+
+Times each stage of loading a ledger file and generating reports, at one or
+more ledger sizes, and reports throughput, peak memory and how each stage
+scales with the number of postings.
+
+Each size is measured in a fresh process so that peak memory (the process
+high-water mark) belongs to that size alone.
+
+Usage:
+	python -m webledger.benchmark.stages --scales 10k,100k,1m
+	python -m webledger.benchmark.stages --file input/stan.dat
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+import webledger.parser.ledgerLexer as lexer
+import webledger.parser.ledgerParser as parser
+import webledger.parser.ledgertree as ledgertree
+import webledger.journal.journal as j
+import webledger.report.balance as balance
+import webledger.report.networth as networth
+import webledger.report.portfolio as portfolio
+import webledger.journal.memory_report as memory_report
+import webledger.benchmark.ledger_generator as ledger_generator
+from webledger.parser.ledgerSymbols import EOF
+
+
+# parse includes lexing, as the parser pulls its tokens from the lexer
+LOAD_STAGES = ["lex", "parse", "build_tree", "balance_tree", "journal_build"]
+REPORT_STAGES = ["balance_report", "register_report", "monthly_summary", "batch_report",
+	"networth", "portfolio"]
+STAGES = LOAD_STAGES + REPORT_STAGES
+
+REPORT_COMMANDS = {
+	"balance_report": "assets liabilities :excluding units",
+	"register_report": "checking",
+	"batch_report": [
+		"balance assets liabilities :excluding units",
+		"balance income expenses :period this month",
+		"balance income expenses :period last month",
+		"register checking"]
+}
+
+
+#========================================================
+#	Stage Timing
+#========================================================
+
+def time_stages(filename):
+	"""
+	Run every stage once against filename. Returns a dict with the seconds
+	taken by each stage, plus the number of postings.
+	"""
+	results = dict()
+	sourcetext = open(filename).read()
+
+	t1 = time.time()
+	lexer.initialize(sourcetext)
+	while lexer.get().type != EOF:
+		pass
+	results["lex"] = time.time() - t1
+
+	t1 = time.time()
+	generic_ast = parser.parse(sourcetext, verbose=False)
+	results["parse"] = time.time() - t1
+
+	t1 = time.time()
+	tree = ledgertree.build_ledgertree(generic_ast)
+	results["build_tree"] = time.time() - t1
+
+	t1 = time.time()
+	ledgertree.balance_ledgertree(tree)
+	results["balance_tree"] = time.time() - t1
+
+	t1 = time.time()
+	journal = j.ledgertree_to_journal(tree)
+	results["journal_build"] = time.time() - t1
+
+	del generic_ast, tree
+	results.update(time_reports(journal))
+	results["postings"] = len(journal.entries)
+
+	return results
+
+
+def time_reports(journal):
+	"""
+	Run each report generator once. Returns a dict of report stage -> seconds.
+	"""
+	results = dict()
+
+	parameters = balance.BalanceReportParameters.from_command(REPORT_COMMANDS["balance_report"].split())
+	t1 = time.time()
+	balance.generate_balance_report(journal, parameters)
+	results["balance_report"] = time.time() - t1
+
+	parameters = balance.BalanceReportParameters.from_command(REPORT_COMMANDS["register_report"].split())
+	t1 = time.time()
+	balance.generate_register_report(journal, parameters)
+	results["register_report"] = time.time() - t1
+
+	parameters = balance.MonthlySummaryParameters(
+		accounts_with=["assets", "liabilities"],
+		exclude_accounts_with=["units"],
+		period_start=None,
+		period_end=None)
+	t1 = time.time()
+	balance.generate_monthly_summary(journal, parameters)
+	results["monthly_summary"] = time.time() - t1
+
+	reports = [(command.split()[0], balance.BalanceReportParameters.from_command(command.split()[1:]))
+		for command in REPORT_COMMANDS["batch_report"]]
+	t1 = time.time()
+	balance.generate_reports(journal, reports)
+	results["batch_report"] = time.time() - t1
+
+	# book and market value per month (price store lookups)
+	t1 = time.time()
+	networth.generate_networth(journal, networth.NetWorthParameters())
+	results["networth"] = time.time() - t1
+
+	# lots (built on this first use), market values and returns
+	t1 = time.time()
+	portfolio.generate_portfolio_report(journal, portfolio.PortfolioReportParameters())
+	results["portfolio"] = time.time() - t1
+
+	return results
+
+
+def median(values):
+	values = sorted(values)
+	middle = len(values) / 2
+
+	if len(values) % 2 == 1:
+		return values[middle]
+	return (values[middle - 1] + values[middle]) / 2.0
+
+
+
+#========================================================
+#	Running Benchmarks
+#========================================================
+
+def benchmark_file(filename, repeat=1):
+	"""
+	Time the stages repeat times against filename in this process. Returns the
+	median seconds for each stage, the postings count, the file size and the
+	peak memory of the process.
+	"""
+	runs = [time_stages(filename) for i in range(repeat)]
+
+	results = dict((stage, median([run[stage] for run in runs])) for stage in STAGES)
+	results["postings"] = runs[0]["postings"]
+	results["bytes"] = os.path.getsize(filename)
+	results["peak_memory"] = memory_report.peak_memory()
+
+	return results
+
+
+def benchmark_file_in_subprocess(filename, repeat=1):
+	"""
+	Same as benchmark_file, but run in a fresh python process
+	"""
+	output = subprocess.check_output([sys.executable, "-m", "webledger.benchmark.stages",
+		"--file", filename, "--repeat", str(repeat), "--json"])
+	return json.loads(output)
+
+
+def benchmark_scales(scales, repeat=1, **generator_options):
+	"""
+	Generate a ledger file for each scale (number of postings) and benchmark
+	it. Returns a list of results, one per scale.
+	"""
+	directory = tempfile.mkdtemp(prefix="webledger-benchmark-")
+	results = list()
+
+	try:
+		for scale in scales:
+			filename = os.path.join(directory, "ledger-%d.dat" % scale)
+			ledger_generator.generate_ledger(filename, scale, **generator_options)
+			results.append(benchmark_file_in_subprocess(filename, repeat))
+			os.remove(filename)
+	finally:
+		shutil.rmtree(directory)
+
+	return results
+
+
+
+#========================================================
+#	Output
+#========================================================
+
+def print_results(results):
+	"""
+	Print a table per benchmarked file, then how each stage scales
+	"""
+	for result in results:
+		print "%d postings, %0.1f MB file, peak memory %0.1f MB" % (
+			result["postings"], result["bytes"] / 1048576.0, result["peak_memory"] / 1048576.0)
+		print "    %-18s %12s %16s" % ("stage", "ms", "postings/sec")
+		for stage in STAGES:
+			seconds = result[stage]
+			print "    %-18s %12.1f %16.0f" % (stage, seconds * 1000.0,
+				result["postings"] / seconds if seconds > 0 else float("inf"))
+		print
+
+	if len(results) > 1:
+		print "Scaling (ms per stage; exponent 1.0 = linear in postings)"
+		print "    %-18s %s %10s" % ("stage", " ".join("%12d" % r["postings"] for r in results), "exponent")
+		first = results[0]
+		last = results[-1]
+		for stage in STAGES:
+			exponent = float("nan")
+			if first[stage] > 0 and last[stage] > 0 and last["postings"] != first["postings"]:
+				exponent = (math.log(last[stage] / first[stage])
+					/ math.log(float(last["postings"]) / first["postings"]))
+			print "    %-18s %s %10.2f" % (stage,
+				" ".join("%12.1f" % (r[stage] * 1000.0) for r in results), exponent)
+
+
+def parse_scale(scale):
+	"""
+	Parse a scale like 10000, 10k or 1m
+	"""
+	multipliers = {"k": 1000, "m": 1000000}
+	scale = scale.strip().lower()
+
+	if scale[-1] in multipliers:
+		return int(float(scale[:-1]) * multipliers[scale[-1]])
+	return int(scale)
+
+
+
+if __name__ == "__main__":
+	arg_parser = argparse.ArgumentParser(description="Benchmark ledger loading and report stages")
+	arg_parser.add_argument("--file", help="benchmark an existing ledger file instead of generated ones")
+	arg_parser.add_argument("--scales", default="10k,30k,100k",
+		help="comma separated numbers of postings to generate (ie 10k,100k,1m)")
+	arg_parser.add_argument("--repeat", type=int, default=1, help="runs per scale (median is reported)")
+	arg_parser.add_argument("--fanout", type=int, default=5)
+	arg_parser.add_argument("--depth", type=int, default=2)
+	arg_parser.add_argument("--commodities", type=int, default=3)
+	arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+	args = arg_parser.parse_args()
+
+	if args.file:
+		results = [benchmark_file(args.file, args.repeat)]
+	else:
+		results = benchmark_scales([parse_scale(scale) for scale in args.scales.split(",")],
+			args.repeat, fanout=args.fanout, depth=args.depth, commodities=args.commodities)
+
+	if args.json:
+		print json.dumps(results[0] if args.file else results)
+	else:
+		print_results(results)
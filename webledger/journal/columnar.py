@@ -0,0 +1,454 @@
+"""
+Columnar Export
+
+Writes a journal as columns of binary arrays, one file that analytics jobs
+(or a reload) can map back without parsing the ledger:
+	postings - per entry, in file order: header, date, account, entry type,
+		amount, commodity, value (@/@@ cost), book value, note
+	headers - per transaction: date, status, code, description, note
+	prices - P directives: date, commodity, price, currency
+	strings - string table; every text column holds indexes into it (-1 for
+		None)
+
+Layout: an 8 byte magic ("WLCOLUMN"), the length of a JSON header (4 bytes,
+little endian), the JSON header, then each column as a contiguous little
+endian array, aligned to 8 bytes. The JSON header lists every column's array
+type code, count and offset in the file, so other tools can map a column
+directly (ie an amount column, type "d": numpy.memmap(filename, dtype="<f8",
+offset=offset, shape=(count,))).
+
+load_columns maps the file and reads values from the map as they are used,
+rather than copying the columns into memory.
+
+Dates are day ordinals (datetime.date.toordinal). Amounts are doubles, with a
+column of their decimal places so the exact Decimal can be rebuilt (amounts
+up to 15 significant digits).
+
+	python -m webledger.journal.columnar [ledger file] [output file]
+"""
+
+import sys
+import json
+import mmap
+import array
+import struct
+import datetime
+from decimal import Decimal
+
+import webledger.journal.journal as journal
+import webledger.utilities.metrics as metrics
+
+
+MAGIC = "WLCOLUMN"
+VERSION = 1
+ALIGNMENT = 8
+
+# value_places for a posting without a value (as opposed to a value without an amount, -1)
+NO_VALUE = -2
+
+
+#========================================================
+#	String Table
+#========================================================
+
+class StringTable:
+	"""
+	Numbers the strings written, each unique string once
+	"""
+
+	def __init__(self):
+		self.strings = list()
+		self.index = dict()
+
+
+	def add(self, string):
+		if string == None:
+			return -1
+		position = self.index.get(string)
+		if position == None:
+			position = self.index[string] = len(self.strings)
+			self.strings.append(string)
+		return position
+
+
+	def to_arrays(self):
+		"""
+		Returns (offsets, data): the utf-8 bytes of every string, one after the
+		other, and the offset where each starts (plus the end of the last)
+		"""
+		encoded = [string.encode("utf-8") if isinstance(string, unicode) else string
+			for string in self.strings]
+
+		offsets = array.array("i", [0])
+		position = 0
+		for string in encoded:
+			position += len(string)
+			offsets.append(position)
+
+		return (offsets, array.array("c", "".join(encoded)))
+
+
+
+#========================================================
+#	Export
+#========================================================
+
+def export_columns(journal_data, filename):
+	"""
+	Write the journal's postings, headers and prices as columns to filename
+	"""
+	with metrics.timer("columnar_export"):
+		strings = StringTable()
+		tables = dict()
+
+		tables["postings"] = posting_columns(journal_data, strings)
+		tables["headers"] = header_columns(journal_data, strings)
+		tables["prices"] = price_columns(journal_data, strings)
+
+		(offsets, data) = strings.to_arrays()
+		tables["strings"] = [("offsets", offsets), ("data", data)]
+
+		write_columns(filename, tables)
+
+
+def posting_columns(journal_data, strings):
+	header_ids = array.array("i")
+	dates = array.array("i")
+	accounts = array.array("i")
+	entry_types = array.array("i")
+	amounts = array.array("d")
+	amount_places = array.array("b")
+	commodities = array.array("i")
+	values = array.array("d")
+	value_places = array.array("b")
+	value_commodities = array.array("i")
+	book_values = array.array("d")
+	notes = array.array("i")
+
+	header_id = -1
+	last_header = None
+
+	for entry in journal_data.entries:
+		if entry.header is not last_header:
+			last_header = entry.header
+			header_id += 1
+
+		header_ids.append(header_id)
+		dates.append(entry.header.date.toordinal())
+		accounts.append(strings.add(entry.account))
+		entry_types.append(strings.add(entry.entry_type))
+
+		(amount, commodity) = entry.amount
+		amounts.append(float(amount))
+		amount_places.append(decimal_places(amount))
+		commodities.append(strings.add(commodity))
+
+		if entry.value == None:
+			values.append(0.0)
+			value_places.append(NO_VALUE)
+			value_commodities.append(-1)
+		else:
+			(value, value_commodity) = entry.value
+			values.append(float(value) if value != None else 0.0)
+			value_places.append(decimal_places(value) if value != None else -1)
+			value_commodities.append(strings.add(value_commodity))
+
+		book_values.append(float(entry.get_book_value()))
+		notes.append(strings.add(entry.note))
+
+	return [("header", header_ids), ("date", dates), ("account", accounts),
+		("entry_type", entry_types), ("amount", amounts), ("amount_places", amount_places),
+		("commodity", commodities), ("value", values), ("value_places", value_places),
+		("value_commodity", value_commodities), ("book_value", book_values), ("note", notes)]
+
+
+def header_columns(journal_data, strings):
+	dates = array.array("i")
+	statuses = array.array("i")
+	codes = array.array("i")
+	descriptions = array.array("i")
+	notes = array.array("i")
+
+	last_header = None
+	for entry in journal_data.entries:
+		header = entry.header
+		if header is last_header:
+			continue
+		last_header = header
+
+		dates.append(header.date.toordinal())
+		statuses.append(strings.add(header.status))
+		codes.append(strings.add(header.code))
+		descriptions.append(strings.add(header.description))
+		notes.append(strings.add(header.note))
+
+	return [("date", dates), ("status", statuses), ("code", codes),
+		("description", descriptions), ("note", notes)]
+
+
+def price_columns(journal_data, strings):
+	dates = array.array("i")
+	commodities = array.array("i")
+	prices = array.array("d")
+	price_places = array.array("b")
+	currencies = array.array("i")
+
+	for (date, commodity, price, currency) in journal_data.prices:
+		dates.append(date.toordinal())
+		commodities.append(strings.add(commodity))
+		prices.append(float(price))
+		price_places.append(decimal_places(price))
+		currencies.append(strings.add(currency))
+
+	return [("date", dates), ("commodity", commodities), ("price", prices),
+		("price_places", price_places), ("currency", currencies)]
+
+
+def write_columns(filename, tables):
+	"""
+	Write the tables (name -> list of (column name, array)) with a JSON header
+	of where each column is
+	"""
+	columns = list()
+
+	# offsets are relative to the start of the columns, after the JSON header
+	position = 0
+	for table in sorted(tables.keys()):
+		for (name, column) in tables[table]:
+			columns.append((table, name, column, position))
+			position += align(len(column) * column.itemsize)
+
+	# the header grows as the start is added to every offset, so grow the
+	# space for it until it fits
+	start = 0
+	header = layout_header(columns, start)
+	while len(MAGIC) + 4 + len(header) > start:
+		start = align(len(MAGIC) + 4 + len(header) + 16)
+		header = layout_header(columns, start)
+
+	header += " " * (start - len(MAGIC) - 4 - len(header))
+
+	f = open(filename, "wb")
+	try:
+		f.write(MAGIC)
+		f.write(struct.pack("<I", len(header)))
+		f.write(header)
+		for (table, name, column, offset) in columns:
+			if sys.byteorder != "little":
+				column = array.array(column.typecode, column)
+				column.byteswap()
+			data = column.tostring()
+			f.write(data)
+			f.write("\0" * (align(len(data)) - len(data)))
+	finally:
+		f.close()
+
+
+def layout_header(columns, start):
+	"""
+	Returns the JSON header for the columns, placed from start on
+	"""
+	layout = {"version": VERSION, "byteorder": "little", "tables": dict()}
+
+	for (table, name, column, offset) in columns:
+		layout["tables"].setdefault(table, dict())[name] = {
+			"type": column.typecode, "count": len(column), "offset": start + offset}
+
+	return json.dumps(layout, sort_keys=True)
+
+
+def align(size):
+	return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def decimal_places(amount):
+	return max(-Decimal(amount).as_tuple().exponent, 0)
+
+
+
+#========================================================
+#	Load
+#========================================================
+
+class Column:
+	"""
+	One column of a mapped export. Values are read from the map as they are
+	needed (nothing is copied up front):
+		- len(column), column[index] and iteration, like a list
+		- tolist(): all the values, as a list
+		- to_array(): a copy of the values, as an array
+		- buffer(): the column's bytes in the map, without copying them (ie
+			for numpy.frombuffer; exports are little endian, but older ones
+			may have been written in another byteorder, see Column.byteorder)
+	"""
+
+	# values read per struct call when iterating
+	CHUNK = 4096
+
+	def __init__(self, data, typecode, offset, count, byteorder="little"):
+		self.data = data
+		self.typecode = typecode
+		self.offset = offset
+		self.count = count
+		self.byteorder = byteorder
+		self.order = "<" if byteorder == "little" else ">"
+		self.itemsize = struct.calcsize(self.order + typecode)
+		self.format = self.order + typecode
+
+
+	def __len__(self):
+		return self.count
+
+
+	def __getitem__(self, index):
+		if index < 0:
+			index += self.count
+		if index < 0 or index >= self.count:
+			raise IndexError("column index out of range")
+		return struct.unpack_from(self.format, self.data, self.offset + index * self.itemsize)[0]
+
+
+	def __iter__(self):
+		for start in range(0, self.count, self.CHUNK):
+			count = min(self.CHUNK, self.count - start)
+			for value in struct.unpack_from("%s%d%s" % (self.order, count, self.typecode), self.data,
+					self.offset + start * self.itemsize):
+				yield value
+
+
+	def tolist(self):
+		return list(struct.unpack_from("%s%d%s" % (self.order, self.count, self.typecode), self.data, self.offset))
+
+
+	def to_array(self):
+		values = array.array(self.typecode, self.data[self.offset:self.offset + self.count * self.itemsize])
+		if self.byteorder != sys.byteorder:
+			values.byteswap()
+		return values
+
+
+	def buffer(self):
+		return buffer(self.data, self.offset, self.count * self.itemsize)
+
+
+class Columns:
+	"""
+	A mapped columnar export:
+		- tables: table name -> column name -> Column, reading from the map
+		- strings: the string table, as a list
+	The file stays mapped until close() (or the end of a with block).
+	"""
+
+	def __init__(self, data, tables, strings):
+		self.data = data
+		self.tables = tables
+		self.strings = strings
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+
+	def close(self):
+		self.data.close()
+
+
+	def string(self, index):
+		return self.strings[index] if index >= 0 else None
+
+
+	def to_journal(self):
+		"""
+		Returns the journal rebuilt from the columns, without parsing or
+		balancing the ledger file again
+		"""
+		with metrics.timer("journal_build"):
+			string = self.string
+			dates = dict()
+
+			def to_date(ordinal):
+				date = dates.get(ordinal)
+				if date == None:
+					date = dates[ordinal] = datetime.date.fromordinal(ordinal)
+				return date
+
+			h = self.tables["headers"]
+			headers = [journal.Header(to_date(date), string(status), string(code), string(description), string(note))
+				for (date, status, code, description, note)
+					in zip(h["date"], h["status"], h["code"], h["description"], h["note"])]
+
+			p = self.tables["postings"]
+			entries = list()
+			for (header, account, entry_type, amount, amount_places, commodity, value, value_places,
+					value_commodity, note) in zip(p["header"], p["account"], p["entry_type"], p["amount"],
+						p["amount_places"], p["commodity"], p["value"], p["value_places"],
+						p["value_commodity"], p["note"]):
+				if value_places == NO_VALUE:
+					value = None
+				else:
+					value = (to_decimal(value, value_places) if value_places >= 0 else None, string(value_commodity))
+
+				entries.append(journal.Entry(headers[header], string(account), string(entry_type),
+					(to_decimal(amount, amount_places), string(commodity)), value, string(note)))
+
+			p = self.tables["prices"]
+			prices = [(to_date(date), string(commodity), to_decimal(price, places), string(currency))
+				for (date, commodity, price, places, currency)
+					in zip(p["date"], p["commodity"], p["price"], p["price_places"], p["currency"])]
+
+			return journal.Journal(entries, prices)
+
+
+def load_columns(filename):
+	"""
+	Map a columnar export and return its Columns, which read from the map
+	(close it when done). Only the string table is read in at load.
+	"""
+	with metrics.timer("columnar_load"):
+		f = open(filename, "rb")
+		try:
+			data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		finally:
+			f.close()
+
+		try:
+			if data[:len(MAGIC)] != MAGIC:
+				raise Exception("Not a columnar export: " + filename)
+
+			(size,) = struct.unpack("<I", data[len(MAGIC):len(MAGIC) + 4])
+			layout = json.loads(data[len(MAGIC) + 4:len(MAGIC) + 4 + size])
+			if layout["version"] != VERSION:
+				raise Exception("Unsupported columnar export version: " + str(layout["version"]))
+
+			tables = dict()
+			for (table, columns) in layout["tables"].iteritems():
+				tables[table] = dict()
+				for (name, column) in columns.iteritems():
+					tables[table][name] = Column(data, str(column["type"]), column["offset"],
+						column["count"], layout["byteorder"])
+
+			offsets = tables["strings"]["offsets"].tolist()
+			text = tables["strings"]["data"].buffer()
+			strings = [text[offsets[index]:offsets[index + 1]] for index in range(len(offsets) - 1)]
+		except:
+			data.close()
+			raise
+
+		return Columns(data, tables, strings)
+
+
+def to_decimal(amount, places):
+	return Decimal("{:.{}f}".format(amount, places))
+
+
+
+if __name__ == "__main__":
+	import webledger.parser.ledgertree as ledgertree
+
+	journal_data = journal.ledgertree_to_journal(ledgertree.parse_into_ledgertree(sys.argv[1]))
+	export_columns(journal_data, sys.argv[2])
+	print "Exported %d postings to %s" % (len(journal_data.entries), sys.argv[2])
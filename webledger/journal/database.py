@@ -0,0 +1,408 @@
+"""
+Journal Database
+
+Exports a journal to a SQLite database, for querying with SQL (see
+report/sql_backend.py) or other tools:
+	headers - one row per transaction: date, status, code, description
+	postings - one row per entry: header, account, amount, commodity, cost
+	accounts - every account, including parent accounts, with its parent
+	account_lineage - (account, ancestor) for every account and each of its
+		ancestors (and itself), for rolling balances up to parent accounts
+	commodities - the journal's commodities; ids match journal.commodities
+	meta - the size and a hash of the ledger file that was exported
+
+Dates are ISO (yyyy-mm-dd) strings. Amounts are kept both exactly, as text,
+and as integer millionths (amount_micros, book_value_micros) so SQL sums are
+exact.
+
+A full export loads every table with executemany in one explicit
+transaction (covering the table and index statements too), and creates the
+indexes after the rows are in. If the ledger file has only grown since the
+last export (its first "size" bytes still hash the same), only the new
+transactions are added to a copy of the last export; the last transaction of
+the previous export is replaced, as lines appended to the file may belong to
+it.
+
+Exports are written to a temporary file and renamed over the database, so the
+database file is never changed in place: connections already open keep
+reading the export they opened. link_snapshot gives each loaded journal its
+own name for the export made from it, so its reports never read a later one.
+"""
+
+import os
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import contextlib
+import collections
+from decimal import Decimal
+
+import webledger.utilities.metrics as metrics
+
+
+MICROS = 1000000
+
+# snapshot links kept (the newest first), see link_snapshot
+SNAPSHOTS_KEPT = 3
+snapshot_links = collections.deque()
+
+TABLES = [
+	"""CREATE TABLE meta (
+		key TEXT PRIMARY KEY,
+		value TEXT)""",
+	"""CREATE TABLE headers (
+		id INTEGER PRIMARY KEY,
+		date TEXT NOT NULL,
+		status TEXT,
+		code TEXT,
+		description TEXT,
+		note TEXT)""",
+	"""CREATE TABLE accounts (
+		id INTEGER PRIMARY KEY,
+		name TEXT NOT NULL UNIQUE,
+		parent_id INTEGER,
+		depth INTEGER NOT NULL)""",
+	"""CREATE TABLE account_lineage (
+		account_id INTEGER NOT NULL,
+		ancestor_id INTEGER NOT NULL,
+		PRIMARY KEY (account_id, ancestor_id))""",
+	"""CREATE TABLE commodities (
+		id INTEGER PRIMARY KEY,
+		symbol TEXT)""",
+	"""CREATE TABLE postings (
+		id INTEGER PRIMARY KEY,
+		header_id INTEGER NOT NULL,
+		date TEXT NOT NULL,
+		account_id INTEGER NOT NULL,
+		entry_type TEXT,
+		amount TEXT NOT NULL,
+		amount_micros INTEGER NOT NULL,
+		commodity_id INTEGER NOT NULL,
+		value TEXT,
+		value_commodity TEXT,
+		book_value_micros INTEGER NOT NULL,
+		note TEXT)"""
+]
+
+INDEXES = [
+	"CREATE INDEX postings_account_date ON postings (account_id, date)",
+	"CREATE INDEX postings_date ON postings (date)",
+	"CREATE INDEX postings_header ON postings (header_id)",
+	"CREATE INDEX headers_date ON headers (date)"
+]
+
+
+#========================================================
+#	Export
+#========================================================
+
+def export_journal(journal_data, source_filename, database_filename):
+	"""
+	Export the journal loaded from source_filename to database_filename.
+	Returns "incremental" if only the transactions appended to the file
+	since the last export were written, otherwise "full".
+	"""
+	with metrics.timer("export"):
+		(size, digest) = file_digest(source_filename)
+		previous = read_meta_from(database_filename)
+		incremental = previous != None and previous["size"] <= size \
+			and file_digest(source_filename, previous["size"])[1] == previous["digest"]
+
+		(handle, temporary_filename) = tempfile.mkstemp(
+			prefix=os.path.basename(database_filename) + ".",
+			dir=os.path.dirname(os.path.abspath(database_filename)))
+		os.close(handle)
+
+		try:
+			# mkstemp makes the file private; keep the database's permissions
+			if os.path.exists(database_filename):
+				shutil.copymode(database_filename, temporary_filename)
+			else:
+				os.chmod(temporary_filename, 0644)
+
+			if incremental:
+				shutil.copyfile(database_filename, temporary_filename)
+
+			connection = sqlite3.connect(temporary_filename, isolation_level=None)
+			try:
+				with transaction(connection):
+					if incremental:
+						export_incremental(connection, journal_data, previous)
+					else:
+						export_full(connection, journal_data)
+					write_meta(connection, size, digest, count_headers(journal_data))
+			finally:
+				connection.close()
+
+			replace_file(temporary_filename, database_filename)
+		except:
+			if os.path.exists(temporary_filename):
+				os.remove(temporary_filename)
+			raise
+
+	return "incremental" if incremental else "full"
+
+
+@contextlib.contextmanager
+def transaction(connection):
+	"""
+	Run the statements in the block in one transaction (the connection must
+	be in autocommit mode, isolation_level=None)
+	"""
+	connection.execute("BEGIN")
+	try:
+		yield
+	except:
+		connection.execute("ROLLBACK")
+		raise
+	connection.execute("COMMIT")
+
+
+def export_full(connection, journal_data):
+	"""
+	Fill an empty database with the journal: create the tables, load every
+	row, then build the indexes
+	"""
+	for statement in TABLES:
+		connection.execute(statement)
+
+	account_ids = insert_accounts(connection, journal_data, dict())
+	insert_commodities(connection, journal_data, 0)
+	insert_transactions(connection, journal_data, account_ids, 0)
+
+	for statement in INDEXES:
+		connection.execute(statement)
+
+
+def export_incremental(connection, journal_data, previous):
+	"""
+	Add the transactions appended since the previous export. The last
+	transaction exported before is deleted and written again.
+	"""
+	first_header = max(previous["headers"] - 1, 0)
+
+	connection.execute("DELETE FROM postings WHERE header_id >= ?", (first_header,))
+	connection.execute("DELETE FROM headers WHERE id >= ?", (first_header,))
+
+	account_ids = dict(connection.execute("SELECT name, id FROM accounts"))
+	account_ids = insert_accounts(connection, journal_data, account_ids)
+	(commodity_count,) = connection.execute("SELECT COUNT(*) FROM commodities").fetchone()
+	insert_commodities(connection, journal_data, commodity_count)
+	insert_transactions(connection, journal_data, account_ids, first_header)
+
+
+def insert_accounts(connection, journal_data, account_ids):
+	"""
+	Insert the accounts not already in account_ids (name -> id), parents
+	before children, and their lineage. Returns the updated account_ids.
+	"""
+	accounts = list()
+	lineage = list()
+
+	for name in sorted(journal_data.all_accounts, key=lambda name: (name.count(":"), name)):
+		if name in account_ids:
+			continue
+
+		parts = name.split(":")
+		account_id = len(account_ids) + 1
+		account_ids[name] = account_id
+		parent_id = account_ids[":".join(parts[:-1])] if len(parts) > 1 else None
+		accounts.append((account_id, name, parent_id, len(parts)))
+
+		for level in range(1, len(parts) + 1):
+			lineage.append((account_id, account_ids[":".join(parts[:level])]))
+
+	connection.executemany("INSERT INTO accounts (id, name, parent_id, depth) VALUES (?, ?, ?, ?)", accounts)
+	connection.executemany("INSERT INTO account_lineage (account_id, ancestor_id) VALUES (?, ?)", lineage)
+
+	return account_ids
+
+
+def insert_commodities(connection, journal_data, first):
+	connection.executemany("INSERT INTO commodities (id, symbol) VALUES (?, ?)",
+		[(index, journal_data.commodities[index]) for index in range(first, len(journal_data.commodities))])
+
+
+def insert_transactions(connection, journal_data, account_ids, first_header):
+	"""
+	Insert the headers numbered first_header and up (in file order), and
+	their postings
+	"""
+	headers = list()
+	postings = list()
+	header_id = -1
+	last_header = None
+
+	for entry in journal_data.entries:
+		if entry.header is not last_header:
+			last_header = entry.header
+			header_id += 1
+			if header_id >= first_header:
+				header = entry.header
+				headers.append((header_id, header.date.isoformat(), header.status, header.code,
+					header.description, header.note))
+
+		if header_id < first_header:
+			continue
+
+		(amount, commodity) = entry.amount
+		(value, value_commodity) = entry.value if entry.value != None else (None, None)
+		postings.append((header_id, entry.header.date.isoformat(), account_ids[entry.account],
+			entry.entry_type, str(amount), to_micros(amount), entry.commodity_id,
+			str(value) if value != None else None, value_commodity,
+			to_micros(entry.get_book_value()), entry.note))
+
+	connection.executemany("INSERT INTO headers (id, date, status, code, description, note) "
+		"VALUES (?, ?, ?, ?, ?, ?)", headers)
+	connection.executemany("INSERT INTO postings (header_id, date, account_id, entry_type, amount, "
+		"amount_micros, commodity_id, value, value_commodity, book_value_micros, note) "
+		"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", postings)
+
+
+def count_headers(journal_data):
+	count = 0
+	last_header = None
+	for entry in journal_data.entries:
+		if entry.header is not last_header:
+			last_header = entry.header
+			count += 1
+	return count
+
+
+
+def replace_file(source, destination):
+	"""
+	Rename source over destination (in one step, except on Windows, where an
+	existing destination has to be removed first)
+	"""
+	if os.name == "nt" and os.path.exists(destination):
+		os.remove(destination)
+	os.rename(source, destination)
+
+
+
+#========================================================
+#	Snapshots
+#========================================================
+
+def link_snapshot(database_filename, version):
+	"""
+	Returns a name for the current export of database_filename that stays
+	with it after later exports replace the database (a hard link, or a copy
+	where links are not available): database_filename.snapshot-version.
+	Only the last few snapshot names are kept; older ones are removed.
+	"""
+	database_filename = os.path.abspath(database_filename)
+	snapshot_filename = "%s.snapshot-%s" % (database_filename, version)
+
+	if os.path.exists(snapshot_filename):
+		os.remove(snapshot_filename)
+	if hasattr(os, "link"):
+		os.link(database_filename, snapshot_filename)
+	else:
+		shutil.copyfile(database_filename, snapshot_filename)
+
+	if snapshot_filename in snapshot_links:
+		snapshot_links.remove(snapshot_filename)
+	snapshot_links.appendleft(snapshot_filename)
+	while len(snapshot_links) > SNAPSHOTS_KEPT:
+		snapshot_links.pop()
+
+	# also removes the snapshots left by earlier runs
+	directory = os.path.dirname(database_filename)
+	prefix = os.path.basename(database_filename) + ".snapshot-"
+	for name in os.listdir(directory):
+		filename = os.path.join(directory, name)
+		if name.startswith(prefix) and filename not in snapshot_links:
+			os.remove(filename)
+
+	return snapshot_filename
+
+
+
+#========================================================
+#	Meta
+#========================================================
+
+def read_meta(connection):
+	"""
+	Returns the size, digest and header count of the last export, or None if
+	there is no (complete) export in the database
+	"""
+	try:
+		meta = dict(connection.execute("SELECT key, value FROM meta"))
+	except sqlite3.DatabaseError:
+		return None
+
+	if "size" not in meta or "digest" not in meta or "headers" not in meta:
+		return None
+
+	return {"size": int(meta["size"]), "digest": meta["digest"], "headers": int(meta["headers"])}
+
+
+def read_meta_from(database_filename):
+	"""
+	read_meta for a database file, or None if there is no file
+	"""
+	if not os.path.exists(database_filename):
+		return None
+
+	connection = sqlite3.connect(database_filename)
+	try:
+		return read_meta(connection)
+	finally:
+		connection.close()
+
+
+def write_meta(connection, size, digest, headers):
+	connection.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+		[("size", str(size)), ("digest", digest), ("headers", str(headers))])
+
+
+def file_digest(filename, size=None):
+	"""
+	Returns (size, sha1 hex digest) of the first size bytes of a file (the
+	whole file by default)
+	"""
+	digest = hashlib.sha1()
+	remaining = size if size != None else os.path.getsize(filename)
+	total = 0
+
+	f = open(filename, "rb")
+	try:
+		while remaining > 0:
+			chunk = f.read(min(remaining, 1048576))
+			if len(chunk) == 0:
+				break
+			digest.update(chunk)
+			remaining -= len(chunk)
+			total += len(chunk)
+	finally:
+		f.close()
+
+	return (total, digest.hexdigest())
+
+
+
+#========================================================
+#	Amounts
+#========================================================
+
+def to_micros(amount):
+	return int(Decimal(amount) * MICROS)
+
+
+def from_micros(micros, places=None):
+	"""
+	Returns the Decimal for an amount in millionths, with the given number of
+	decimal places (like a sum of Decimals, the most places of the amounts
+	summed), or without trailing zeros
+	"""
+	if places != None:
+		return (Decimal(micros) / MICROS).quantize(Decimal(1).scaleb(-places))
+
+	amount = "{:f}".format(Decimal(micros) / MICROS)
+	if "." in amount:
+		amount = amount.rstrip("0").rstrip(".")
+	return Decimal(amount)
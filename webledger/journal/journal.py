@@ -7,6 +7,11 @@ Contains the journal data classes:
 
 import string
 import datetime
+import webledger.journal.prices as prices
+import webledger.journal.lots as lots
+import webledger.journal.search as search
+import webledger.utilities.metrics as metrics
+from webledger.parser.ledgerNodeTypes import PRICE
 
 #========================================================
 #	Structs
@@ -37,7 +42,10 @@ class Entry:
 	"""
 	A ledger transaction entry
 		- entry_type is one of no/balanced/unbalanced (TODO: fix values -- this field used to be called "virtual")
-		- amount and value are both tuples of (amount, commodity)
+		- amount and value are both tuples of (amount, commodity); value is
+			the cost (@/@@) of the amount, signed like the amount
+		- commodity_id is the position of the amount's commodity in the
+			journal's commodities (set by the Journal)
 	"""
 
 	def __init__(self, header, account, entry_type, amount, value, note):
@@ -48,6 +56,7 @@ class Entry:
 		self.amount = amount
 		self.value = value
 		self.note = note
+		self.commodity_id = 0
 
 
 	def to_string(self):
@@ -79,6 +88,19 @@ class Entry:
 		return lineage
 
 
+	def get_book_value(self):
+		"""
+		Returns the amount in the default currency: the amount itself, or for
+		other commodities what was paid for it (0 if there is no cost in the
+		default currency)
+		"""
+		if self.amount[1] == None or self.amount[1] == prices.DEFAULT_CURRENCY:
+			return self.amount[0]
+		if self.value != None and self.value[0] != None and self.value[1] == prices.DEFAULT_CURRENCY:
+			return self.value[0]
+		return 0
+
+
 
 #========================================================
 #	Journal
@@ -91,19 +113,52 @@ class Journal:
 		- main_accounts: list of all accounts that have amounts
 		- all_accounts: list of all accounts, including parent accounts
 		- payrec_accounts: list of all non-zero accounts under Assets:Receivables 
-			or Liabilities:Payables and the outstanding amount
+			or Liabilities:Payables and the outstanding amount (book value)
+		- commodities: list of all commodities, the default currency first.
+			Reports keep balances as lists with one amount per commodity (in
+			this order), indexed by entry.commodity_id; amounts without a
+			commodity are in the default currency.
+		- commodity_index: commodity -> position in commodities
+		- account_entries: account -> positions (in entries) of the entries
+			posted directly to it, in file order
+		- entries_by_date: positions of all entries sorted by date (file order
+			for entries on the same date), and entry_dates, the matching dates
+			for bisecting
+		- prices: list of (date, commodity, price, currency) from P directives
+		- price_store: PriceStore with the P directive prices and the prices
+			implied by @/@@ costs (more can be added, ie from a price file)
+		- search_index: SearchIndex of the words in descriptions and notes
+		- query_cache: cache for report queries against this journal
+		- get_monthly_totals(direct): account -> {month: total book value},
+			built on first use
+		- get_lots(method): LotTracker with the lots of every commodity held,
+			built on first use
 	"""
 
-	def __init__(self, entry_list):
+	def __init__(self, entry_list, price_list=None):
 		self.entries = entry_list
+		self.prices = price_list if price_list != None else list()
 		self.main_accounts = set()
 		self.all_accounts = set()
 		self.payables_and_receivables_accounts = dict()
+		self.account_entries = dict()
+		self.query_cache = dict()
+		self.commodities = [prices.DEFAULT_CURRENCY]
+		self.commodity_index = {prices.DEFAULT_CURRENCY: 0, None: 0}
 
 		pr_accounts = dict()
-		for entry in self.entries:
+		for (position, entry) in enumerate(self.entries):
+			commodity_id = self.commodity_index.get(entry.amount[1])
+			if commodity_id == None:
+				commodity_id = self.commodity_index[entry.amount[1]] = len(self.commodities)
+				self.commodities.append(entry.amount[1])
+			entry.commodity_id = commodity_id
+
 			if entry.account not in self.main_accounts:
 				self.main_accounts.add(entry.account)
+				self.account_entries[entry.account] = [position]
+			else:
+				self.account_entries[entry.account].append(position)
 
 			for account in entry.account_lineage:
 				if account not in self.all_accounts:
@@ -115,19 +170,75 @@ class Journal:
 				pr_account = pr_account.replace("Liabilities:Payables:", "")
 
 				if pr_account not in pr_accounts:
-					pr_accounts[pr_account] = entry.amount[0]
+					pr_accounts[pr_account] = entry.get_book_value()
 				else:
-					pr_accounts[pr_account] = pr_accounts[pr_account] + entry.amount[0]
+					pr_accounts[pr_account] = pr_accounts[pr_account] + entry.get_book_value()
 
 		for account in pr_accounts.keys():
 			if pr_accounts[account] != 0:
 				self.payables_and_receivables_accounts[account] = pr_accounts[account]
 
-		#self.__monthly_totals = None
+		self.entries_by_date = sorted(range(len(self.entries)),
+			key=lambda position: self.entries[position].header.date)
+		self.entry_dates = [self.entries[position].header.date for position in self.entries_by_date]
+
+		self.price_store = prices.PriceStore()
+		self.price_store.add_journal_prices(self)
+
+		self.search_index = search.SearchIndex(self.entries)
+
+		self.__monthly_totals = None
+		self.__lots = dict()
 		#self.__final_balances = None
 		#self.__monthly_balances = dict()
 
 
+	def get_monthly_totals(self, direct=False):
+		"""
+		Returns a dict of account -> {first day of month: total of the month}
+		for every account, including parent accounts, in book value (see
+		Entry.get_book_value). With direct, the totals only include the
+		entries posted to the account itself, not to its subaccounts (and
+		there are only months with such entries). Both are built with one
+		pass over the entries the first time either is needed, and shared by
+		the reports that summarize by month.
+		"""
+		if self.__monthly_totals == None:
+			monthly_totals = dict()
+			direct_totals = dict()
+
+			for entry in self.entries:
+				month = datetime.date(entry.header.date.year, entry.header.date.month, 1)
+				amount = entry.get_book_value()
+
+				for account in entry.account_lineage:
+					totals = monthly_totals.get(account)
+					if totals == None:
+						totals = monthly_totals[account] = dict()
+					totals[month] = totals.get(month, 0) + amount
+
+				totals = direct_totals.get(entry.account)
+				if totals == None:
+					totals = direct_totals[entry.account] = dict()
+				totals[month] = totals.get(month, 0) + amount
+
+			self.__monthly_totals = (monthly_totals, direct_totals)
+
+		return self.__monthly_totals[1 if direct else 0]
+
+
+	def get_lots(self, method="fifo"):
+		"""
+		Returns the LotTracker (see lots.py) fed every posting of the journal,
+		using method ("fifo" or "average"). It is built the first time it is
+		needed for each method.
+		"""
+		if method not in self.__lots:
+			self.__lots[method] = lots.track_lots(self, method)
+
+		return self.__lots[method]
+
+
 	def to_string(self):
 		s = ""
 		for entry in self.entries:
@@ -140,31 +251,38 @@ class Journal:
 #-------------------------------------------------------------------
 
 def ledgertree_to_journal(ledgertree_root):
-	entries = []
-
-	for entry_node in ledgertree_root.children:
-		header = Header(
-			date=entry_node.date,
-			status=entry_node.cleared,
-			code=entry_node.code,
-			description=entry_node.description,
-			note=None
-		)
-
-		for transaction_node in entry_node.children:
-			entry = Entry(
-				header=header,
-				account=transaction_node.account,
-				entry_type=transaction_node.entry_type,
-				amount=(transaction_node.amount, transaction_node.amountCommodity),
-				value=
-					(transaction_node.value, transaction_node.valueCommodity)
-					if transaction_node.value != None 
-						or transaction_node.valueCommodity != None 
-					else None,
-				note=transaction_node.note
+	with metrics.timer("journal_build"):
+		entries = []
+		price_list = []
+
+		for entry_node in ledgertree_root.children:
+			if entry_node.type == PRICE:
+				price_list.append((entry_node.date, entry_node.amountCommodity,
+					entry_node.value, entry_node.valueCommodity))
+				continue
+
+			header = Header(
+				date=entry_node.date,
+				status=entry_node.cleared,
+				code=entry_node.code,
+				description=entry_node.description,
+				note=None
 			)
 
-			entries.append(entry)
-
-	return Journal(entries)
+			for transaction_node in entry_node.children:
+				entry = Entry(
+					header=header,
+					account=transaction_node.account,
+					entry_type=transaction_node.entry_type,
+					amount=(transaction_node.amount, transaction_node.amountCommodity),
+					value=
+						(transaction_node.value, transaction_node.valueCommodity)
+						if transaction_node.value != None 
+							or transaction_node.valueCommodity != None 
+						else None,
+					note=transaction_node.note
+				)
+
+				entries.append(entry)
+
+		return Journal(entries, price_list)
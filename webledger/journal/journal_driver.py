@@ -2,7 +2,6 @@
 import webledger.parser.ledgertree as ledgertree
 import journal as j
 import os
-import time
 
 #-------------------------------------------------
 # support for writing output to a file
@@ -18,10 +17,8 @@ if __name__ == "__main__":
 	#source_filename = "input\\ledger.dat"
 	source_filename = os.getenv("LEDGER_FILE", "input\\ledger.dat")
 	
-	t1 = time.time()
 	tree = ledgertree.parse_into_ledgertree(source_filename)
 	journal = j.ledgertree_to_journal(tree)
-	t2 = time.time()
 
 	print "~"*80
 	print "Here is the journal:"
@@ -31,4 +28,4 @@ if __name__ == "__main__":
 	f.close()
 	print(open(output_filename).read())
 
-	print "Took %0.3f ms to parse" % ((t2-t1)*1000.0)
+	# for timings, see webledger/benchmark (stages.py and regression.py)
@@ -0,0 +1,167 @@
+"""
+Lots
+
+Tracks the lots (units bought together, at a cost) of every commodity held in
+every account, for cost basis and gains:
+	LotTracker - lot queues per (account, commodity), fed postings in date
+		order
+	track_lots - run a journal's postings through a LotTracker
+
+Methods:
+	fifo - sales take units from the oldest lots first
+	average - all units of a commodity in an account are one lot, at their
+		average cost
+
+A posting in the same direction as what is held (buying more, or selling
+more short) adds a lot; a posting in the other direction closes units from
+the lots, and its proceeds less the cost of those units is a realized gain.
+A posting that closes more than is held opens a lot in the other direction
+with the rest. Each posting touches only the lots it closes, and a closed lot
+is never visited again, so the whole ledger runs in O(postings).
+
+Costs are book values (see Entry.get_book_value): postings in commodities
+other than the default currency should have an @ or @@ cost, otherwise they
+count as costing nothing.
+"""
+
+import collections
+
+
+METHODS = ["fifo", "average"]
+
+
+#========================================================
+#	Lots
+#========================================================
+
+class Lot:
+	"""
+	Units of a commodity bought (or sold short, for negative units) together:
+		- date: of the first posting in the lot
+		- units: units still held
+		- cost: cost of the units still held (negative for a short lot)
+	"""
+
+	def __init__(self, date, units, cost):
+		self.date = date
+		self.units = units
+		self.cost = cost
+
+
+class LotTracker:
+	"""
+	Lot queues per (account, commodity), with realized gains per (account,
+	commodity). Feed it postings in date order with add().
+	"""
+
+	def __init__(self, method="fifo"):
+		if method not in METHODS:
+			raise Exception("Invalid lot method (fifo or average): " + method)
+
+		self.method = method
+		self.lots = dict()        # (account, commodity) -> deque of Lot, oldest first
+		self.realized = dict()    # (account, commodity) -> realized gain
+
+
+	def add(self, date, account, commodity, units, cost):
+		"""
+		Add a posting of units (negative for a sale) of commodity costing cost
+		(signed like units; for a sale, minus the proceeds)
+		"""
+		if units == 0:
+			return
+
+		key = (account, commodity)
+		lots = self.lots.get(key)
+		if lots == None:
+			lots = self.lots[key] = collections.deque()
+			self.realized[key] = 0
+
+		# close lots held in the other direction, oldest first
+		gain = 0
+		while len(lots) > 0 and units != 0 and (lots[0].units > 0) != (units > 0):
+			lot = lots[0]
+
+			if abs(units) >= abs(lot.units):
+				# the whole lot is closed
+				closed_cost = cost * -lot.units / units
+				gain -= closed_cost + lot.cost
+				units += lot.units
+				cost -= closed_cost
+				lots.popleft()
+			else:
+				lot_cost = lot.cost * -units / lot.units
+				gain -= cost + lot_cost
+				lot.units += units
+				lot.cost -= lot_cost
+				units = 0
+				cost = 0
+
+		self.realized[key] += gain
+
+		# what is left opens (or adds to) a lot in this direction
+		if units != 0:
+			if self.method == "average" and len(lots) > 0:
+				lots[0].units += units
+				lots[0].cost += cost
+			else:
+				lots.append(Lot(date, units, cost))
+
+
+	def holdings(self):
+		"""
+		Returns a sorted list of (account, commodity, units, cost) for every
+		commodity still held
+		"""
+		holdings = list()
+
+		for (key, lots) in self.lots.iteritems():
+			if len(lots) > 0:
+				holdings.append((key[0], key[1],
+					sum([lot.units for lot in lots]),
+					sum([lot.cost for lot in lots])))
+
+		holdings.sort()
+		return holdings
+
+
+	def unrealized(self, price_store, date):
+		"""
+		Returns a dict of (account, commodity) -> (market value, unrealized
+		gain) of the holdings at the prices on date, or None for commodities
+		without a price by then
+		"""
+		result = dict()
+
+		for (account, commodity, units, cost) in self.holdings():
+			value = price_store.value(units, commodity, date)
+			result[(account, commodity)] = (value[0], value[0] - cost) if value != None else None
+
+		return result
+
+
+
+#========================================================
+#	Journal
+#========================================================
+
+def track_lots(journal_data, method="fifo", end=None):
+	"""
+	Returns a LotTracker fed every posting of the journal in a commodity
+	other than the default currency, in date order (up to end, if given)
+	"""
+	tracker = LotTracker(method)
+	entries = journal_data.entries
+	commodities = journal_data.commodities
+
+	for position in journal_data.entries_by_date:
+		entry = entries[position]
+		if end != None and entry.header.date > end:
+			break
+		if entry.commodity_id == 0:
+			continue
+
+		tracker.add(entry.header.date, entry.account, commodities[entry.commodity_id],
+			entry.amount[0], entry.get_book_value())
+
+	return tracker
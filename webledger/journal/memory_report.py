@@ -0,0 +1,226 @@
+"""
+Memory Report
+
+Loads a ledger file one stage at a time and reports how much memory each
+stage keeps alive, the peak during each stage, and the bytes per posting.
+After the journal is built the intermediate structures (source text, generic
+AST, ledger tree) are released, and the report shows whether they were
+actually freed.
+
+Uses tracemalloc where it is available (Python 3.4+, or the pytracemalloc
+backport). Otherwise falls back to the process resident size, which is much
+coarser.
+
+Usage:
+	python -m webledger.journal.memory_report input/stan.dat
+"""
+
+import gc
+import sys
+import resource
+
+import webledger.parser.genericCharacter as genericCharacter
+import webledger.parser.genericToken as genericToken
+import webledger.parser.genericAstNode as genericAstNode
+import webledger.parser.genericScanner as genericScanner
+import webledger.parser.ledgerParser as parser
+import webledger.parser.ledgertree as ledgertree
+import webledger.journal.journal as j
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+
+# objects created while loading, in the order they are created
+TRACKED_CLASSES = [
+	("Character", genericCharacter.Character),
+	("Token", genericToken.Token),
+	("Node (generic AST)", genericAstNode.Node),
+	("LedgerNode", ledgertree.LedgerNode),
+	("Header", j.Header),
+	("Entry", j.Entry)
+]
+
+
+#========================================================
+#	Memory Report
+#========================================================
+
+class MemoryReport:
+	"""
+	Memory used after each loading stage:
+		- stages: list of (stage, retained bytes, peak bytes) where retained is
+			everything still allocated since loading started
+		- postings: number of postings in the journal
+		- live_objects: list of (class name, count) still alive after the
+			intermediate structures were released
+		- source_text_retained: true if the parser still holds on to the text
+		- method: "tracemalloc" or "rss"
+	"""
+
+	def __init__(self, method):
+		self.method = method
+		self.stages = list()
+		self.postings = 0
+		self.live_objects = list()
+		self.source_text_retained = False
+
+
+	def to_string(self):
+		s = "Memory by stage (%s):\n" % self.method
+		s += "    %-18s %14s %14s %14s\n" % ("stage", "retained", "peak", "per posting")
+
+		for (stage, retained, peak) in self.stages:
+			s += "    %-18s %14s %14s %14s\n" % (stage, format_bytes(retained), format_bytes(peak),
+				"%d B" % (retained / self.postings) if self.postings > 0 else "-")
+
+		s += "Objects still alive after loading:\n"
+		for (name, count) in self.live_objects:
+			s += "    %-18s %14d\n" % (name, count)
+		s += "Source text still referenced by the scanner: %s\n" % (
+			"yes" if self.source_text_retained else "no")
+
+		return s
+
+
+
+#========================================================
+#	Loading
+#========================================================
+
+def load_journal_with_memory_report(source_filename):
+	"""
+	Load the journal like parse_into_ledgertree and ledgertree_to_journal do,
+	measuring memory after each stage. Returns (journal, MemoryReport).
+	"""
+	if tracemalloc != None:
+		meter = TracemallocMeter()
+	else:
+		meter = RssMeter()
+
+	report = MemoryReport(meter.method)
+	meter.start()
+
+	sourcetext = open(source_filename).read()
+	report.stages.append(("read",) + meter.measure())
+
+	generic_ast = parser.parse(sourcetext, verbose=False)
+	report.stages.append(("parse",) + meter.measure())
+
+	tree = ledgertree.build_ledgertree(generic_ast)
+	report.stages.append(("build_tree",) + meter.measure())
+
+	ledgertree.balance_ledgertree(tree)
+	report.stages.append(("balance_tree",) + meter.measure())
+
+	journal = j.ledgertree_to_journal(tree)
+	report.stages.append(("journal_build",) + meter.measure())
+
+	# only the journal should be left once these are gone
+	del sourcetext, generic_ast, tree
+	gc.collect()
+	report.stages.append(("released",) + meter.measure())
+
+	meter.stop()
+
+	report.postings = len(journal.entries)
+	report.live_objects = count_live_objects()
+	report.source_text_retained = len(getattr(genericScanner, "sourceText", "")) > 0
+
+	return (journal, report)
+
+
+def count_live_objects():
+	"""
+	Returns (class name, count) for each of the classes created while loading
+	"""
+	counts = dict((name, 0) for (name, cls) in TRACKED_CLASSES)
+
+	for o in gc.get_objects():
+		for (name, cls) in TRACKED_CLASSES:
+			if isinstance(o, cls):
+				counts[name] += 1
+
+	return [(name, counts[name]) for (name, cls) in TRACKED_CLASSES]
+
+
+
+#========================================================
+#	Meters
+#========================================================
+
+class TracemallocMeter:
+	"""
+	Measures memory allocated by python since start() using tracemalloc
+	"""
+	method = "tracemalloc"
+
+	def start(self):
+		tracemalloc.start()
+
+	def measure(self):
+		"""
+		Returns (retained bytes, peak bytes) and starts a new peak if the
+		interpreter supports it (otherwise the peak is since start())
+		"""
+		(current, peak) = tracemalloc.get_traced_memory()
+		if hasattr(tracemalloc, "reset_peak"):
+			tracemalloc.reset_peak()
+		return (current, peak)
+
+	def stop(self):
+		tracemalloc.stop()
+
+
+class RssMeter:
+	"""
+	Measures growth of the process resident size since start(). The peak is
+	the process high-water mark, so it never goes down between stages.
+	"""
+	method = "rss"
+
+	def start(self):
+		self.baseline = resident_memory()
+
+	def measure(self):
+		return (resident_memory() - self.baseline, peak_memory() - self.baseline)
+
+	def stop(self):
+		pass
+
+
+def resident_memory():
+	"""
+	Returns the current resident memory of this process in bytes
+	"""
+	try:
+		f = open("/proc/self/statm")
+		try:
+			pages = int(f.read().split()[1])
+		finally:
+			f.close()
+		return pages * resource.getpagesize()
+	except IOError:
+		# no /proc; the high-water mark is the best there is
+		return peak_memory()
+
+
+def peak_memory():
+	"""
+	Returns the peak resident memory of this process in bytes
+	"""
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Linux reports kilobytes, OS X reports bytes
+	return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_bytes(size):
+	return "%0.1f MB" % (size / 1048576.0) if abs(size) >= 1048576 else "%0.1f KB" % (size / 1024.0)
+
+
+
+if __name__ == "__main__":
+	(journal, report) = load_journal_with_memory_report(sys.argv[1])
+	print report.to_string()
@@ -0,0 +1,207 @@
+"""
+Price Store
+
+Commodity prices by date, for valuing holdings at market:
+	PriceStore - per commodity price history with "price on or before date"
+		lookups
+	read_price_file - read a price history file of P directives
+
+Prices come from three places, in increasing order of precedence when there
+are several for the same commodity on the same day:
+	- prices implied by @ and @@ costs in the ledger file
+	- P directives in the ledger file
+	- a separate price history file (P directives only), ie
+		P 2013/01/15 AAPL $500.00
+"""
+
+import re
+import bisect
+import datetime
+import threading
+import collections
+from decimal import Decimal
+
+
+DEFAULT_CURRENCY = "$"
+CACHE_SIZE = 4096
+
+PRICE_LINE = re.compile(r'^P\s+(\d{4}/\d{1,2}/\d{1,2})(?:\s+\d{1,2}:\d{2}(?::\d{2})?)?'
+	r'\s+("[^"]+"|\S+)\s+([^;]+?)\s*(?:;.*)?$')
+AMOUNT = re.compile(r'^(?:(-?[\d,.]+)\s*("[^"]+"|[^\d\s.,-][^\s]*)?|("[^"]+"|[^\d\s.,-][^\s\d-]*)\s*(-?[\d,.]+))$')
+
+
+#========================================================
+#	Price Store
+#========================================================
+
+class PriceStore:
+	"""
+	Price history for each commodity, kept as two sorted arrays (dates, and
+	the matching (price, currency) tuples) so a lookup is a bisect. Recent
+	(commodity, date) lookups are kept in a small LRU cache, as reports tend
+	to ask for the same month end prices over and over.
+	"""
+
+	def __init__(self):
+		self.dates = dict()       # commodity -> sorted list of dates
+		self.prices = dict()      # commodity -> list of (price, currency), matching dates
+		self.pending = list()     # prices added since the arrays were last built
+		self.cache = collections.OrderedDict()
+		self.lock = threading.Lock()
+
+
+	def add(self, date, commodity, price, currency=None):
+		"""
+		Add a price. Prices added later take precedence over earlier ones for
+		the same commodity and date.
+		"""
+		with self.lock:
+			self.pending.append((date, commodity, price, currency or DEFAULT_CURRENCY))
+			self.cache.clear()
+
+
+	def add_journal_prices(self, journal_data):
+		"""
+		Add the prices implied by @/@@ costs, then the P directives of a journal
+		"""
+		for entry in journal_data.entries:
+			if entry.value != None and entry.value[0] != None and entry.amount[0] != 0 \
+					and entry.amount[1] != None and entry.amount[1] != entry.value[1]:
+				self.add(entry.header.date, entry.amount[1],
+					abs(entry.value[0] / entry.amount[0]), entry.value[1])
+
+		for (date, commodity, price, currency) in journal_data.prices:
+			self.add(date, commodity, price, currency)
+
+
+	def build(self):
+		"""
+		Merge prices added since the last build into the sorted arrays
+		"""
+		with self.lock:
+			if len(self.pending) == 0:
+				return
+
+			history = collections.defaultdict(list)
+			for commodity in self.dates:
+				history[commodity] = zip(self.dates[commodity], self.prices[commodity])
+			for (date, commodity, price, currency) in self.pending:
+				history[commodity].append((date, (price, currency)))
+
+			# sort is stable, so for the same date the last price added wins
+			for (commodity, points) in history.iteritems():
+				points.sort(key=lambda point: point[0])
+				self.dates[commodity] = [date for (date, price) in points]
+				self.prices[commodity] = [price for (date, price) in points]
+
+			self.pending = list()
+
+
+	def commodities(self):
+		self.build()
+		return sorted(self.dates.keys())
+
+
+	def price_on(self, commodity, date):
+		"""
+		Returns (price, currency) of commodity on or before date, or None if
+		there is no price that early
+		"""
+		key = (commodity, date)
+
+		with self.lock:
+			if key in self.cache:
+				price = self.cache.pop(key)
+				self.cache[key] = price
+				return price
+
+		if len(self.pending) > 0:
+			self.build()
+
+		dates = self.dates.get(commodity)
+		price = None
+		if dates != None:
+			index = bisect.bisect_right(dates, date) - 1
+			if index >= 0:
+				price = self.prices[commodity][index]
+
+		with self.lock:
+			self.cache[key] = price
+			while len(self.cache) > CACHE_SIZE:
+				self.cache.popitem(last=False)
+
+		return price
+
+
+	def prices_on(self, commodity, dates):
+		"""
+		Returns the (price, currency) (or None) of commodity on or before each
+		of dates, which must be in ascending order. Walks the history once
+		rather than bisecting for every date.
+		"""
+		if len(self.pending) > 0:
+			self.build()
+
+		history_dates = self.dates.get(commodity, list())
+		history_prices = self.prices.get(commodity, list())
+		result = list()
+		index = -1
+
+		for date in dates:
+			while index + 1 < len(history_dates) and history_dates[index + 1] <= date:
+				index += 1
+			result.append(history_prices[index] if index >= 0 else None)
+
+		return result
+
+
+	def value(self, amount, commodity, date):
+		"""
+		Returns (market value, currency) of amount units of commodity on date,
+		or None if it has no price by then. Amounts already in the default
+		currency are their own value.
+		"""
+		if commodity == None or commodity == DEFAULT_CURRENCY:
+			return (amount, DEFAULT_CURRENCY)
+
+		price = self.price_on(commodity, date)
+		if price == None:
+			return None
+
+		return (amount * price[0], price[1])
+
+
+
+#========================================================
+#	Price Files
+#========================================================
+
+def read_price_file(filename, price_store):
+	"""
+	Add the prices in a price history file (P directives; blank lines and
+	; comments are ignored) to price_store
+	"""
+	f = open(filename)
+	try:
+		for (number, line) in enumerate(f):
+			line = line.strip()
+			if len(line) == 0 or line[0] in ";#":
+				continue
+
+			match = PRICE_LINE.match(line)
+			amount = AMOUNT.match(match.group(3)) if match else None
+			if amount == None:
+				raise Exception("Invalid price on line %d of %s: %s" % (number + 1, filename, line))
+
+			date = datetime.datetime.strptime(match.group(1), "%Y/%m/%d").date()
+			commodity = match.group(2).strip('"')
+
+			if amount.group(1) != None:
+				(price, currency) = (amount.group(1), amount.group(2))
+			else:
+				(price, currency) = (amount.group(4), amount.group(3))
+
+			price_store.add(date, commodity, Decimal(price.replace(",", "")),
+				currency.strip('"') if currency else None)
+	finally:
+		f.close()
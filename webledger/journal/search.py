@@ -0,0 +1,120 @@
+"""
+Search Index
+
+Inverted indexes from words to the entries they appear in, for finding
+transactions by text:
+	payee - words of transaction descriptions (the payee)
+	text - words of descriptions, codes, and transaction and entry notes
+
+A transaction's description, code and note apply to all its entries; an
+entry's note only to that entry. Entries are identified by their position in
+journal.entries, and each word's positions are kept in file order in a
+compact array. The words of each index are also kept sorted, so the words
+starting with a prefix are one bisect away.
+
+Search terms are matched as whole words, case insensitive. A term ending in
+"*" matches words starting with it (ie "amaz*"). An entry matches a search
+if it matches every term.
+"""
+
+import re
+import array
+import bisect
+
+
+FIELDS = ["payee", "text"]
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+
+#========================================================
+#	Search Index
+#========================================================
+
+class SearchIndex:
+	"""
+	Word -> entry positions, per field (payee or text), built from a list of
+	entries
+	"""
+
+	def __init__(self, entries):
+		self.positions = dict([(field, dict()) for field in FIELDS])
+		payee = self.positions["payee"]
+		text = self.positions["text"]
+
+		last_header = None
+		for (position, entry) in enumerate(entries):
+			header = entry.header
+			if header is not last_header:
+				last_header = header
+				payee_words = words(header.description)
+				header_words = payee_words | words(header.code) | words(header.note)
+
+			entry_words = header_words | words(entry.note) if entry.note != None else header_words
+
+			for word in payee_words:
+				add_position(payee, word, position)
+			for word in entry_words:
+				add_position(text, word, position)
+
+		self.words = dict([(field, sorted(self.positions[field].keys())) for field in FIELDS])
+
+
+	def search(self, field, terms):
+		"""
+		Returns the set of positions of the entries matching every term in
+		field
+		"""
+		matches = None
+
+		for term in terms:
+			prefix = term.endswith("*")
+			term_words = WORD.findall(term.lower())
+
+			for (index, word) in enumerate(term_words):
+				positions = self.lookup(field, word, prefix and index == len(term_words) - 1)
+				matches = positions if matches == None else matches & positions
+				if len(matches) == 0:
+					return matches
+
+		return matches if matches != None else set()
+
+
+	def lookup(self, field, word, prefix=False):
+		"""
+		Returns the set of positions of the entries with word (or, for a
+		prefix, any word starting with it) in field
+		"""
+		index = self.positions[field]
+		if not prefix:
+			return set(index.get(word, ()))
+
+		field_words = self.words[field]
+		positions = set()
+		start = bisect.bisect_left(field_words, word)
+		while start < len(field_words) and field_words[start].startswith(word):
+			positions.update(index[field_words[start]])
+			start += 1
+
+		return positions
+
+
+
+#========================================================
+#	Helpers
+#========================================================
+
+def words(text):
+	"""
+	Returns the set of lowercase words in text
+	"""
+	if text == None:
+		return frozenset()
+	return frozenset(WORD.findall(text.lower()))
+
+
+def add_position(index, word, position):
+	positions = index.get(word)
+	if positions == None:
+		positions = index[word] = array.array("i")
+	positions.append(position)
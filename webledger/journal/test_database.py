@@ -0,0 +1,153 @@
+"""
+Tests for the SQLite export
+
+Run with: python -m unittest webledger.journal.test_database
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import webledger.parser.ledgertree as ledgertree
+import webledger.journal.journal as journal
+import webledger.journal.database as database
+
+
+INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "input")
+
+APPENDED = ("\n2013/10/01 * New Shop\n"
+	"    Expenses:NewThing    $12.00\n"
+	"    Assets:Brokerage    3 XYZ @ $1.00\n"
+	"    Assets:Checking\n"
+	"\n2013/10/02 Refund\n"
+	"    Assets:Checking    $5.00\n"
+	"    Expenses:NewThing\n")
+
+
+def load(filename):
+	return journal.ledgertree_to_journal(ledgertree.parse_into_ledgertree(filename))
+
+
+def dump(database_filename):
+	"""
+	Returns the rows of every table, with accounts by name rather than id (ids
+	depend on the order accounts were first exported in)
+	"""
+	connection = sqlite3.connect(database_filename)
+	try:
+		return {
+			"headers": connection.execute("SELECT * FROM headers ORDER BY id").fetchall(),
+			"postings": connection.execute(
+				"SELECT p.id, p.header_id, p.date, a.name, p.entry_type, p.amount, p.amount_micros, "
+				"p.commodity_id, p.value, p.value_commodity, p.book_value_micros, p.note "
+				"FROM postings p JOIN accounts a ON a.id = p.account_id ORDER BY p.id").fetchall(),
+			"accounts": sorted(connection.execute(
+				"SELECT a.name, parent.name, a.depth FROM accounts a "
+				"LEFT JOIN accounts parent ON parent.id = a.parent_id").fetchall()),
+			"account_lineage": sorted(connection.execute(
+				"SELECT a.name, ancestor.name FROM account_lineage l "
+				"JOIN accounts a ON a.id = l.account_id "
+				"JOIN accounts ancestor ON ancestor.id = l.ancestor_id").fetchall()),
+			"commodities": connection.execute("SELECT * FROM commodities ORDER BY id").fetchall(),
+			"meta": connection.execute("SELECT * FROM meta").fetchall()
+		}
+	finally:
+		connection.close()
+
+
+class ExportTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.ledger = os.path.join(self.directory, "ledger.dat")
+		database.snapshot_links.clear()
+
+	def tearDown(self):
+		database.snapshot_links.clear()
+		shutil.rmtree(self.directory)
+
+	def export(self, name):
+		return database.export_journal(load(self.ledger), self.ledger, os.path.join(self.directory, name))
+
+	def test_incremental_matches_full(self):
+		for fixture in ("stan.dat", "test.dat", "commodities.ledger"):
+			shutil.copy(os.path.join(INPUT, fixture), self.ledger)
+			for name in ("incremental.db", "full.db"):
+				if os.path.exists(os.path.join(self.directory, name)):
+					os.remove(os.path.join(self.directory, name))
+
+			self.assertEqual(self.export("incremental.db"), "full")
+			open(self.ledger, "a").write(APPENDED)
+			self.assertEqual(self.export("incremental.db"), "incremental")
+			self.assertEqual(self.export("full.db"), "full")
+
+			self.assertEqual(dump(os.path.join(self.directory, "incremental.db")),
+				dump(os.path.join(self.directory, "full.db")), fixture)
+
+	def test_edited_file_exported_in_full(self):
+		shutil.copy(os.path.join(INPUT, "test.dat"), self.ledger)
+		self.export("ledger.db")
+
+		text = open(self.ledger).read()
+		open(self.ledger, "w").write(APPENDED + text)
+		self.assertEqual(self.export("ledger.db"), "full")
+		self.export("full.db")
+
+		self.assertEqual(dump(os.path.join(self.directory, "ledger.db")),
+			dump(os.path.join(self.directory, "full.db")))
+
+	def test_export_replaces_file(self):
+		# a connection opened before an export keeps reading what it opened
+		shutil.copy(os.path.join(INPUT, "test.dat"), self.ledger)
+		self.export("ledger.db")
+		connection = sqlite3.connect(os.path.join(self.directory, "ledger.db"))
+		(headers,) = connection.execute("SELECT COUNT(*) FROM headers").fetchone()
+
+		open(self.ledger, "a").write(APPENDED)
+		self.export("ledger.db")
+
+		self.assertEqual(connection.execute("SELECT COUNT(*) FROM headers").fetchone(), (headers,))
+		connection.close()
+		self.assertEqual(len(dump(os.path.join(self.directory, "ledger.db"))["headers"]), headers + 2)
+		self.assertEqual([name for name in os.listdir(self.directory) if name.startswith("ledger.db")],
+			["ledger.db"])
+
+
+class SnapshotTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.database = os.path.join(self.directory, "ledger.db")
+		database.snapshot_links.clear()
+
+	def tearDown(self):
+		database.snapshot_links.clear()
+		shutil.rmtree(self.directory)
+
+	def write_export(self, text):
+		open(self.database, "w").write(text)
+
+	def test_snapshot_keeps_its_export(self):
+		self.write_export("first")
+		first = database.link_snapshot(self.database, "1")
+		# exports replace the database file rather than writing into it
+		os.remove(self.database)
+		self.write_export("second")
+		second = database.link_snapshot(self.database, "2")
+
+		self.assertEqual(open(first).read(), "first")
+		self.assertEqual(open(second).read(), "second")
+
+	def test_old_snapshots_removed(self):
+		open(self.database + ".snapshot-earlier-run", "w").write("")
+		self.write_export("export")
+		snapshots = [database.link_snapshot(self.database, str(version)) for version in range(5)]
+
+		self.assertEqual(sorted(os.listdir(self.directory)),
+			sorted(["ledger.db"] + [os.path.basename(filename)
+				for filename in snapshots[-database.SNAPSHOTS_KEPT:]]))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,138 @@
+"""
+Tests for lot tracking
+
+Run with: python -m unittest webledger.journal.test_lots
+"""
+import os
+import datetime
+import unittest
+from decimal import Decimal
+
+import webledger.parser.ledgertree as ledgertree
+import webledger.journal.journal as journal
+import webledger.journal.lots as lots
+
+
+COMMODITIES_LEDGER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	"..", "..", "input", "commodities.ledger")
+
+ACCOUNT = "Assets:Broker"
+
+
+def tracker_with(method, postings):
+	"""
+	Returns a LotTracker fed postings, a list of (units, cost) of COM in
+	ACCOUNT, one day apart
+	"""
+	tracker = lots.LotTracker(method)
+	for (day, (units, cost)) in enumerate(postings):
+		tracker.add(datetime.date(2013, 1, day + 1), ACCOUNT, "COM", Decimal(units), Decimal(cost))
+	return tracker
+
+
+def realized(tracker):
+	return tracker.realized[(ACCOUNT, "COM")]
+
+
+def open_lots(tracker):
+	return [(lot.date.day, lot.units, lot.cost) for lot in tracker.lots[(ACCOUNT, "COM")]]
+
+
+class FifoTest(unittest.TestCase):
+
+	def test_sell_from_oldest_lot(self):
+		tracker = tracker_with("fifo", [("10", "50"), ("10", "70"), ("-5", "-40")])
+		# 5 units at $5.00 sold for $40.00
+		self.assertEqual(realized(tracker), Decimal("15"))
+		self.assertEqual(open_lots(tracker), [(1, Decimal("5"), Decimal("25")), (2, Decimal("10"), Decimal("70"))])
+
+	def test_sell_across_lots(self):
+		tracker = tracker_with("fifo", [("10", "50"), ("10", "70"), ("-15", "-120")])
+		# 10 units at $5.00 and 5 at $7.00 (cost $85.00) sold for $120.00
+		self.assertEqual(realized(tracker), Decimal("35"))
+		self.assertEqual(open_lots(tracker), [(2, Decimal("5"), Decimal("35"))])
+
+	def test_sell_everything(self):
+		tracker = tracker_with("fifo", [("10", "50"), ("-10", "-45")])
+		self.assertEqual(realized(tracker), Decimal("-5"))
+		self.assertEqual(open_lots(tracker), [])
+		self.assertEqual(tracker.holdings(), [])
+
+	def test_sell_more_than_held(self):
+		# the rest opens a short lot, at the sale price
+		tracker = tracker_with("fifo", [("10", "50"), ("-15", "-90")])
+		self.assertEqual(realized(tracker), Decimal("10"))
+		self.assertEqual(open_lots(tracker), [(2, Decimal("-5"), Decimal("-30"))])
+
+	def test_cover_short_lot(self):
+		tracker = tracker_with("fifo", [("-10", "-60"), ("10", "40")])
+		self.assertEqual(realized(tracker), Decimal("20"))
+		self.assertEqual(open_lots(tracker), [])
+
+	def test_zero_units_ignored(self):
+		tracker = tracker_with("fifo", [("10", "50"), ("0", "0")])
+		self.assertEqual(open_lots(tracker), [(1, Decimal("10"), Decimal("50"))])
+
+	def test_holdings(self):
+		tracker = tracker_with("fifo", [("10", "50"), ("10", "70"), ("-5", "-40")])
+		tracker.add(datetime.date(2013, 1, 4), "Assets:Other", "XYZ", Decimal("2"), Decimal("30"))
+		self.assertEqual(tracker.holdings(), [
+			(ACCOUNT, "COM", Decimal("15"), Decimal("95")),
+			("Assets:Other", "XYZ", Decimal("2"), Decimal("30"))])
+
+
+class AverageCostTest(unittest.TestCase):
+
+	def test_one_lot_at_average_cost(self):
+		tracker = tracker_with("average", [("10", "50"), ("10", "70")])
+		self.assertEqual(open_lots(tracker), [(1, Decimal("20"), Decimal("120"))])
+
+	def test_sell_at_average_cost(self):
+		tracker = tracker_with("average", [("10", "50"), ("10", "70"), ("-5", "-40")])
+		# 5 units at the average $6.00 sold for $40.00
+		self.assertEqual(realized(tracker), Decimal("10"))
+		self.assertEqual(open_lots(tracker), [(1, Decimal("15"), Decimal("90"))])
+
+	def test_sell_more_than_held(self):
+		tracker = tracker_with("average", [("10", "50"), ("10", "70"), ("-25", "-200")])
+		self.assertEqual(realized(tracker), Decimal("40"))
+		self.assertEqual(open_lots(tracker), [(3, Decimal("-5"), Decimal("-40"))])
+
+
+class TrackerTest(unittest.TestCase):
+
+	def test_invalid_method(self):
+		self.assertRaisesRegexp(Exception, "Invalid lot method", lots.LotTracker, "lifo")
+
+
+class JournalLotsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.journal = journal.ledgertree_to_journal(ledgertree.parse_into_ledgertree(COMMODITIES_LEDGER))
+		self.journal.price_store.build()
+
+	def test_realized_gain(self):
+		# 15 of 30 COM bought for $150.00 sold at $5.28
+		for method in lots.METHODS:
+			tracker = self.journal.get_lots(method)
+			self.assertEqual(tracker.realized[("Assets:Investments:MutualFund", "COM")], Decimal("4.20"))
+
+	def test_holdings(self):
+		self.assertEqual(self.journal.get_lots("fifo").holdings(),
+			[("Assets:Investments:MutualFund", "COM", Decimal("15"), Decimal("75.00"))])
+
+	def test_unrealized_gain(self):
+		# valued at the price implied by the sale
+		tracker = self.journal.get_lots("fifo")
+		self.assertEqual(tracker.unrealized(self.journal.price_store, datetime.date(2011, 12, 31)),
+			{("Assets:Investments:MutualFund", "COM"): (Decimal("79.20"), Decimal("4.20"))})
+
+	def test_track_until_end(self):
+		tracker = lots.track_lots(self.journal, "fifo", end=datetime.date(2011, 11, 30))
+		self.assertEqual(tracker.realized[("Assets:Investments:MutualFund", "COM")], 0)
+		self.assertEqual(tracker.holdings(),
+			[("Assets:Investments:MutualFund", "COM", Decimal("30"), Decimal("150.00"))])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,133 @@
+"""
+Tests for the search index and the :search and :payee options
+
+Run with: python -m unittest webledger.journal.test_search
+"""
+import unittest
+
+import webledger.parser.ledgerParser as parser
+import webledger.parser.ledgertree as ledgertree
+import webledger.journal.journal as journal
+import webledger.report.balance as balance
+import webledger.report.query as query
+
+
+LEDGER = """2013/01/02 * (1001) Amazon.com Marketplace
+    Expenses:Gifts    $25.00
+    Assets:Checking
+
+2013/01/05 Whole-Foods MARKET
+    Expenses:Food    $40.00  ; party snacks
+    Expenses:Household    $10.00
+    Assets:Checking
+
+2013/01/09 Amazonia Cafe
+    Expenses:Food    $8.00
+    Assets:Checking
+"""
+
+# positions in journal.entries, in file order
+AMAZON = set([0, 1])
+WHOLE_FOODS = set([2, 3, 4])
+AMAZONIA = set([5, 6])
+
+
+def load(source_text):
+	tree = ledgertree.build_ledgertree(parser.parse(source_text))
+	ledgertree.balance_ledgertree(tree)
+	return journal.ledgertree_to_journal(tree)
+
+
+class SearchIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self.journal = load(LEDGER)
+		self.index = self.journal.search_index
+
+	def test_tokenization(self):
+		# words are split on punctuation
+		self.assertEqual(self.index.search("payee", ["amazon"]), AMAZON)
+		self.assertEqual(self.index.search("payee", ["com"]), AMAZON)
+		self.assertEqual(self.index.search("payee", ["foods"]), WHOLE_FOODS)
+		self.assertEqual(self.index.search("payee", ["whole-foods"]), WHOLE_FOODS)
+
+	def test_whole_words(self):
+		self.assertEqual(self.index.search("payee", ["amazo"]), set())
+		self.assertEqual(self.index.search("payee", ["food"]), set())
+
+	def test_case_folding(self):
+		self.assertEqual(self.index.search("payee", ["market"]), WHOLE_FOODS)
+		self.assertEqual(self.index.search("payee", ["AMAZON"]), AMAZON)
+		self.assertEqual(self.index.search("payee", ["Whole"]), WHOLE_FOODS)
+
+	def test_all_terms(self):
+		self.assertEqual(self.index.search("payee", ["whole", "market"]), WHOLE_FOODS)
+		self.assertEqual(self.index.search("payee", ["amazon", "cafe"]), set())
+		self.assertEqual(self.index.search("payee", ["amazon", "nothing"]), set())
+
+	def test_prefix(self):
+		self.assertEqual(self.index.search("payee", ["amaz*"]), AMAZON | AMAZONIA)
+		self.assertEqual(self.index.search("payee", ["AMAZ*", "cafe"]), AMAZONIA)
+		self.assertEqual(self.index.search("payee", ["zzz*"]), set())
+		# only the last word of a term is a prefix
+		self.assertEqual(self.index.search("payee", ["amazon.c*"]), AMAZON)
+		self.assertEqual(self.index.search("payee", ["amaz.com*"]), set())
+
+	def test_no_terms(self):
+		self.assertEqual(self.index.search("payee", []), set())
+
+	def test_codes_in_text_only(self):
+		self.assertEqual(self.index.search("text", ["1001"]), AMAZON)
+		self.assertEqual(self.index.search("payee", ["1001"]), set())
+
+	def test_entry_note_applies_to_its_entry(self):
+		self.assertEqual(self.index.search("text", ["snacks"]), set([2]))
+		self.assertEqual(self.index.search("text", ["party", "whole"]), set([2]))
+		self.assertEqual(self.index.search("payee", ["snacks"]), set())
+
+	def test_description_in_text(self):
+		self.assertEqual(self.index.search("text", ["cafe"]), AMAZONIA)
+
+
+class SelectMatchesTest(unittest.TestCase):
+
+	def setUp(self):
+		self.journal = load(LEDGER)
+
+	def test_no_terms(self):
+		self.assertEqual(query.select_matches(self.journal, None, None), None)
+
+	def test_search_and_payee(self):
+		self.assertEqual(query.select_matches(self.journal, ["snacks"], None), set([2]))
+		self.assertEqual(query.select_matches(self.journal, None, ["amaz*"]), AMAZON | AMAZONIA)
+		self.assertEqual(query.select_matches(self.journal, ["food*"], ["whole"]), WHOLE_FOODS)
+		self.assertEqual(query.select_matches(self.journal, ["snacks"], ["amazon"]), set())
+
+	def test_cached(self):
+		matches = query.select_matches(self.journal, ["amazon"], None)
+		self.assertTrue(query.select_matches(self.journal, ["amazon"], None) is matches)
+
+
+class SearchReportTest(unittest.TestCase):
+
+	def setUp(self):
+		self.journal = load(LEDGER)
+
+	def lines(self, command):
+		parameters = balance.BalanceReportParameters.from_command(command.split())
+		return balance.generate_balance_report(self.journal, parameters)["lines"]
+
+	def test_options(self):
+		parameters = balance.BalanceReportParameters.from_command(":search Party snacks :payee whole*".split())
+		self.assertEqual(parameters.search, ["Party", "snacks"])
+		self.assertEqual(parameters.payee, ["whole*"])
+
+	def test_balance_of_matches(self):
+		# only the matching entries, not the rest of their transactions
+		self.assertEqual(self.lines("expenses :search snacks"), self.lines("expenses:food :since 2013/01/05 :upto 2013/01/06"))
+		self.assertEqual(self.lines(":payee amazon"), self.lines(":upto 2013/01/03"))
+		self.assertEqual(self.lines(":payee amaz* :search cafe"), self.lines(":since 2013/01/09"))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,268 @@
+"""
+Journal Watcher
+
+Keeps the journal in sync with the ledger file (and any other file it is read
+from, ie the price history file) without doing any work on the request path:
+	JournalSnapshot - a loaded journal and the state of the file it came from
+	JournalWatcher - background thread that reloads the journal on change and
+		publishes the new snapshot with a single reference swap
+"""
+
+import os
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import threading
+
+
+#========================================================
+#	Journal Snapshot
+#========================================================
+
+class JournalSnapshot:
+	"""
+	A journal loaded from the ledger file. Snapshots are never modified after
+	they are published, so a request can hold on to one for its whole duration
+	while a newer one is being loaded.
+		- journal: the Journal
+		- last_modified: modified time of the ledger file when it was read
+		- size: size of the ledger file in bytes when it was read
+		- version: string identifying this version of the ledger file
+		- navigation: data derived from the journal that every page needs,
+			built once when the journal is loaded
+		- report_backend: reports from a database exported from this journal
+			(ie a SqliteBackend), or None for reports from the journal itself
+		- other_files: (filename, modified time, size) of the other files the
+			journal was read from (ie the price history file; see file_state),
+			which are watched like the ledger file and are part of the version
+	"""
+
+	def __init__(self, journal, last_modified, size, navigation=None, report_backend=None, other_files=None):
+		self.journal = journal
+		self.last_modified = last_modified
+		self.size = size
+		self.other_files = other_files if other_files != None else list()
+		self.version = snapshot_version(last_modified, size, self.other_files)
+		self.navigation = navigation
+		self.report_backend = report_backend
+
+
+def snapshot_version(last_modified, size, other_files=()):
+	version = "%x-%x" % (int(last_modified * 1000000), size)
+	for (filename, file_modified, file_size) in other_files:
+		if file_modified != None:
+			version += "-%x-%x" % (int(file_modified * 1000000), file_size)
+		else:
+			version += "-0"
+	return version
+
+
+def file_state(filename):
+	"""
+	Returns (filename, modified time, size) of a file, with None for the
+	modified time and size if it does not exist
+	"""
+	try:
+		stat = os.stat(filename)
+	except OSError:
+		return (filename, None, None)
+	return (filename, stat.st_mtime, stat.st_size)
+
+
+
+#========================================================
+#	Journal Watcher
+#========================================================
+
+class JournalWatcher(threading.Thread):
+	"""
+	Background thread that watches the ledger file (and the snapshot's other
+	files) and reloads it when it changes. Uses inotify where the platform has
+	it and falls back to polling the files' modified time and size otherwise.
+
+	load_snapshot(source_filename) is called to read the file and must return
+	a JournalSnapshot. Requests read the "snapshot" attribute and keep being
+	served the previous snapshot until the new one has been fully loaded. If
+	a reload fails (ie the file is mid-edit and does not parse), the previous
+	snapshot stays in place.
+	"""
+
+	def __init__(self, source_filename, load_snapshot, poll_interval=1.0, settle_delay=0.1):
+		threading.Thread.__init__(self, name="JournalWatcher")
+		self.daemon = True
+		self.source_filename = source_filename
+		self.load_snapshot = load_snapshot
+		self.poll_interval = poll_interval
+		self.settle_delay = settle_delay
+		self.snapshot = load_snapshot(source_filename)
+		self.inotify = Inotify.create([source_filename] +
+			[filename for (filename, file_modified, file_size) in self.snapshot.other_files])
+
+
+	def run(self):
+		while True:
+			if self.wait_for_change():
+				self.reload()
+
+
+	def wait_for_change(self, timeout=None):
+		"""
+		Block until the ledger files differ from the current snapshot or until
+		timeout seconds have passed (forever if timeout is None). Returns true
+		if the file has changed.
+		"""
+		deadline = None if timeout == None else time.time() + timeout
+
+		while True:
+			remaining = None if deadline == None else max(deadline - time.time(), 0)
+
+			if self.inotify != None:
+				if self.inotify.wait(remaining):
+					# editors often write a file in several steps, so wait
+					# for things to settle before checking it
+					while self.inotify.wait(self.settle_delay):
+						pass
+					if self.file_changed():
+						return True
+			else:
+				time.sleep(self.poll_interval if remaining == None else min(self.poll_interval, remaining))
+				if self.file_changed():
+					return True
+
+			if deadline != None and time.time() >= deadline:
+				return False
+
+
+	def file_changed(self):
+		"""
+		Returns true if the modified time or size of the ledger file, or of
+		one of the snapshot's other files, differ from the current snapshot.
+		"""
+		try:
+			stat = os.stat(self.source_filename)
+		except OSError:
+			# file is missing for a moment while an editor replaces it
+			return False
+
+		snapshot = self.snapshot
+		if stat.st_mtime != snapshot.last_modified or stat.st_size != snapshot.size:
+			return True
+
+		for state in snapshot.other_files:
+			current = file_state(state[0])
+			# as above, a missing file is taken to be in the middle of a save
+			if current[1] != None and current != state:
+				return True
+
+		return False
+
+
+	def reload(self):
+		"""
+		Load a new snapshot and publish it. Returns true if the new snapshot
+		was published.
+		"""
+		print "Detected change in ledger file, reloading"
+
+		try:
+			snapshot = self.load_snapshot(self.source_filename)
+		except Exception as e:
+			print "Could not reload ledger file, still serving previous version: %s" % e
+			return False
+
+		self.snapshot = snapshot
+		return True
+
+
+
+#========================================================
+#	Inotify
+#========================================================
+
+class Inotify:
+	"""
+	Minimal ctypes wrapper around Linux inotify that reports changes to a few
+	files. The files' directories are watched rather than the files themselves
+	so that editors that save by writing a new file and renaming it are picked
+	up.
+	"""
+	IN_MODIFY = 0x00000002
+	IN_CLOSE_WRITE = 0x00000008
+	IN_MOVED_TO = 0x00000080
+	IN_CREATE = 0x00000100
+	EVENT_HEADER = struct.Struct("iIII")
+
+	@classmethod
+	def create(cls, filenames):
+		"""
+		Returns an Inotify watching filenames, or None if inotify is not
+		available on this platform.
+		"""
+		libc_name = ctypes.util.find_library("c")
+		if libc_name == None:
+			return None
+
+		try:
+			libc = ctypes.CDLL(libc_name, use_errno=True)
+			inotify_init = libc.inotify_init
+			inotify_add_watch = libc.inotify_add_watch
+		except (OSError, AttributeError):
+			return None
+
+		fd = inotify_init()
+		if fd < 0:
+			return None
+
+		directories = set([os.path.dirname(os.path.abspath(filename)) for filename in filenames])
+		mask = cls.IN_MODIFY | cls.IN_CLOSE_WRITE | cls.IN_MOVED_TO | cls.IN_CREATE
+		for directory in directories:
+			if inotify_add_watch(fd, directory, mask) < 0:
+				os.close(fd)
+				return None
+
+		return cls(fd, set([os.path.basename(filename) for filename in filenames]))
+
+
+	def __init__(self, fd, filenames):
+		self.fd = fd
+		self.filenames = filenames
+
+
+	def wait(self, timeout=None):
+		"""
+		Wait up to timeout seconds for an event. Returns true if an event was
+		seen for one of the watched files (by name, in any of the watched
+		directories).
+		"""
+		try:
+			(readable, _, _) = select.select([self.fd], [], [], timeout)
+		except select.error as e:
+			# interrupted by a signal; let the caller decide what to do
+			if e.args[0] == errno.EINTR:
+				return False
+			raise
+
+		if len(readable) == 0:
+			return False
+
+		return any([name in self.filenames for name in self.read_event_names()])
+
+
+	def read_event_names(self):
+		"""
+		Read the pending events and return the names of the files they are for
+		"""
+		names = list()
+		data = os.read(self.fd, 4096)
+		offset = 0
+
+		while offset + self.EVENT_HEADER.size <= len(data):
+			(wd, mask, cookie, length) = self.EVENT_HEADER.unpack_from(data, offset)
+			offset += self.EVENT_HEADER.size
+			names.append(data[offset:offset + length].rstrip("\0"))
+			offset += length
+
+		return names
@@ -13,4 +13,5 @@ ACCOUNT 		= "Account"
 AMOUNT 			= "Amount"
 VALUE 			= "Value"
 COMMODITY		= "Commodity"
+PRICE			= "Price"
 
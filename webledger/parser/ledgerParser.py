@@ -2,7 +2,9 @@
 """
 A recursive descent parser for ledger files
 """
+import time
 import ledgerLexer as lexer
+import webledger.utilities.metrics as metrics
 from   ledgerSymbols import *
 from   genericToken import *
 from   genericAstNode import Node
@@ -15,6 +17,8 @@ def dq(s): return '"%s"' %s
 token   = None
 verbose = False
 indent  = 0
+timeLexer = False  # time every token, to split lexing out of the parse time
+lexTime = 0.0  # time spent in the lexer during the current parse (if timeLexer)
 numberOperator = ["+","-","/","*"]
 
 
@@ -22,13 +26,18 @@ numberOperator = ["+","-","/","*"]
 #		 getToken
 #-------------------------------------------------------------------
 def getToken():
-	global token 
+	global token, lexTime
 	if verbose: 
 		if token: 
 			# print the current token, before we get the next one
 			#print (" "*40 ) + token.show() 
 			print(("  "*indent) + "   (" + token.show(align=False) + ")")
-	token  = lexer.get()
+	if timeLexer:
+		t1 = time.time()
+		token  = lexer.get()
+		lexTime += time.time() - t1
+	else:
+		token  = lexer.get()
 
 #-------------------------------------------------------------------
 #    push and pop
@@ -129,17 +138,38 @@ def eatWhile(argTokenType):
 #    parse
 #-------------------------------------------------------------------
 def parse(sourceText, **kwargs):
-	global lexer, verbose
+	global lexer, verbose, timeLexer, lexTime, ast, token
 	verbose = kwargs.get("verbose",False)
+	timeLexer = kwargs.get("time_lexer",False)
+	lexTime = 0.0
+	t1 = time.time()
 	# create a Lexer object & pass it the sourceText
 	lexer.initialize(sourceText)
 	getToken()
 	ledger()
+	t2 = time.time()
+
+	# the lexer is driven by the parser, so the parse time includes lexing
+	# unless time_lexer is set (timing every token costs a little per token;
+	# benchmark/stages.py times a separate lexing pass instead)
+	if timeLexer:
+		metrics.observe("lex", lexTime)
+		metrics.observe("parse", (t2 - t1) - lexTime)
+	else:
+		metrics.observe("parse", t2 - t1)
+
 	if verbose:
 		print "~"*80
 		print "Successful parse!"
 		print "~"*80
-	return ast
+
+	# don't keep the AST, tokens and source text alive after the parse
+	result = ast
+	ast = None
+	token = None
+	lexer.initialize("")
+
+	return result
 
 #--------------------------------------------------------
 #                   ledger
@@ -166,7 +196,7 @@ ledger = statement {statement} EOF.
 @track
 def statement(node):
 	"""
-statement = NOTE | LINEBREAK | WHITESPACE | entry .
+statement = NOTE | LINEBREAK | WHITESPACE | price | entry .
 	"""
 	if found(NOTE):
 		note(node)
@@ -174,6 +204,8 @@ statement = NOTE | LINEBREAK | WHITESPACE | entry .
 		eatWhile(LINEBREAK)
 	elif found(WHITESPACE):
 		eatWhile(WHITESPACE)
+	elif found(IDENTIFIER) and token.cargo == "P":
+		priceStatement(node)
 	else:  
 		entryStatement(node)
 
@@ -209,7 +241,8 @@ entryStatement = date WS [*|!] WS [(code)] desc LB transaction {transaction} LB
 
 	transaction(entryNode)
 
-	while not found(LINEBREAK) and not found(EOF):
+	# transactions are indented; anything else starts the next statement
+	while found(WHITESPACE) or found(NOTE):
 		if found(NOTE):
 			consume(NOTE)
 			consume(LINEBREAK)
@@ -217,6 +250,59 @@ entryStatement = date WS [*|!] WS [(code)] desc LB transaction {transaction} LB
 			transaction(entryNode)
 
 
+#--------------------------------------------------------
+#                   priceStatement
+#--------------------------------------------------------
+@track
+def priceStatement(node):
+	"""
+priceStatement = P WS date [WS time] WS commodity WS amount [NOTE] (LB | EOF)
+	"""
+	priceNode = Node(None, PRICE)
+	node.addNode(priceNode)
+
+	consume(IDENTIFIER)
+	eatWhile(WHITESPACE)
+
+	date(priceNode)
+	eatWhile(WHITESPACE)
+
+	# a commodity never starts with a number, so a number here is the time
+	if found(NUMBER):
+		time_of_day()
+		eatWhile(WHITESPACE)
+
+	commodity(priceNode)
+	eatWhile(WHITESPACE)
+
+	amount(priceNode)
+	eatWhile(WHITESPACE)
+
+	if found(NOTE):
+		consume(NOTE)
+
+	if not found(EOF):
+		consume(LINEBREAK)
+
+
+#--------------------------------------------------------
+#                        time_of_day
+#--------------------------------------------------------
+@track0
+def time_of_day():
+	"""
+time_of_day = NUMBER : NUMBER [: NUMBER] .
+	Prices are kept per day, so the time is read but not kept.
+	"""
+	consume(NUMBER)
+	consume(":")
+	consume(NUMBER)
+
+	if found(":"):
+		consume(":")
+		consume(NUMBER)
+
+
 #--------------------------------------------------------
 #                          date
 #--------------------------------------------------------
@@ -2,10 +2,12 @@
 Ledger Tree
 - convert a ledger parser AST into a ledger tree
 - output ledger tree to text
-- export ledger data to sqlite db
+- journal export to sqlite: see webledger/journal/database.py
 """
 import datetime
 import ledgerParser as parser
+import webledger.utilities.metrics as metrics
+from webledger.journal.prices import DEFAULT_CURRENCY
 from decimal import *
 from ledgerNodeTypes import *
 from ledgerSymbols import *
@@ -46,6 +48,10 @@ class LedgerNode:
 			if self.code != None: 
 				s += ("    " * (self.level+1)) + "Code:        " + self.code + "\n"
 			s += ("    " * (self.level+1)) + "Description: " + self.description + "\n"
+		elif self.type == PRICE:
+			s += ("    " * (self.level+1)) + "Date:        " + datetime.date.strftime(self.date, "%Y/%m/%d") + "\n"
+			s += ("    " * (self.level+1)) + "Commodity:   " + self.amountCommodity + "\n"
+			s += ("    " * (self.level+1)) + "Price:       " + ("%.4f" % self.value) + " " + (self.valueCommodity or "") + "\n"
 		elif self.type == TRANSACTION:
 			s += ("    " * (self.level+1)) + "Account: " + self.account + "\n"
 			s += ("    " * (self.level+1)) + "Entry Type: " + self.entry_type + "\n"
@@ -68,8 +74,12 @@ def parse_into_ledgertree(filename):
 	"""
 	sourcetext = open(filename).read()
 	generic_ast = parser.parse(sourcetext, verbose=False)
-	ledgertree = build_ledgertree(generic_ast)
-	balance_ledgertree(ledgertree)
+
+	with metrics.timer("build_tree"):
+		ledgertree = build_ledgertree(generic_ast)
+
+	with metrics.timer("balance_tree"):
+		balance_ledgertree(ledgertree)
 
 	# removing this as it is buggy (see Trello task)
 	#mergeInvestmentEntries(ledgertree)
@@ -88,6 +98,8 @@ def build_ledgertree(node):
 		for child in node.children:
 			if child.type == ENTRY:
 				generateEntryNode(root, child)
+			elif child.type == PRICE:
+				generatePriceNode(root, child)
 			elif child.type != NOTE:
 				error("I was expecting to find an ENTRY token but I found: "+ child.type)
 			
@@ -119,6 +131,28 @@ def generateEntryNode(ledgerNode, astNode):
 			error("Unexpected node type under ENTRY: "+ child.type)
 
 
+def generatePriceNode(ledgerNode, astNode):
+	"""
+	Process current astNode and create a PRICE LedgerNode from it. The price
+	is stored like a transaction of 1 unit of the commodity at the price:
+	amount is 1, amountCommodity is the commodity priced, and value and
+	valueCommodity are the price.
+	"""
+	priceNode = LedgerNode(PRICE, ledgerNode)
+	priceNode.amount = Decimal(1)
+
+	for child in astNode.children:
+		if child.type == DATE:
+			priceNode.date = getDate(child)
+		elif child.type == COMMODITY:
+			priceNode.amountCommodity = getString(child).strip('"')
+		elif child.type == AMOUNT:
+			priceNode.value = getAmount(child)
+			priceNode.valueCommodity = getAmountCommodity(child)
+		else:
+			error("Unexpected node type under PRICE: "+ child.type)
+
+
 def getDate(astNode):
 	"""
 	Get the date from a date node
@@ -171,7 +205,10 @@ def generateTransactionNode(entryNode, astNode):
 				transactionNode.value = transactionNode.amount * getAmount(child.children[1])
 				transactionNode.valueCommodity = getAmountCommodity(child.children[1])
 			else:
-				transactionNode.value = getAmount(child.children[1])
+				# @@ costs are written unsigned; the cost has the sign of the amount
+				transactionNode.value = abs(getAmount(child.children[1]))
+				if transactionNode.amount < 0:
+					transactionNode.value = -transactionNode.value
 				transactionNode.valueCommodity = getAmountCommodity(child.children[1])
 		elif child.type == NOTE:
 			transactionNode.note = child.token.cargo
@@ -218,58 +255,115 @@ def balance_ledgertree(root):
 	Verify that transactions balance and auto-balance entries that do not
 	have one amount to the balance of the rest of the transaction.
 
+	Transactions balance per commodity. A line item with a cost (@ or @@)
+	counts towards the balance as its cost, so "10 COM @ $5.00" balances
+	against $-50.00.
+
 	For virtual unbalanced transactions:
 		- If an amount was not provided, raise an Exception.
 
 	For balanced and virtual balanced transactions:
 		- Transactions of the same type (balanced/virtual balanced) must balance
-		to 0. If they don't, and one entry in the transaction does not have an
-		amount, set its amount value so that the transaction would balance.
-		Otherwise, raise an exception.
+		to 0 in every commodity. If they don't, and one entry in the transaction
+		does not have an amount, set its amount so that the transaction would
+		balance (if more than one commodity is left over, the entry is split
+		into one line item per commodity).
+		- If every line item has an amount but there are exactly two
+		commodities and no costs, it is an exchange: the line items in the
+		commodity that is not the default currency get the cost implied by
+		the amounts.
+		- Otherwise, raise an exception.
 	"""
 	for entry_node in root.children:
-		amount = Decimal(0)
-		commodity = ""
-		no_amount_entries = []
-		virtual_amount = Decimal(0)
-		virtual_commodity = ""
-		virtual_no_amount_entries = []
-		index = -1
+		if entry_node.type != ENTRY:
+			continue
+
+		balances = {"balanced": dict(), "virtual balanced": dict()}
+		no_amount_entries = {"balanced": [], "virtual balanced": []}
+		commodities = {"balanced": [], "virtual balanced": []}
+		has_cost = {"balanced": False, "virtual balanced": False}
 
 		for transaction_node in entry_node.children:
-			index += 1
-			
 			if transaction_node.entry_type == "virtual unbalanced":
 				if transaction_node.amount == None:
 					raise Exception("This entry contains a virtual unbalanced entry that has no amount:\r\n" + entry_node.to_string())
-			elif transaction_node.entry_type == "virtual balanced":
-				if transaction_node.amount != None:
-					virtual_amount += transaction_node.amount
-					if commodity == "": virtual_commodity = transaction_node.amountCommodity
-				else:
-					virtual_no_amount_entries.append(index)
+				continue
+
+			if transaction_node.amount == None:
+				no_amount_entries[transaction_node.entry_type].append(transaction_node)
+				continue
+
+			if transaction_node.value != None:
+				(amount, commodity) = (transaction_node.value, transaction_node.valueCommodity)
+				has_cost[transaction_node.entry_type] = True
 			else:
-				if transaction_node.amount != None:
-					amount += transaction_node.amount
-					if commodity == "": commodity = transaction_node.amountCommodity
-				else:
-					no_amount_entries.append(index)
-		
-		if len(virtual_no_amount_entries) > 1:
-			raise Exception("This entry has multiple virtual balanced line items that do not have an amount:\r\n" + entry_node.to_string())
-		elif len(virtual_no_amount_entries) == 1:
-			entry_node.children[virtual_no_amount_entries[0]].amount = -1 * virtual_amount
-			entry_node.children[virtual_no_amount_entries[0]].amountCommodity = virtual_commodity
-		elif virtual_amount != 0:
-			raise Exception(("This entry has virtual balanced line items that do not balance (balance is: %.2f):\r\n" % virtual_amount) + entry_node.to_string())
-
-		if len(no_amount_entries) > 1:
-			raise Exception("This entry has multiple line items that do not have an amount:\r\n" + entry_node.to_string())
-		elif len(no_amount_entries) == 1:
-			entry_node.children[no_amount_entries[0]].amount = -1 * amount
-			entry_node.children[no_amount_entries[0]].amountCommodity = commodity
-		elif amount != 0:
-			raise Exception(("This entry has line items that do not balance (balance is: %.2f):\r\n" % amount) + entry_node.to_string())
+				(amount, commodity) = (transaction_node.amount, transaction_node.amountCommodity)
+
+			balance = balances[transaction_node.entry_type]
+			if commodity not in balance:
+				balance[commodity] = amount
+				commodities[transaction_node.entry_type].append(commodity)
+			else:
+				balance[commodity] += amount
+
+		for entry_type in ("virtual balanced", "balanced"):
+			description = "virtual balanced line items" if entry_type == "virtual balanced" else "line items"
+			balance = balances[entry_type]
+			unbalanced = [commodity for commodity in commodities[entry_type] if balance[commodity] != 0]
+
+			if len(no_amount_entries[entry_type]) > 1:
+				raise Exception("This entry has multiple " + description + " that do not have an amount:\r\n" + entry_node.to_string())
+			elif len(no_amount_entries[entry_type]) == 1:
+				if len(unbalanced) == 0:
+					unbalanced = commodities[entry_type][:1] or [None]
+				balance_transaction_node(entry_node, no_amount_entries[entry_type][0],
+					[(-1 * balance.get(commodity, Decimal(0)), commodity) for commodity in unbalanced])
+			elif len(unbalanced) == 2 and len(commodities[entry_type]) == 2 and not has_cost[entry_type]:
+				set_exchange_cost(entry_node, entry_type, balance, unbalanced)
+			elif len(unbalanced) > 0:
+				raise Exception(("This entry has " + description + " that do not balance (balance is: %s):\r\n"
+					% format_balance(balance, unbalanced)) + entry_node.to_string())
+
+
+def balance_transaction_node(entry_node, transaction_node, amounts):
+	"""
+	Set the amount of a transaction node without one to the first of
+	amounts, a list of (amount, commodity), adding a copy of the node right
+	after it for each of the others
+	"""
+	(transaction_node.amount, transaction_node.amountCommodity) = amounts[0]
+	index = entry_node.children.index(transaction_node)
+
+	for (offset, (amount, commodity)) in enumerate(amounts[1:]):
+		node = LedgerNode(TRANSACTION)
+		node.level = transaction_node.level
+		node.parent = entry_node
+		node.account = transaction_node.account
+		node.entry_type = transaction_node.entry_type
+		node.note = transaction_node.note
+		(node.amount, node.amountCommodity) = (amount, commodity)
+		entry_node.children.insert(index + offset + 1, node)
+
+
+def set_exchange_cost(entry_node, entry_type, balance, commodities):
+	"""
+	Give the line items of an exchange between two commodities the cost
+	implied by the amounts: the commodity that is not the default currency
+	(or the first one) is priced in the other
+	"""
+	(priced, other) = commodities
+	if priced == DEFAULT_CURRENCY:
+		(priced, other) = (other, priced)
+
+	for transaction_node in entry_node.children:
+		if transaction_node.entry_type == entry_type and transaction_node.amountCommodity == priced:
+			transaction_node.value = -1 * balance[other] * transaction_node.amount / balance[priced]
+			transaction_node.valueCommodity = other
+
+
+def format_balance(balance, commodities):
+	return ", ".join([("%.2f" % balance[commodity]) + (" " + commodity if commodity else "")
+		for commodity in commodities])
 
 
 
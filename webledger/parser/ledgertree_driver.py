@@ -1,7 +1,6 @@
 #fragment start *
 import ledgertree
 import os
-import time
 
 #-------------------------------------------------
 # support for writing output to a file
@@ -17,9 +16,7 @@ if __name__ == "__main__":
 	#source_filename = "input\\ledger.dat"
 	source_filename = os.getenv("LEDGER_FILE", "input\\ledger.dat")
 	
-	t1 = time.time()
 	tree = ledgertree.parse_into_ledgertree(source_filename)
-	t2 = time.time()
 
 	print "~"*80
 	print "Here is the ledger tree:"
@@ -29,4 +26,4 @@ if __name__ == "__main__":
 	f.close()
 	print(open(output_filename).read())
 
-	print "Took %0.3f ms to parse" % ((t2-t1)*1000.0)
+	# for timings, see webledger/benchmark (stages.py and regression.py)
@@ -0,0 +1,53 @@
+"""
+Tests for the ledger parser
+
+Run with: python -m unittest webledger.parser.test_ledgerParser
+"""
+import datetime
+import unittest
+from decimal import Decimal
+
+import webledger.parser.ledgerParser as parser
+import webledger.parser.ledgertree as ledgertree
+import webledger.journal.journal as journal
+import webledger.journal.prices as prices
+
+
+def parse_prices(source_text):
+	tree = ledgertree.build_ledgertree(parser.parse(source_text))
+	ledgertree.balance_ledgertree(tree)
+	return journal.ledgertree_to_journal(tree).prices
+
+
+class PriceStatementTest(unittest.TestCase):
+
+	def test_price_without_time(self):
+		self.assertEqual(parse_prices("P 2013/01/15 AAPL $500.00\n"),
+			[(datetime.date(2013, 1, 15), "AAPL", Decimal("500.00"), "$")])
+
+	def test_price_with_time(self):
+		self.assertEqual(parse_prices("P 2013/01/15 12:00:00 AAPL $500.00\n"),
+			[(datetime.date(2013, 1, 15), "AAPL", Decimal("500.00"), "$")])
+
+	def test_price_with_hours_and_minutes(self):
+		self.assertEqual(parse_prices("P 2011/11/28 00:01 COM $0.8615 ; note\n"),
+			[(datetime.date(2011, 11, 28), "COM", Decimal("0.8615"), "$")])
+
+	def test_price_with_time_before_transaction(self):
+		source_text = ("P 2013/01/15 12:00:00 AAPL $500.00\n"
+			"2013/01/16 * Buy\n"
+			"    Assets:Broker    2 AAPL @ $500.00\n"
+			"    Assets:Checking\n")
+		self.assertEqual(len(parse_prices(source_text)), 1)
+
+	def test_price_line_matches_price_file(self):
+		# the same line is read the same way from a ledger file and a price file
+		line = "P 2013/01/15 12:00:00 AAPL $500.00"
+		match = prices.PRICE_LINE.match(line)
+		(date, commodity, price, currency) = parse_prices(line + "\n")[0]
+		self.assertEqual(match.group(1), date.strftime("%Y/%m/%d"))
+		self.assertEqual(match.group(2), commodity)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,145 @@
+"""
+Tests for balancing transactions in the ledger tree
+
+Run with: python -m unittest webledger.parser.test_ledgertree
+"""
+import unittest
+from decimal import Decimal
+
+import webledger.parser.ledgerParser as parser
+import webledger.parser.ledgertree as ledgertree
+
+
+def balance(source_text):
+	"""
+	Returns the line items of the first transaction in source_text, once
+	balanced, as (account, amount, commodity, value, value commodity)
+	"""
+	tree = ledgertree.build_ledgertree(parser.parse(source_text))
+	ledgertree.balance_ledgertree(tree)
+	return [(node.account, node.amount, node.amountCommodity, node.value, node.valueCommodity)
+		for node in tree.children[0].children]
+
+
+class AutoBalanceTest(unittest.TestCase):
+
+	def test_single_commodity(self):
+		self.assertEqual(balance("2013/01/01 Groceries\n"
+				"    Expenses:Food    $12.50\n"
+				"    Assets:Checking\n"), [
+			("Expenses:Food", Decimal("12.50"), "$", None, None),
+			("Assets:Checking", Decimal("-12.50"), "$", None, None)])
+
+	def test_split_across_commodities(self):
+		# the line item without an amount takes what is left in each commodity
+		self.assertEqual(balance("2013/01/01 Gift\n"
+				"    Assets:Broker    10 COM\n"
+				"    Assets:Checking    $50.00\n"
+				"    Income:Gifts\n"
+				"    Assets:Savings    $25.00\n"), [
+			("Assets:Broker", Decimal("10"), "COM", None, None),
+			("Assets:Checking", Decimal("50.00"), "$", None, None),
+			("Income:Gifts", Decimal("-10"), "COM", None, None),
+			("Income:Gifts", Decimal("-75.00"), "$", None, None),
+			("Assets:Savings", Decimal("25.00"), "$", None, None)])
+
+	def test_cost_balances_in_its_commodity(self):
+		self.assertEqual(balance("2013/01/01 Buy\n"
+				"    Assets:Broker    10 COM @ $5.00\n"
+				"    Assets:Checking\n"), [
+			("Assets:Broker", Decimal("10"), "COM", Decimal("50.00"), "$"),
+			("Assets:Checking", Decimal("-50.00"), "$", None, None)])
+
+	def test_already_balanced(self):
+		# nothing is left over: the line item gets 0 in the first commodity
+		lines = balance("2013/01/01 Transfer\n"
+			"    Assets:Savings    $10.00\n"
+			"    Assets:Checking    $-10.00\n"
+			"    Equity\n")
+		self.assertEqual(lines[2], ("Equity", Decimal("0"), "$", None, None))
+
+	def test_virtual_unbalanced_left_out(self):
+		self.assertEqual(balance("2013/01/01 Budget\n"
+				"    Expenses:Food    $20.00\n"
+				"    (Budget:Food)    $-20.00\n"
+				"    Assets:Checking\n"), [
+			("Expenses:Food", Decimal("20.00"), "$", None, None),
+			("Budget:Food", Decimal("-20.00"), "$", None, None),
+			("Assets:Checking", Decimal("-20.00"), "$", None, None)])
+
+	def test_multiple_without_amount(self):
+		self.assertRaisesRegexp(Exception, "multiple line items", balance, "2013/01/01 Groceries\n"
+			"    Expenses:Food    $12.50\n"
+			"    Assets:Checking\n"
+			"    Assets:Savings\n")
+
+	def test_virtual_unbalanced_without_amount(self):
+		self.assertRaisesRegexp(Exception, "virtual unbalanced entry that has no amount", balance, "2013/01/01 Groceries\n"
+			"    Expenses:Food    $12.50\n"
+			"    Assets:Checking\n"
+			"    (Budget:Food)\n")
+
+
+class ExchangeCostTest(unittest.TestCase):
+
+	def test_buy(self):
+		# the commodity that is not the default currency is priced in it
+		self.assertEqual(balance("2013/01/01 Buy\n"
+				"    Assets:Broker    10 COM\n"
+				"    Assets:Checking    $-50.00\n"), [
+			("Assets:Broker", Decimal("10"), "COM", Decimal("50.00"), "$"),
+			("Assets:Checking", Decimal("-50.00"), "$", None, None)])
+
+	def test_sell(self):
+		self.assertEqual(balance("2013/01/01 Sell\n"
+				"    Assets:Checking    $60.00\n"
+				"    Assets:Broker    -10 COM\n"), [
+			("Assets:Checking", Decimal("60.00"), "$", None, None),
+			("Assets:Broker", Decimal("-10"), "COM", Decimal("-60.00"), "$")])
+
+	def test_without_default_currency(self):
+		# neither commodity is the default currency: the first is priced
+		lines = balance("2013/01/01 Exchange\n"
+			"    Assets:Euro    100 EUR\n"
+			"    Assets:Franc    -120 CHF\n")
+		self.assertEqual(lines[0], ("Assets:Euro", Decimal("100"), "EUR", Decimal("120"), "CHF"))
+		self.assertEqual(lines[1], ("Assets:Franc", Decimal("-120"), "CHF", None, None))
+
+	def test_with_cost_does_not_balance(self):
+		# with a cost given, the amounts must balance
+		self.assertRaisesRegexp(Exception, r"do not balance \(balance is: 10.00 \$\)", balance, "2013/01/01 Buy\n"
+			"    Assets:Broker    10 COM @ $5.00\n"
+			"    Assets:Checking    $-40.00\n")
+
+	def test_three_commodities_do_not_balance(self):
+		self.assertRaisesRegexp(Exception, "do not balance", balance, "2013/01/01 Exchange\n"
+			"    Assets:Broker    10 COM\n"
+			"    Assets:Euro    -5 EUR\n"
+			"    Assets:Checking    $-50.00\n")
+
+
+class TotalCostTest(unittest.TestCase):
+
+	def test_buy(self):
+		self.assertEqual(balance("2013/01/01 Buy\n"
+				"    Assets:Broker    10 COM @@ $50.00\n"
+				"    Assets:Checking\n"), [
+			("Assets:Broker", Decimal("10"), "COM", Decimal("50.00"), "$"),
+			("Assets:Checking", Decimal("-50.00"), "$", None, None)])
+
+	def test_sell_cost_has_the_sign_of_the_amount(self):
+		self.assertEqual(balance("2013/01/01 Sell\n"
+				"    Assets:Broker    -10 COM @@ $60.00\n"
+				"    Assets:Checking\n"), [
+			("Assets:Broker", Decimal("-10"), "COM", Decimal("-60.00"), "$"),
+			("Assets:Checking", Decimal("60.00"), "$", None, None)])
+
+	def test_sell_balances_against_currency(self):
+		lines = balance("2013/01/01 Sell\n"
+			"    Assets:Broker    -10 COM @@ $60.00\n"
+			"    Assets:Checking    $60.00\n")
+		self.assertEqual(lines[0][3], Decimal("-60.00"))
+
+
+if __name__ == "__main__":
+	unittest.main()
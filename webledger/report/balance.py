@@ -9,8 +9,12 @@ import datetime
 import calendar
 import json
 import re
+import itertools
 import webledger.journal.journal as journal
+import webledger.journal.prices as prices
+import webledger.report.query as query
 import webledger.utilities.utilities as utilities
+import webledger.utilities.metrics as metrics
 
 
 #========================================================
@@ -23,74 +27,32 @@ class BalanceReportParameters:
 		"""
 		Create a parameters object from a query command
 		"""
-		accounts_with = []
-		exclude_accounts_with = []
-		period = []
-		period_start = None
-		period_end = None
-		title = []
-		phase = "select"
-
-		for token in command:
-			if token == ":excluding":
-				phase = "filter"
-			elif token == ":period":
-				phase = "period"
-			elif token == ":since":
-				phase = "periodstart"
-			elif token == ":upto":
-				phase = "periodend"
-			elif token == ":title":
-				phase = "title"
-			elif phase == "select":
-				accounts_with.append(token)
-			elif phase == "filter":
-				exclude_accounts_with.append(token)
-			elif phase == "period":
-				period.append(token)
-			elif phase == "periodstart":
-				period_start = datetime.datetime.strptime(token, "%Y/%m/%d").date()
-				phase = "invalid"
-			elif phase == "periodend":
-				period_end = datetime.datetime.strptime(token, "%Y/%m/%d").date()
-				phase = "invalid"
-			elif phase == "title":
-				title.append(token)
-			else:
-				raise Exception("Invalid token in balance command parameters: " + token)
-
-		# parse period
-		# TODO: should move this somewhere else eventually
-		if len(period) > 0:
-			period_str = " ".join(period)
-
-			if period_str == "this month":
-				today = datetime.date.today()
-				period_start = datetime.date(year=today.year, month=today.month, day=1)
-				period_end = datetime.date(year=today.year, month=today.month, day=calendar.monthrange(today.year, today.month)[1])
-			elif period_str == "last month":
-				today = datetime.date.today()
-				month_ago = utilities.date_add_months(today, -1)
-				period_start = datetime.date(year=month_ago.year, month=month_ago.month, day=1)
-				period_end = datetime.date(year=month_ago.year, month=month_ago.month, day=calendar.monthrange(month_ago.year, month_ago.month)[1])
-			else:
-				raise Exception("Invalid period expression: " + period_str)
+		plan = query.compile_command(command)
 
-		return cls(title=" ".join(title) if len(title) > 0 else None,
-			accounts_with=accounts_with if len(accounts_with) > 0 else None,
-			exclude_accounts_with=exclude_accounts_with if len(exclude_accounts_with) > 0 else None,
-			period_start=period_start,
-			period_end=period_end)
+		return cls(title=plan.title,
+			accounts_with=plan.accounts_with,
+			exclude_accounts_with=plan.exclude_accounts_with,
+			period_start=plan.period_start,
+			period_end=plan.period_end,
+			by=plan.options.get("by"),
+			depth=plan.options.get("depth"),
+			search=plan.options.get("search"),
+			payee=plan.options.get("payee"))
 
 
 	def __init__(self, title=None,
 			accounts_with=None, exclude_accounts_with=None,
-			period_start=None, period_end=None):
+			period_start=None, period_end=None, by=None, depth=None,
+			search=None, payee=None):
 		self.title = title if title != None else "Balance"
 		self.period_start = period_start
 		self.period_end = period_end
 		self.accounts_with = accounts_with
 		self.exclude_accounts_with = exclude_accounts_with
+		self.by = by
+		self.depth = depth
+		self.search = search
+		self.payee = payee
 
 
 
@@ -103,56 +65,54 @@ def generate_balance_report(journal_data, parameters):
 	"""
 	Returns balance report data based on report parameters provided
 	"""
-	lines = None
+	return generate_reports(journal_data, [("balance", parameters)])[0]
 
-	# filter accounts based on accounts to include/exclude
-	accounts = filter_accounts(journal_data, parameters)
-
-	# get list of all amounts that apply to each account
-	# within the period start/end parameters
-	all_account_amounts = flatten_list([
-			[(account, entry.amount[0], account == entry.account)
-			for account in entry.account_lineage]
-		for entry in journal_data.entries
-		if entry.account in accounts and within_period(entry.header.date, parameters)])
-
-	# reduce the list of accounts to ones that had activity in the report period
-	accounts = set([tuple[0] for tuple in all_account_amounts])
-
-	if len(all_account_amounts) > 0:
-		# reduce the list to calculate account balances
-		all_account_balances = [
-			reduce((lambda t1, t2: (t1[0], t1[1]+t2[1])),
-				filter((lambda tuple: tuple[0] == account), all_account_amounts))
-			for account in accounts]
 
+def generate_balance_report_from_balances(parameters, commodities, account_balances, total_balance, columns=None):
+	"""
+	Returns balance report data from the balance of each account (including
+	parent accounts) that had activity in the report period and the total of
+	all entries in the report. Balances are lists with one amount per
+	commodity in commodities.
+
+	For a report by period, columns is the list of (start, end) dates of each
+	period and the balances are lists with one balance per period.
+	"""
+	lines = None
+
+	if len(account_balances) > 0:
 		# filter to non-zero accounts only
-		nonzero_account_balances = filter(
-			(lambda tuple: tuple[1] != 0), all_account_balances)
+		nonzero_account_balances = [
+			(account, amount)
+			for (account, amount) in account_balances.iteritems()
+			if is_nonzero(amount)]
 		
+		nonzero_account_balances.sort(key=lambda tuple: tuple[0])
+
 		# filter parent accounts that only have one direct descendant
 		# these accounts will be the ones where there is another account that
 		# starts with the same name, but is longer and has the same amount
-		account_balance_list = filter(
-			(lambda tuple: keep_tuple(tuple, nonzero_account_balances)),
-			nonzero_account_balances)
+		account_balance_list = [tuple
+			for (index, tuple) in enumerate(nonzero_account_balances)
+			if keep_tuple(index, nonzero_account_balances)]
 
-		# calculate total balance
-		total_balance = sum([tuple[1] for tuple in all_account_amounts if tuple[2]])
-
-		account_balance_list.sort(key=lambda tuple: tuple[0])
 		account_balance_list.append(("", total_balance))
+		account_names = set([tuple[0] for tuple in account_balance_list])
 
-		# format account name for display
+		# format account name for display: indent once for each ancestor shown,
+		# and drop the name of the closest one
 		display_list = list()
 		for tuple in account_balance_list:
 			indent = 0
 			parent_name = ""
 			display_name = tuple[0]
+			parts = display_name.split(":")
 
-			for other in account_balance_list:
-				if display_name.startswith(other[0]) and display_name != other[0] and display_name[len(other[0])] == ":":
-					parent_name = other[0]
+			for level in range(len(parts) - 1, 0, -1):
+				ancestor = ":".join(parts[:level])
+				if ancestor in account_names:
+					if indent == 0:
+						parent_name = ancestor
 					indent += 1
 
 			if len(parent_name) > 0:
@@ -160,9 +120,12 @@ def generate_balance_report(journal_data, parameters):
 
 			display_list.append((tuple[0], tuple[1], display_name, indent))
 
-		lines = map(lambda tuple: generate_balance_report_line(tuple), display_list)
+		lines = [generate_balance_report_line(tuple, commodities, columns != None) for tuple in display_list]
 	
-	return generate_balance_report_data(parameters, lines)
+	data = generate_balance_report_data(parameters, lines)
+	if columns != None:
+		data["columns"] = [format_period(parameters.by, start) for (start, end) in columns]
+	return data
 
 
 #========================================================
@@ -173,16 +136,18 @@ def filter_accounts(journal_data, report_parameters):
 	"""
 	Get list of accounts to report on based on report_parameters.
 	"""
-	accounts = {account
-		for account in journal_data.all_accounts
-		if (report_parameters.accounts_with == None
-				or len(report_parameters.accounts_with) == 0 
-				or one_of_in(report_parameters.accounts_with, account))
-			and (report_parameters.exclude_accounts_with == None
-				or len(report_parameters.exclude_accounts_with) == 0
-				or not one_of_in(report_parameters.exclude_accounts_with, account))}
+	return query.select_accounts(journal_data,
+		report_parameters.accounts_with, report_parameters.exclude_accounts_with)
 
-	return accounts
+
+def filter_entries(journal_data, report_parameters, accounts):
+	"""
+	Get the entries (in file order) for accounts within the report period,
+	matching the report's search terms.
+	"""
+	return query.select_entries(journal_data, accounts,
+		report_parameters.period_start, report_parameters.period_end,
+		query.select_matches(journal_data, report_parameters.search, report_parameters.payee))
 
 
 def one_of_in(terms, string):
@@ -208,14 +173,22 @@ def within_period(entry_date, parameters):
 	return within_period
 
 
-def keep_tuple(tuple, tuple_list):
+def keep_tuple(index, sorted_tuple_list):
 	"""
 	filter parent accounts that only have one direct descendant
 	these accounts will be the ones where there is another account that
 	starts with the same name, but is longer and has the same amount
+	(for reports by period, the same amount in every period)
+
+	The list is sorted by account, so the accounts that start with the name
+	are the ones right after it.
 	"""
-	for t in tuple_list:
-		if t[0].startswith(tuple[0]) and len(t[0]) > len(tuple[0]) and t[1] == tuple[1]:
+	tuple = sorted_tuple_list[index]
+
+	for t in itertools.islice(sorted_tuple_list, index + 1, None):
+		if not t[0].startswith(tuple[0]):
+			break
+		if t[1] == tuple[1]:
 			return False
 
 	return True
@@ -225,7 +198,7 @@ def keep_tuple(tuple, tuple_list):
 #	Balance Report Data Structure Functions
 #========================================================
 
-def generate_balance_report_line(tuple):
+def generate_balance_report_line(tuple, commodities, by_period=False):
 	"""
 	Generates the pystache dictionary for a balance sheet line
 	"""
@@ -236,7 +209,12 @@ def generate_balance_report_line(tuple):
 	data = dict()
 	data["account"] = tuple[0]
 	data["account_display"] = tuple[2]
-	data["balance"] = format_amount(tuple[1])
+	if by_period:
+		# one balance per period, and the balance is the total
+		data["balances"] = [format_amounts(amounts, commodities) for amounts in tuple[1]]
+		data["balance"] = format_amounts(sum_amounts(tuple[1], len(commodities)), commodities)
+	else:
+		data["balance"] = format_amounts(tuple[1], commodities)
 	data["row_class"] = "grand_total" if len(tuple[0]) == 0 else ""
 	data["balance_class"] = tuple[0].split(":")[0].lower()
 	data["account_style"] = account_style_format.format(padding_left_base + (tuple[3] * indent_padding))
@@ -279,14 +257,53 @@ def flatten_list(list):
 			for item in sublist]
 
 
-def format_amount(amount, negative_in_parentheses=True):
+def is_nonzero(amount):
+	"""
+	Returns true if amount (or any amount in a list of amounts, or of lists
+	of amounts) is not zero
+	"""
+	if isinstance(amount, list):
+		return any([is_nonzero(a) for a in amount])
+	return amount != 0
+
+
+def sum_amounts(amounts_list, count):
+	"""
+	Sums a list of lists of amounts (one amount per commodity) element by
+	element
+	"""
+	total = [0] * count
+	for amounts in amounts_list:
+		for (index, amount) in enumerate(amounts):
+			total[index] += amount
+	return total
+
+
+def format_period(unit, start):
+	"""
+	Formats the period (month, quarter or year) starting at start for display
+	"""
+	if unit == "month":
+		return start.strftime("%b %Y")
+	elif unit == "quarter":
+		return "Q%d %d" % ((start.month - 1) / 3 + 1, start.year)
+	return str(start.year)
+
+
+def format_amount(amount, negative_in_parentheses=True, commodity=None):
 	"""
-	Formats an amount into a nice string for display.
+	Formats an amount into a nice string for display. Amounts in the default
+	currency show cents; other commodities show the units as they were given.
 	"""
 	currency_format_string = "{:,.2f}"
 	amount_string = ""
 
-	if amount < 0 and negative_in_parentheses:
+	if commodity != None and commodity != prices.DEFAULT_CURRENCY:
+		if amount < 0 and negative_in_parentheses:
+			amount_string = "(" + "{:,}".format(amount * -1) + " " + commodity + ")"
+		else:
+			amount_string = "{:,}".format(amount) + " " + commodity
+	elif amount < 0 and negative_in_parentheses:
 		amount_string = "($" + currency_format_string.format(amount * -1) + ")"
 	else:
 		amount_string = "$" + currency_format_string.format(amount)
@@ -294,12 +311,41 @@ def format_amount(amount, negative_in_parentheses=True):
 	return amount_string
 
 
+def format_amounts(amounts, commodities, negative_in_parentheses=True):
+	"""
+	Formats a list of amounts (one per commodity in commodities) for display,
+	leaving out the commodities with no amount
+	"""
+	amount_strings = [
+		format_amount(amount, negative_in_parentheses, commodities[index])
+		for (index, amount) in enumerate(amounts)
+		if amount != 0]
+
+	if len(amount_strings) == 0:
+		return format_amount(amounts[0], negative_in_parentheses)
+	return ", ".join(amount_strings)
+
+
 #===============================================================================
 #===============================================================================
 # Monthly Summary
 
 
 class MonthlySummaryParameters:
+	@classmethod
+	def from_command(cls, command):
+		"""
+		Create a parameters object from a query command. Accepts the same
+		parameters as a balance report.
+		"""
+		parameters = BalanceReportParameters.from_command(command)
+
+		return cls(title=parameters.title if parameters.title != "Balance" else "Monthly Summary",
+			accounts_with=parameters.accounts_with,
+			exclude_accounts_with=parameters.exclude_accounts_with,
+			period_start=parameters.period_start,
+			period_end=parameters.period_end)
+
 
 	def __init__(self, title="Monthly Summary", 
 			accounts_with=None, exclude_accounts_with=None,
@@ -313,33 +359,52 @@ class MonthlySummaryParameters:
 
 def generate_monthly_summary(journal_data, parameters):
 	"""
-	Returns a total per month
+	Returns a total per month, with the totals encoded as JSON for the chart
+	"""
+	monthly_summary = dict()
+	monthly_summary["title"] = parameters.title
+	monthly_summary["tuples"] = json.dumps(
+		generate_monthly_summary_tuples(journal_data, parameters),
+		separators=(',', ':'))
+	return monthly_summary
+
+
+def generate_monthly_summary_tuples(journal_data, parameters):
+	"""
+	Returns a list with the total per month: a running total of the entries
+	of the accounts, for each month in the period with entries. The totals
+	come from the journal's monthly totals, so only the months are summed.
 	"""
 
 	# filter accounts based on accounts to include/exclude
-	accounts = filter_accounts(journal_data, parameters)
+	with metrics.timer("filter"):
+		accounts = filter_accounts(journal_data, parameters)
 
-	# get list of all amounts that apply to each account
-	# within the period start/end parameters
-	all_month_amounts = [
-		#(datetime.date(year=entry.header.date.year,month=entry.header.date.month,day=calendar.monthrange(entry.header.date.year, entry.header.date.month)[1]), entry.amount[0])
-		(datetime.date(year=entry.header.date.year,month=entry.header.date.month,day=1), entry.amount[0])
-		for entry in journal_data.entries
-		if entry.account in accounts]
+	with metrics.timer("aggregate"):
+		# total (book value) per month of the entries posted to the accounts
+		monthly_totals = journal_data.get_monthly_totals(direct=True)
+		month_totals = dict()
+		for account in accounts:
+			for (month, amount) in monthly_totals.get(account, dict()).iteritems():
+				month_totals[month] = month_totals.get(month, 0) + amount
 
-	months = set([tuple[0] for tuple in all_month_amounts if within_period(tuple[0], parameters)])
+		monthly_amounts = list()
+		total = 0
+		for month in sorted(month_totals.keys()):
+			total += month_totals[month]
+			if within_period(month, parameters):
+				monthly_amounts.append((month, total))
 
-	monthly_amounts = [
-		reduce(lambda t1, t2: (month, t1[1] + t2[1]),
-			filter(lambda tuple: tuple[0] <= month, all_month_amounts))
-		for month in months]
+	with metrics.timer("format"):
+		return generate_monthly_summary_data(monthly_amounts)
 
-	monthly_amounts.sort(key=lambda tuple: tuple[0])
 
-	
+def generate_monthly_summary_data(monthly_amounts):
+	"""
+	Formats a list of (month, total) for the chart
+	"""
 	tuples = list()
 	currency_format_string = "{:.2f}"
-	display_currency_format_string = "{:,.2f}"
 
 	for tuple in monthly_amounts:
 		d = dict()
@@ -348,10 +413,7 @@ def generate_monthly_summary(journal_data, parameters):
 		d["hover"] = tuple[0].strftime("%b %Y") + ": " + format_amount(tuple[1])
 		tuples.append(d)
 
-	monthly_summary = dict()
-	monthly_summary["title"] = parameters.title
-	monthly_summary["tuples"] = json.dumps(tuples, indent=4, separators=(',', ': '))
-	return monthly_summary
+	return tuples
 
 
 
@@ -363,31 +425,33 @@ def generate_register_report(journal_data, parameters):
 	"""
 	Returns register report data based on report parameters provided
 	"""
+	return generate_reports(journal_data, [("register", parameters)])[0]
 
-	# filter accounts based on accounts to include/exclude
-	accounts = filter_accounts(journal_data, parameters)
 
-	# get list of all entries that apply to each account
-	# within the period start/end parameters, grouped by the transaction header
+def generate_register_report_from_entries(parameters, commodities, entries):
+	"""
+	Returns register report data from the entries (in file order) that apply
+	to the report. The running total is kept per commodity.
+	"""
+	# group entries by the transaction header
 	transactions = dict()      # group entries in the same transaction
 	ordered_key_list = list()  # preserve order of transactions in file
 
-	for entry in journal_data.entries:
-		if entry.account in accounts and within_period(entry.header.date, parameters):
-			key = (entry.header.date, entry.header.description)
-			if key in transactions:
-				transactions[key].append(entry)
-			else:
-				ordered_key_list.append(key)
-				transactions[key] = [entry]
+	for entry in entries:
+		key = (entry.header.date, entry.header.description)
+		if key in transactions:
+			transactions[key].append(entry)
+		else:
+			ordered_key_list.append(key)
+			transactions[key] = [entry]
 
 	# generate line items and keep a running total
-	total = 0
+	total = [0] * len(commodities)
 	lines = []
 	for key in ordered_key_list:
 		for (counter, entry) in enumerate(transactions[key]):
 			line = dict()
-			total += entry.amount[0]
+			total[entry.commodity_id] += entry.amount[0]
 			if counter == (len(transactions[key]) - 1):
 				# put the description on the last entry since the list will be reversed
 				line["date"] = entry.header.date
@@ -395,8 +459,8 @@ def generate_register_report(journal_data, parameters):
 			else:
 				line["td-class"] = "no-border-top"
 			line["account"] = entry.account
-			line["amount"] = format_amount(entry.amount[0], False)
-			line["total"] = format_amount(total, False)
+			line["amount"] = format_amount(entry.amount[0], False, commodities[entry.commodity_id])
+			line["total"] = format_amounts(total, commodities, False)
 			lines.append(line)
 
 	# reverse the entries so that the most recent is a top
@@ -407,3 +471,254 @@ def generate_register_report(journal_data, parameters):
 	register["lines"] = lines
 
 	return register
+
+
+
+#========================================================
+#	Batch Report Generator
+#========================================================
+
+def generate_reports(journal_data, reports):
+	"""
+	Returns report data for each report in reports, a list of tuples of
+	(report type, parameters) where report type is "balance" or "register".
+
+	The reports share a single pass over the postings. The entries of every
+	account any of the reports selects, within any of their periods, are
+	selected once using the journal's account and date indexes, and each is
+	visited once:
+		- balance reports with the same period, search terms and columns (:by)
+			share one sum per posting account (and column); each report then
+			adds the sums of its own accounts into their parent accounts
+		- register reports collect the entries of their accounts
+
+	Balances are lists with one amount per commodity, indexed by the entry's
+	commodity_id, so summing stays a list index and an add however many
+	commodities the journal has.
+	"""
+	commodities = journal_data.commodities
+
+	# filter accounts based on accounts to include/exclude
+	with metrics.timer("filter"):
+		report_accounts = list()
+		report_selections = list()
+		selections = list()
+		balance_sums = dict()
+
+		for (report_type, parameters) in reports:
+			accounts = filter_accounts(journal_data, parameters)
+			matches = query.select_matches(journal_data, parameters.search, parameters.payee)
+
+			if report_type == "balance":
+				key = (parameters.period_start, parameters.period_end, parameters.by,
+					tuple(parameters.search or ()), tuple(parameters.payee or ()))
+				selection = balance_sums.get(key)
+				if selection == None:
+					selection = balance_sums[key] = PostingSums(parameters, matches, len(commodities))
+					selections.append(selection)
+			elif report_type == "register":
+				selection = PostingList(parameters, matches)
+				selections.append(selection)
+			else:
+				raise Exception("Unknown report type: " + report_type)
+
+			selection.accounts.update(accounts)
+			report_accounts.append(accounts)
+			report_selections.append(selection)
+
+		positions = select_shared_positions(journal_data, selections)
+
+	with metrics.timer("aggregate"):
+		entries = journal_data.entries
+		for position in positions:
+			entry = entries[position]
+			for selection in selections:
+				if selection.includes(position, entry):
+					selection.add(entry)
+
+	data = list()
+	with metrics.timer("format"):
+		for (index, (report_type, parameters)) in enumerate(reports):
+			selection = report_selections[index]
+
+			if report_type == "balance":
+				(columns, account_balances, total_balance) = \
+					balances_from_sums(parameters, selection, report_accounts[index], len(commodities))
+				data.append(generate_balance_report_from_balances(
+					parameters, commodities, account_balances, total_balance, columns))
+			else:
+				data.append(generate_register_report_from_entries(
+					parameters, commodities, selection.entries))
+
+	return data
+
+
+def select_shared_positions(journal_data, selections):
+	"""
+	Returns the positions (in file order) of the entries of all the
+	selections: the entries of any of their accounts, within the earliest
+	start and latest end of their periods, among any of their matches
+	"""
+	accounts = set()
+	for selection in selections:
+		accounts.update(selection.accounts)
+
+	starts = [selection.period_start for selection in selections]
+	ends = [selection.period_end for selection in selections]
+	matches = [selection.matches for selection in selections]
+
+	return query.select_positions(journal_data, accounts,
+		min(starts) if None not in starts else None,
+		max(ends) if None not in ends else None,
+		frozenset().union(*matches) if None not in matches else None)
+
+
+def balances_from_sums(parameters, sums, accounts, commodity_count):
+	"""
+	Returns (columns, account balances, total balance) for a balance report
+	from the sums of its posting accounts: the sum of each of its accounts
+	applies to the account and all its parents (or only the parents up to the
+	report depth).
+
+	For a report by period, the columns run from the report period start and
+	end, or from the first to the last entry if the period is open, and each
+	balance is a list with one list of amounts (one per commodity) per column.
+	"""
+	account_sums = [(account, account_sum)
+		for (account, account_sum) in sums.sums.iteritems()
+		if account in accounts]
+	balances = dict()
+
+	if parameters.by == None:
+		total = [0] * commodity_count
+
+		for (account, amounts) in account_sums:
+			for parent in report_lineage(sums.lineages[account], parameters):
+				parent_amounts = balances.get(parent)
+				if parent_amounts == None:
+					parent_amounts = balances[parent] = [0] * commodity_count
+				add_amounts(parent_amounts, amounts)
+			add_amounts(total, amounts)
+
+		return (None, balances, total)
+
+	column_starts = set([start
+		for (account, column_sums) in account_sums
+			for start in column_sums])
+
+	if len(column_starts) == 0 and (parameters.period_start == None or parameters.period_end == None):
+		return (list(), balances, list())
+
+	start = parameters.period_start or min(column_starts)
+	end = parameters.period_end or max(column_starts)
+	columns = query.unit_ranges(parameters.by, start, end)
+	column_index = dict([(column[0], index) for (index, column) in enumerate(columns)])
+	total = [[0] * commodity_count for column in columns]
+
+	for (account, column_sums) in account_sums:
+		for parent in report_lineage(sums.lineages[account], parameters):
+			if parent not in balances:
+				balances[parent] = [[0] * commodity_count for column in columns]
+			for (column_start, amounts) in column_sums.iteritems():
+				add_amounts(balances[parent][column_index[column_start]], amounts)
+		for (column_start, amounts) in column_sums.iteritems():
+			add_amounts(total[column_index[column_start]], amounts)
+
+	return (columns, balances, total)
+
+
+def report_lineage(lineage, parameters):
+	"""
+	Returns the accounts an amount posted to the first account of lineage (an
+	entry's account_lineage) applies to: all of them, or for a report with a
+	depth, only the parents up to that depth (the lineage ends with the top
+	level account)
+	"""
+	if parameters.depth != None:
+		return lineage[-parameters.depth:]
+	return lineage
+
+
+def add_amounts(total, amounts):
+	"""
+	Adds a list of amounts (one per commodity) into total, element by element
+	"""
+	for (index, amount) in enumerate(amounts):
+		total[index] += amount
+
+
+
+#========================================================
+#	Shared Selections
+#========================================================
+
+class PostingSelection:
+	"""
+	The entries a report (or reports) takes from the shared pass over the
+	postings: the entries posted to one of accounts, within the period, among
+	matches (positions from query.select_matches, or None for all)
+	"""
+
+	def __init__(self, parameters, matches):
+		self.accounts = set()
+		self.period_start = parameters.period_start
+		self.period_end = parameters.period_end
+		self.matches = matches
+
+
+	def includes(self, position, entry):
+		return (entry.account in self.accounts
+			and (self.period_start == None or entry.header.date >= self.period_start)
+			and (self.period_end == None or entry.header.date <= self.period_end)
+			and (self.matches == None or position in self.matches))
+
+
+class PostingSums(PostingSelection):
+	"""
+	Sums of the entries selected for the balance reports that share a period,
+	search terms and columns (:by):
+		- sums: posting account -> amounts (one per commodity), or for reports
+			by period, posting account -> {column start: amounts}
+		- lineages: posting account -> its account lineage
+	"""
+
+	def __init__(self, parameters, matches, commodity_count):
+		PostingSelection.__init__(self, parameters, matches)
+		self.by = parameters.by
+		self.commodity_count = commodity_count
+		self.sums = dict()
+		self.lineages = dict()
+		self.column_starts = dict()
+
+
+	def add(self, entry):
+		sums = self.sums.get(entry.account)
+		if sums == None:
+			sums = self.sums[entry.account] = [0] * self.commodity_count if self.by == None else dict()
+			self.lineages[entry.account] = entry.account_lineage
+
+		if self.by != None:
+			date = entry.header.date
+			column_start = self.column_starts.get(date)
+			if column_start == None:
+				column_start = self.column_starts[date] = query.unit_range(self.by, date, 0)[0]
+			amounts = sums.get(column_start)
+			if amounts == None:
+				amounts = sums[column_start] = [0] * self.commodity_count
+			sums = amounts
+
+		sums[entry.commodity_id] += entry.amount[0]
+
+
+class PostingList(PostingSelection):
+	"""
+	The entries selected for a register report, in file order
+	"""
+
+	def __init__(self, parameters, matches):
+		PostingSelection.__init__(self, parameters, matches)
+		self.entries = list()
+
+
+	def add(self, entry):
+		self.entries.append(entry)
@@ -0,0 +1,200 @@
+"""
+Chart Data Generator
+
+Generates time series for charts: income, expenses, net (income - expenses)
+and net worth, per day or per month. All four come from a single pass over
+the journal entries in date order.
+
+Series are encoded compactly: each is a pair of lists, the x values (the
+number of days or months since the start date) and the y values (rounded to
+cents). Long series can be downsampled to at most max_points points with
+Largest-Triangle-Three-Buckets, which keeps the shape of the line (peaks and
+dips) rather than averaging it away.
+"""
+
+import re
+import datetime
+
+
+SERIES = ["income", "expenses", "net", "networth"]
+INTERVALS = ["day", "month"]
+
+# net worth is assets and liabilities, but not investment units (as /networth)
+NETWORTH_EXCLUDE = re.compile("units", re.IGNORECASE)
+
+
+#========================================================
+#	Chart Parameters class
+#========================================================
+
+class ChartParameters:
+	"""
+	Chart parameters:
+		- interval: "day" or "month"
+		- period_start / period_end: dates to chart (None for the first or
+			last entry)
+		- max_points: downsample each series to at most this many points
+			(None to send every point)
+	"""
+
+	def __init__(self, interval="month", period_start=None, period_end=None, max_points=None):
+		if interval not in INTERVALS:
+			raise Exception("Invalid chart interval (day or month): " + interval)
+		if max_points != None and max_points < 3:
+			raise Exception("max_points must be 3 or more")
+
+		self.interval = interval
+		self.period_start = period_start
+		self.period_end = period_end
+		self.max_points = max_points
+
+
+
+#========================================================
+#	Chart Data Generator
+#========================================================
+
+def generate_chart_data(journal_data, parameters):
+	"""
+	Returns chart data: the start date, interval and each series as
+	[x values, y values]
+	"""
+	data = dict()
+	data["interval"] = parameters.interval
+	data["series"] = dict((name, [[], []]) for name in SERIES)
+
+	if len(journal_data.entries) == 0:
+		data["start"] = None
+		return data
+
+	start = bucket_start(parameters.interval, parameters.period_start or journal_data.entry_dates[0])
+	end = parameters.period_end or journal_data.entry_dates[-1]
+	data["start"] = start.isoformat()
+
+	(income, expenses, networth) = aggregate_series(journal_data, parameters.interval, start, end)
+	x = range(len(income))
+	net = [i - e for (i, e) in zip(income, expenses)]
+
+	for (name, y) in zip(SERIES, [income, expenses, net, networth]):
+		y = [round(float(amount), 2) for amount in y]
+		if parameters.max_points != None and len(y) > parameters.max_points:
+			data["series"][name] = downsample(x, y, parameters.max_points)
+		else:
+			data["series"][name] = [x, y]
+
+	return data
+
+
+def aggregate_series(journal_data, interval, start, end):
+	"""
+	Returns the income, expenses and (end of interval) net worth of each
+	interval from start to end, from one pass over the entries in date order.
+	Income is positive; entries before start only count towards net worth.
+	Amounts are book values (see Entry.get_book_value).
+	"""
+	count = bucket_index(interval, start, end) + 1
+	income = [0] * count
+	expenses = [0] * count
+	networth = [0] * count
+	opening = 0
+
+	entries = journal_data.entries
+	for position in journal_data.entries_by_date:
+		entry = entries[position]
+		date = entry.header.date
+		if date > end:
+			break
+
+		amount = entry.get_book_value()
+		root = entry.account_lineage[-1].lower()
+
+		if date < start:
+			if root in ("assets", "liabilities") and not NETWORTH_EXCLUDE.search(entry.account):
+				opening += amount
+			continue
+
+		index = bucket_index(interval, start, date)
+		if root == "income":
+			income[index] -= amount
+		elif root == "expenses":
+			expenses[index] += amount
+		elif root in ("assets", "liabilities") and not NETWORTH_EXCLUDE.search(entry.account):
+			networth[index] += amount
+
+	# net worth is a running total
+	total = opening
+	for index in range(count):
+		total += networth[index]
+		networth[index] = total
+
+	return (income, expenses, networth)
+
+
+def bucket_start(interval, date):
+	if interval == "month":
+		return datetime.date(date.year, date.month, 1)
+	return date
+
+
+def bucket_index(interval, start, date):
+	"""
+	Returns the number of days or months from start to date
+	"""
+	if interval == "month":
+		return (date.year - start.year) * 12 + date.month - start.month
+	return (date - start).days
+
+
+
+#========================================================
+#	Downsampling
+#========================================================
+
+def downsample(x, y, max_points):
+	"""
+	Downsample the points (x, y) to max_points points using
+	Largest-Triangle-Three-Buckets. The first and last points are kept; the
+	rest are split into max_points - 2 buckets, and from each bucket the point
+	that forms the largest triangle with the point kept from the previous
+	bucket and the average of the next bucket is kept.
+	Returns [x values, y values].
+	"""
+	count = len(x)
+	if max_points >= count or max_points < 3:
+		return [list(x), list(y)]
+
+	sampled_x = [x[0]]
+	sampled_y = [y[0]]
+	bucket_size = float(count - 2) / (max_points - 2)
+	previous = 0
+
+	for bucket in range(max_points - 2):
+		bucket_first = int(bucket * bucket_size) + 1
+		bucket_last = int((bucket + 1) * bucket_size) + 1
+
+		# average of the next bucket (the last point, for the last bucket)
+		next_first = bucket_last
+		next_last = min(int((bucket + 2) * bucket_size) + 1, count)
+		if next_first >= count - 1:
+			(average_x, average_y) = (x[-1], y[-1])
+		else:
+			average_x = float(sum(x[next_first:next_last])) / (next_last - next_first)
+			average_y = float(sum(y[next_first:next_last])) / (next_last - next_first)
+
+		best = bucket_first
+		best_area = -1.0
+		for index in range(bucket_first, bucket_last):
+			area = abs((x[previous] - average_x) * (y[index] - y[previous])
+				- (x[previous] - x[index]) * (average_y - y[previous]))
+			if area > best_area:
+				best = index
+				best_area = area
+
+		sampled_x.append(x[best])
+		sampled_y.append(y[best])
+		previous = best
+
+	sampled_x.append(x[-1])
+	sampled_y.append(y[-1])
+
+	return [sampled_x, sampled_y]
@@ -0,0 +1,157 @@
+"""
+Expense Report Generator
+
+Generates expense analytics in a format that is easy to convert to JSON:
+	- the last month, 3 month and 12 month averages for every expense account
+	- the top expense categories over a period
+	- the burn rate (3 month average) and how many months savings would last
+
+Everything is computed from the journal's monthly totals, so the cost
+depends on the number of accounts and months, not on the number of entries.
+"""
+
+import heapq
+import datetime
+
+import webledger.report.query as query
+import webledger.report.balance as balance
+import webledger.utilities.utilities as utilities
+
+
+EXPENSE_ACCOUNTS = ["^expenses"]
+
+
+#========================================================
+#	Expense Report Parameters class
+#========================================================
+
+class ExpenseReportParameters:
+	"""
+	Expense report parameters:
+		- period: period expression for the top categories (see query.py),
+			rounded to whole months
+		- top: number of top categories
+		- category_depth: account level of the categories (2 for Expenses:Food)
+		- savings_accounts_with: terms for the accounts savings are kept in
+		- as_of: report date; averages cover the whole months before it.
+			Defaults to today, or the last entry if the ledger ends earlier.
+	"""
+
+	def __init__(self, title="Expenses", period="last month", top=10, category_depth=2,
+			savings_accounts_with=None, as_of=None):
+		self.title = title
+		self.period = period
+		self.top = top
+		self.category_depth = category_depth
+		self.savings_accounts_with = savings_accounts_with if savings_accounts_with != None else ["checking", "savings"]
+		self.as_of = as_of
+
+
+
+#========================================================
+#	Expense Report Generator
+#========================================================
+
+def generate_expense_report(journal_data, parameters):
+	"""
+	Returns expense report data based on report parameters provided
+	"""
+	monthly_totals = journal_data.get_monthly_totals()
+	as_of = get_as_of(journal_data, parameters)
+	this_month = datetime.date(as_of.year, as_of.month, 1)
+	months = [utilities.date_add_months(this_month, offset) for offset in range(-12, 0)]
+
+	expense_accounts = sorted(query.select_accounts(journal_data, EXPENSE_ACCOUNTS, None))
+
+	# rolling averages for every expense account
+	averages = list()
+	for account in expense_accounts:
+		totals = monthly_totals.get(account, dict())
+		amounts = [totals.get(month, 0) for month in months]
+		if balance.is_nonzero(amounts):
+			averages.append((account, amounts[-1], sum(amounts[-3:]) / 3, sum(amounts) / 12))
+
+	# top categories over the period
+	(period_start, period_end) = query.parse_period(parameters.period, as_of)
+	period_months = [start for (start, end) in query.unit_ranges("month", period_start, period_end)]
+	categories = [
+		(sum([monthly_totals[account].get(month, 0) for month in period_months]), account)
+		for account in expense_accounts
+		if account.count(":") == parameters.category_depth - 1]
+	top = heapq.nlargest(parameters.top, [category for category in categories if category[0] > 0])
+	period_total = sum([amount for (amount, account) in categories])
+
+	# burn rate and runway
+	savings_accounts = query.select_accounts(journal_data, parameters.savings_accounts_with, None)
+	savings = sum([amount
+		for account in savings_accounts
+		if account in journal_data.main_accounts
+			for (month, amount) in monthly_totals.get(account, dict()).iteritems()
+		if month <= this_month])
+	burn_rate = sum([monthly_totals[account].get(month, 0)
+		for account in expense_accounts
+		if ":" not in account
+			for month in months[-3:]]) / 3
+
+	return generate_expense_report_data(parameters, as_of, averages,
+		(period_start, period_end), top, period_total, savings, burn_rate)
+
+
+def get_as_of(journal_data, parameters):
+	"""
+	Returns the report date: the one asked for, or today, or the date of the
+	last entry if the ledger ends before today
+	"""
+	if parameters.as_of != None:
+		return parameters.as_of
+
+	today = datetime.date.today()
+	if len(journal_data.entry_dates) > 0 and journal_data.entry_dates[-1] < today:
+		return journal_data.entry_dates[-1]
+	return today
+
+
+
+#========================================================
+#	Expense Report Data Structure Functions
+#========================================================
+
+def generate_expense_report_data(parameters, as_of, averages, period, top, period_total,
+		savings, burn_rate):
+	"""
+	Generates the pystache dictionary for an expense report
+	"""
+	date_format = "%B %d, %Y"
+	account_style_format = "padding-left: {:d}px;"
+	padding_left_base = 8
+	indent_padding = 20
+
+	data = dict()
+	data["title"] = parameters.title
+	data["subtitle"] = "As of " + as_of.strftime(date_format)
+
+	data["averages"] = [
+		{
+			"account": account,
+			"account_display": account.split(":")[-1],
+			"account_style": account_style_format.format(padding_left_base + account.count(":") * indent_padding),
+			"last_month": balance.format_amount(last_month),
+			"average_3": balance.format_amount(average_3),
+			"average_12": balance.format_amount(average_12)
+		}
+		for (account, last_month, average_3, average_12) in averages]
+
+	data["top_subtitle"] = "For the period of " + period[0].strftime(date_format) + " to " + period[1].strftime(date_format)
+	data["top"] = [
+		{
+			"account": account,
+			"amount": balance.format_amount(amount),
+			"share": "{:.1f}%".format(amount * 100 / period_total) if period_total > 0 else ""
+		}
+		for (amount, account) in top]
+
+	data["savings"] = balance.format_amount(savings)
+	data["burn_rate"] = balance.format_amount(burn_rate)
+	data["runway"] = "{:.1f} months".format(savings / burn_rate) if burn_rate > 0 else "-"
+
+	return data
@@ -0,0 +1,180 @@
+"""
+Net Worth Generator
+
+Generates the net worth per month at book value and at market value:
+	- book value counts amounts in the default currency as they are, and
+		commodities (ie 30 COM @@ $150.00) at what was paid for them
+	- market value counts commodities at their price at the end of each month
+		(from the journal's price store), or at book value until they have one
+
+Postings are aggregated once per month: amounts in the default currency into
+one list, and the units and cost of each commodity into lists of their own.
+Running totals of those lists give the holdings at the end of every month, so
+valuing a commodity is one multiplication per month (units x month end price)
+rather than revaluing every posting each month.
+"""
+
+import json
+import datetime
+
+import webledger.journal.prices as prices
+import webledger.report.query as query
+import webledger.report.chart as chart
+import webledger.report.balance as balance
+import webledger.utilities.metrics as metrics
+
+
+#========================================================
+#	Net Worth Parameters class
+#========================================================
+
+class NetWorthParameters:
+	"""
+	Net worth parameters:
+		- accounts_with / exclude_accounts_with: account terms, as for balance
+			reports (Units accounts are excluded by default, as they hold the
+			units of investments whose book value is kept in another account)
+		- period_start / period_end: months to chart (None for the first
+			entry, or the later of the last entry and today)
+	"""
+
+	def __init__(self, title="Net Worth", accounts_with=None, exclude_accounts_with=None,
+			period_start=None, period_end=None):
+		self.title = title
+		self.accounts_with = accounts_with if accounts_with != None else ["assets", "liabilities"]
+		self.exclude_accounts_with = exclude_accounts_with if exclude_accounts_with != None else ["units"]
+		self.period_start = period_start
+		self.period_end = period_end
+
+
+
+#========================================================
+#	Net Worth Generator
+#========================================================
+
+def generate_networth(journal_data, parameters):
+	"""
+	Returns net worth chart data, with the monthly values encoded as JSON for
+	the chart
+	"""
+	data = dict()
+	data["title"] = parameters.title
+	data["tuples"] = json.dumps(generate_networth_tuples(journal_data, parameters),
+		separators=(',', ':'))
+	return data
+
+
+def generate_networth_tuples(journal_data, parameters):
+	"""
+	Returns a list with the book and market value at the end of each month
+	"""
+	(months, book, market) = generate_networth_series(journal_data, parameters)
+
+	tuples = list()
+	currency_format_string = "{:.2f}"
+
+	with metrics.timer("format"):
+		for (month, book_value, market_value) in zip(months, book, market):
+			tuples.append({
+				"date": month.strftime("%d-%b-%Y"),
+				"amount": currency_format_string.format(book_value),
+				"market": currency_format_string.format(market_value),
+				"hover": month.strftime("%b %Y") + ": " + balance.format_amount(market_value)
+					+ " (book " + balance.format_amount(book_value) + ")"
+			})
+
+	return tuples
+
+
+def generate_networth_series(journal_data, parameters):
+	"""
+	Returns (months, book values, market values): the first day of each month
+	in the period, and the net worth at the end of it
+	"""
+	if len(journal_data.entries) == 0:
+		return (list(), list(), list())
+
+	start = chart.bucket_start("month", parameters.period_start or journal_data.entry_dates[0])
+	end = parameters.period_end or max(journal_data.entry_dates[-1], datetime.date.today())
+	if end < start:
+		return (list(), list(), list())
+
+	with metrics.timer("filter"):
+		accounts = query.select_accounts(journal_data,
+			parameters.accounts_with, parameters.exclude_accounts_with)
+		entries = query.select_entries(journal_data, accounts, None, end)
+
+	with metrics.timer("aggregate"):
+		(cash, holdings) = aggregate_months(entries, len(journal_data.commodities), start, end)
+
+	with metrics.timer("value"):
+		ranges = query.unit_ranges("month", start, end)
+		months = [month_start for (month_start, month_end) in ranges]
+		month_ends = [month_end for (month_start, month_end) in ranges]
+
+		book = running_total(cash)
+		market = list(book)
+
+		for (commodity_id, commodity) in enumerate(journal_data.commodities):
+			if holdings[commodity_id] == None:
+				continue
+			(units, cost) = holdings[commodity_id]
+			units = running_total(units)
+			cost = running_total(cost)
+			prices_on = journal_data.price_store.prices_on(commodity, month_ends)
+
+			book = add_lists(book, cost)
+			market = add_lists(market, market_values(units, cost, prices_on))
+
+	return (months, book, market)
+
+
+def aggregate_months(entries, commodity_count, start, end):
+	"""
+	Returns the change in each month from start to end of:
+		- cash: amounts in the default currency
+		- holdings: (units, cost) of every other commodity, by commodity_id
+			(None for commodities without entries)
+	Entries before start are counted in the first month.
+	"""
+	count = chart.bucket_index("month", start, end) + 1
+	cash = [0] * count
+	holdings = [None] * commodity_count
+
+	for entry in entries:
+		index = max(chart.bucket_index("month", start, entry.header.date), 0)
+
+		if entry.commodity_id == 0:
+			cash[index] += entry.amount[0]
+			continue
+
+		if holdings[entry.commodity_id] == None:
+			holdings[entry.commodity_id] = ([0] * count, [0] * count)
+		(units, cost) = holdings[entry.commodity_id]
+		units[index] += entry.amount[0]
+		cost[index] += entry.get_book_value()
+
+	return (cash, holdings)
+
+
+def market_values(units, cost, prices_on):
+	"""
+	Returns units x price for each month, or the cost for months where the
+	commodity has no price (in the default currency) yet
+	"""
+	return [
+		quantity * price[0] if price != None and price[1] == prices.DEFAULT_CURRENCY else book_value
+		for (quantity, book_value, price) in zip(units, cost, prices_on)]
+
+
+def running_total(amounts):
+	total = 0
+	totals = list()
+	for amount in amounts:
+		total += amount
+		totals.append(total)
+	return totals
+
+
+def add_lists(a, b):
+	return [x + y for (x, y) in zip(a, b)]
@@ -0,0 +1,135 @@
+"""
+Portfolio Report Generator
+
+Generates the holdings of every investment (each commodity in each account)
+in a format that is easy to convert to JSON: units held, their cost basis and
+market value, the unrealized and realized gains, and the returns (XIRR and
+time weighted). Lots and gains come from the journal's lot tracker (see
+lots.py), market values from its price store and returns from returns.py.
+"""
+
+import datetime
+
+import webledger.journal.lots as lots
+import webledger.report.balance as balance
+import webledger.report.returns as returns
+
+
+#========================================================
+#	Portfolio Report Parameters class
+#========================================================
+
+class PortfolioReportParameters:
+	"""
+	Portfolio report parameters:
+		- method: lot method, "fifo" or "average"
+		- as_of: report date, for holdings and prices (default: today)
+	"""
+
+	def __init__(self, title="Portfolio", method="fifo", as_of=None):
+		if method not in lots.METHODS:
+			raise Exception("Invalid lot method (fifo or average): " + method)
+
+		self.title = title
+		self.method = method
+		self.as_of = as_of
+
+
+
+#========================================================
+#	Portfolio Report Generator
+#========================================================
+
+def generate_portfolio_report(journal_data, parameters):
+	"""
+	Returns portfolio report data based on report parameters provided
+	"""
+	as_of = parameters.as_of or datetime.date.today()
+
+	# the journal's lots cover every entry; an earlier report date needs its own
+	if len(journal_data.entry_dates) == 0 or as_of >= journal_data.entry_dates[-1]:
+		tracker = journal_data.get_lots(parameters.method)
+	else:
+		tracker = lots.track_lots(journal_data, parameters.method, as_of)
+
+	held = dict(((account, commodity), (units, cost))
+		for (account, commodity, units, cost) in tracker.holdings())
+	unrealized = tracker.unrealized(journal_data.price_store, as_of)
+	(investment_returns, portfolio_returns) = returns.generate_returns(journal_data, as_of)
+
+	# every investment still held, or with gains from sales
+	lines = list()
+	for key in sorted(set(held.keys()) | set([key for (key, gain) in tracker.realized.iteritems() if gain != 0])):
+		(units, cost) = held.get(key, (0, 0))
+		lines.append((key[0], key[1], units, cost, unrealized.get(key), tracker.realized.get(key, 0),
+			investment_returns.get(key, (None, None))))
+
+	return generate_portfolio_report_data(parameters, as_of, lines, portfolio_returns)
+
+
+
+#========================================================
+#	Portfolio Report Data Structure Functions
+#========================================================
+
+def generate_portfolio_report_data(parameters, as_of, lines, portfolio_returns):
+	"""
+	Generates the pystache dictionary for a portfolio report. Investments
+	without a price are left out of the market value and unrealized totals.
+	"""
+	data = dict()
+	data["title"] = parameters.title
+	data["subtitle"] = "As of " + as_of.strftime("%B %d, %Y") + " (" + parameters.method + ")"
+	data["lines"] = list()
+
+	total_cost = 0
+	total_market = 0
+	total_unrealized = 0
+	total_realized = 0
+
+	for (account, commodity, units, cost, market, realized, (xirr, twr)) in lines:
+		data["lines"].append({
+			"account": account,
+			"commodity": commodity,
+			"units": balance.format_amount(units, False, commodity),
+			"cost": balance.format_amount(cost),
+			"market": balance.format_amount(market[0]) if market != None else "-",
+			"unrealized": balance.format_amount(market[1]) if market != None else "-",
+			"unrealized_class": gain_class(market[1]) if market != None else "",
+			"realized": balance.format_amount(realized),
+			"realized_class": gain_class(realized),
+			"xirr": format_rate(xirr),
+			"twr": format_rate(twr)
+		})
+
+		total_cost += cost
+		total_realized += realized
+		if market != None:
+			total_market += market[0]
+			total_unrealized += market[1]
+
+	data["total_cost"] = balance.format_amount(total_cost)
+	data["total_market"] = balance.format_amount(total_market)
+	data["total_unrealized"] = balance.format_amount(total_unrealized)
+	data["total_realized"] = balance.format_amount(total_realized)
+	data["total_xirr"] = format_rate(portfolio_returns[0])
+	data["total_twr"] = format_rate(portfolio_returns[1])
+
+	return data
+
+
+def format_rate(rate):
+	# round first, so a rate a hair below zero is not shown as -0.00%
+	return "{:.2%}".format(round(rate, 6) + 0.0) if rate != None else "-"
+
+
+def gain_class(amount):
+	"""
+	Returns the css class for a gain: positive or negative, or none if it
+	rounds to zero cents (market values from implied prices are not exact)
+	"""
+	if amount >= 0.005:
+		return "positive"
+	elif amount <= -0.005:
+		return "negative"
+	return ""
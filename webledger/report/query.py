@@ -0,0 +1,389 @@
+"""
+Query Planner
+
+Compiles the parameters of a command bar command (everything after "balance"
+or "register") into a normalized query plan, and selects the journal entries
+a plan applies to using the journal's indexes.
+
+Compiled plans are cached by command and date, so repeating a command does
+not re-parse it, and relative periods ("this month") still roll over at
+midnight.
+
+Period expressions (:period ...):
+	this month, last month, this quarter, last quarter, this year, last year
+	yyyy - a year, ie 2013
+	yyyy/mm - a month, ie 2013/02
+	qN yyyy or yyyy qN - a quarter, ie q1 2013
+	qN - a quarter of this year
+	last N days|months|quarters|years - the N whole days (months, ...) before
+		this one, so "last 1 month" is the same as "last month"
+
+:by month|quarter|year splits a balance report into one column per period.
+:depth N limits a balance report to accounts N levels deep (Assets:Cash is 2).
+
+:search terms and :payee terms select the entries with all the terms in their
+transaction's description, code or notes (or, for :payee, its description),
+using the journal's search index (a term ending in "*" is a prefix). They
+combine with the account and period selections.
+"""
+
+import re
+import bisect
+import datetime
+import calendar
+import threading
+import collections
+
+import webledger.utilities.utilities as utilities
+
+
+PLAN_CACHE_SIZE = 256
+SELECTION_CACHE_SIZE = 256
+
+UNITS = ["day", "month", "quarter", "year"]
+COLUMN_UNITS = ["month", "quarter", "year"]
+
+
+#========================================================
+#	Query Plan
+#========================================================
+
+class QueryError(ValueError):
+	"""
+	A command or period expression that does not compile
+	"""
+
+
+class QueryPlan:
+	"""
+	A compiled command:
+		- title: report title, or None if not given
+		- accounts_with: terms; accounts matching any are included (None for all)
+		- exclude_accounts_with: terms; accounts matching any are excluded
+		- period_start / period_end: dates bounding the report (None for open)
+		- options: dict of any other options:
+			by - "month", "quarter" or "year" for one column per period
+			depth - deepest account level to show; deeper accounts are
+				rolled up into their ancestor at this level
+			search - terms to find in descriptions, codes and notes
+			payee - terms to find in descriptions
+	"""
+
+	def __init__(self, title=None, accounts_with=None, exclude_accounts_with=None,
+			period_start=None, period_end=None, options=None):
+		self.title = title
+		self.accounts_with = accounts_with
+		self.exclude_accounts_with = exclude_accounts_with
+		self.period_start = period_start
+		self.period_end = period_end
+		self.options = options if options != None else dict()
+
+
+
+#========================================================
+#	Compiler
+#========================================================
+
+plan_cache = collections.OrderedDict()
+plan_cache_lock = threading.Lock()
+
+
+def compile_command(command, today=None):
+	"""
+	Returns the QueryPlan for command, a list of tokens, as of today (default:
+	the current date). Plans are cached; treat them as read only. Raises
+	QueryError if the command does not compile.
+	"""
+	if today == None:
+		today = datetime.date.today()
+	key = (tuple(command), today)
+
+	with plan_cache_lock:
+		plan = plan_cache.pop(key, None)
+		if plan != None:
+			plan_cache[key] = plan
+			return plan
+
+	plan = parse_command(command, today)
+
+	with plan_cache_lock:
+		plan_cache[key] = plan
+		while len(plan_cache) > PLAN_CACHE_SIZE:
+			plan_cache.popitem(last=False)
+
+	return plan
+
+
+def parse_command(command, today):
+	"""
+	Parse a list of command tokens into a QueryPlan
+	"""
+	accounts_with = []
+	exclude_accounts_with = []
+	period = []
+	period_start = None
+	period_end = None
+	title = []
+	options = dict()
+	phase = "select"
+
+	for token in command:
+		if token == ":excluding":
+			phase = "filter"
+		elif token == ":period":
+			phase = "period"
+		elif token == ":since":
+			phase = "periodstart"
+		elif token == ":upto":
+			phase = "periodend"
+		elif token == ":title":
+			phase = "title"
+		elif token == ":by":
+			phase = "by"
+		elif token == ":depth":
+			phase = "depth"
+		elif token == ":search":
+			phase = "search"
+		elif token == ":payee":
+			phase = "payee"
+		elif phase == "select":
+			accounts_with.append(token)
+		elif phase == "filter":
+			exclude_accounts_with.append(token)
+		elif phase == "period":
+			period.append(token)
+		elif phase == "periodstart":
+			period_start = parse_date(token, ":since")
+			phase = "invalid"
+		elif phase == "periodend":
+			period_end = parse_date(token, ":upto")
+			phase = "invalid"
+		elif phase == "title":
+			title.append(token)
+		elif phase == "by":
+			if token.lower() not in COLUMN_UNITS:
+				raise QueryError("Invalid :by period (month, quarter or year): " + token)
+			options["by"] = token.lower()
+			phase = "invalid"
+		elif phase == "depth":
+			if not token.isdigit() or int(token) < 1:
+				raise QueryError("Invalid :depth (a number, 1 or more): " + token)
+			options["depth"] = int(token)
+			phase = "invalid"
+		elif phase == "search" or phase == "payee":
+			options.setdefault(phase, list()).append(token)
+		else:
+			raise QueryError("Invalid token in balance command parameters: " + token)
+
+	if len(period) > 0:
+		(period_start, period_end) = parse_period(" ".join(period), today)
+
+	return QueryPlan(title=" ".join(title) if len(title) > 0 else None,
+		accounts_with=accounts_with if len(accounts_with) > 0 else None,
+		exclude_accounts_with=exclude_accounts_with if len(exclude_accounts_with) > 0 else None,
+		period_start=period_start,
+		period_end=period_end,
+		options=options)
+
+
+def parse_period(period_str, today):
+	"""
+	Returns (start date, end date) for a period expression
+	"""
+	words = period_str.lower().split()
+
+	if len(words) == 2 and words[0] in ("this", "last") and words[1] in UNITS[1:]:
+		offset = 0 if words[0] == "this" else -1
+		return unit_range(words[1], today, offset)
+
+	if len(words) == 3 and words[0] == "last" and words[1].isdigit():
+		count = int(words[1])
+		unit = words[2][:-1] if words[2].endswith("s") else words[2]
+		if count > 0 and unit in UNITS:
+			return (unit_range(unit, today, -count)[0], unit_range(unit, today, -1)[1])
+
+	match = re.match(r"^(\d{4})(?:/(\d{1,2}))?$", words[0]) if len(words) == 1 else None
+	if match and match.group(2) == None:
+		year = int(match.group(1))
+		return (datetime.date(year, 1, 1), datetime.date(year, 12, 31))
+	elif match and 1 <= int(match.group(2)) <= 12:
+		return month_range(int(match.group(1)), int(match.group(2)))
+
+	quarter = [word for word in words if re.match(r"^q[1-4]$", word)]
+	years = [word for word in words if re.match(r"^\d{4}$", word)]
+	if len(quarter) == 1 and len(years) <= 1 and len(quarter) + len(years) == len(words):
+		year = int(years[0]) if len(years) > 0 else today.year
+		return quarter_range(year, int(quarter[0][1]))
+
+	raise QueryError("Invalid period expression: " + period_str)
+
+
+def parse_date(token, option):
+	"""
+	Returns the date of a yyyy/mm/dd token given for option
+	"""
+	try:
+		return datetime.datetime.strptime(token, "%Y/%m/%d").date()
+	except ValueError:
+		raise QueryError("Invalid " + option + " date (yyyy/mm/dd): " + token)
+
+
+def unit_range(unit, date, offset):
+	"""
+	Returns (start date, end date) of the day, month, quarter or year offset
+	units away from the one containing date
+	"""
+	if unit == "day":
+		day = date + datetime.timedelta(days=offset)
+		return (day, day)
+	elif unit == "month":
+		month = utilities.date_add_months(date, offset)
+		return month_range(month.year, month.month)
+	elif unit == "quarter":
+		month = utilities.date_add_months(date, offset * 3)
+		return quarter_range(month.year, (month.month - 1) / 3 + 1)
+	else:
+		return (datetime.date(date.year + offset, 1, 1), datetime.date(date.year + offset, 12, 31))
+
+
+def month_range(year, month):
+	return (datetime.date(year, month, 1), datetime.date(year, month, calendar.monthrange(year, month)[1]))
+
+
+def quarter_range(year, quarter):
+	return (month_range(year, quarter * 3 - 2)[0], month_range(year, quarter * 3)[1])
+
+
+def unit_ranges(unit, start, end):
+	"""
+	Returns (start date, end date) of each unit (month, quarter, year) from
+	the one containing start to the one containing end
+	"""
+	ranges = list()
+	current = unit_range(unit, start, 0)
+
+	while current[0] <= end:
+		ranges.append(current)
+		current = unit_range(unit, current[1] + datetime.timedelta(days=1), 0)
+
+	return ranges
+
+
+
+#========================================================
+#	Executing Plans
+#========================================================
+
+def select_accounts(journal_data, accounts_with, exclude_accounts_with):
+	"""
+	Returns the set of accounts (including parent accounts) matching the
+	account terms. Selections are cached on the journal, so they last as long
+	as the journal they were made from.
+	"""
+	key = (tuple(sorted(set(accounts_with))) if accounts_with else None,
+		tuple(sorted(set(exclude_accounts_with))) if exclude_accounts_with else None)
+	cache = journal_data.query_cache
+
+	accounts = cache.get(key)
+	if accounts == None:
+		include = compile_terms(key[0])
+		exclude = compile_terms(key[1])
+		accounts = frozenset([account
+			for account in journal_data.all_accounts
+			if (include == None or include.search(account))
+				and (exclude == None or not exclude.search(account))])
+
+		if len(cache) >= SELECTION_CACHE_SIZE:
+			cache.clear()
+		cache[key] = accounts
+
+	return accounts
+
+
+def compile_terms(terms):
+	"""
+	Returns a regex matching any of terms, or None if there are none
+	"""
+	if terms == None or len(terms) == 0:
+		return None
+	return re.compile("|".join(terms), re.IGNORECASE)
+
+
+def select_matches(journal_data, search, payee):
+	"""
+	Returns the set of positions (in journal.entries) of the entries matching
+	the :search and :payee terms, or None if there are none. Cached on the
+	journal, like account selections.
+	"""
+	if not search and not payee:
+		return None
+
+	key = ("search", tuple(search) if search else None, tuple(payee) if payee else None)
+	cache = journal_data.query_cache
+
+	matches = cache.get(key)
+	if matches == None:
+		index = journal_data.search_index
+		if search and payee:
+			matches = index.search("text", search) & index.search("payee", payee)
+		elif search:
+			matches = index.search("text", search)
+		else:
+			matches = index.search("payee", payee)
+		matches = frozenset(matches)
+
+		if len(cache) >= SELECTION_CACHE_SIZE:
+			cache.clear()
+		cache[key] = matches
+
+	return matches
+
+
+def select_entries(journal_data, accounts, period_start=None, period_end=None, matches=None):
+	"""
+	Returns the entries (in file order) posted to one of accounts within the
+	period (and, if given, among matches: positions from select_matches)
+	"""
+	entries = journal_data.entries
+	return [entries[position]
+		for position in select_positions(journal_data, accounts, period_start, period_end, matches)]
+
+
+def select_positions(journal_data, accounts, period_start=None, period_end=None, matches=None):
+	"""
+	Returns the positions (in journal.entries, sorted) of the entries posted
+	to one of accounts within the period (and, if given, among matches).
+	Starts from whichever gives fewer candidates: the entries of the selected
+	accounts, the slice of the date index in the period, or the matches.
+	"""
+	account_entries = journal_data.account_entries
+	account_lists = [account_entries[account] for account in accounts if account in account_entries]
+	account_count = sum([len(positions) for positions in account_lists])
+
+	dates = journal_data.entry_dates
+	low = bisect.bisect_left(dates, period_start) if period_start != None else 0
+	high = bisect.bisect_right(dates, period_end) if period_end != None else len(dates)
+
+	entries = journal_data.entries
+
+	if matches != None and len(matches) < min(high - low, account_count):
+		positions = [position
+			for position in matches
+			if entries[position].account in accounts
+				and (period_start == None or entries[position].header.date >= period_start)
+				and (period_end == None or entries[position].header.date <= period_end)]
+	elif high - low < account_count:
+		positions = [position
+			for position in journal_data.entries_by_date[low:high]
+			if entries[position].account in accounts
+				and (matches == None or position in matches)]
+	else:
+		positions = [position
+			for positions in account_lists
+				for position in positions
+			if (period_start == None or entries[position].header.date >= period_start)
+				and (period_end == None or entries[position].header.date <= period_end)
+				and (matches == None or position in matches)]
+
+	positions.sort()
+	return positions
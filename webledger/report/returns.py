@@ -0,0 +1,253 @@
+"""
+Portfolio Returns
+
+Returns of each investment (commodity in an account) and of the portfolio as
+a whole:
+	- XIRR, the annual rate at which the cash flows (buys out, sales in, and
+		the market value today in) have a net present value of zero
+	- time weighted return, the growth of the investment's value between
+		cash flows, chained together (so it does not depend on how much was
+		invested when)
+
+The XIRR of every investment is solved together: the cash flows of all
+investments are flattened into parallel lists (owner, years, amount), and
+each Newton iteration evaluates the NPV and its derivative for every
+investment still converging in a single pass over those lists. When
+investments converge (or fail), the lists are rebuilt without their flows, so
+later passes only visit the flows still converging, and there is one loop for
+the whole portfolio rather than one per investment.
+"""
+
+TOLERANCE = 1e-7
+MAX_ITERATIONS = 100
+GUESS = 0.1
+DAYS_PER_YEAR = 365.0
+
+
+#========================================================
+#	Cash Flows
+#========================================================
+
+def get_investment_postings(journal_data, as_of):
+	"""
+	Returns a dict of (account, commodity) -> list of (date, units, book
+	value) of the postings in commodities other than the default currency, in
+	date order, up to as_of
+	"""
+	postings = dict()
+	entries = journal_data.entries
+	commodities = journal_data.commodities
+
+	for position in journal_data.entries_by_date:
+		entry = entries[position]
+		if entry.header.date > as_of:
+			break
+		if entry.commodity_id == 0:
+			continue
+
+		key = (entry.account, commodities[entry.commodity_id])
+		if key not in postings:
+			postings[key] = list()
+		postings[key].append((entry.header.date, entry.amount[0], entry.get_book_value()))
+
+	return postings
+
+
+def get_cash_flows(postings, commodity, price_store, as_of):
+	"""
+	Returns the cash flows, a list of (date, amount), of an investment: what
+	was paid for it (negative), what sales brought in (positive) and, if any
+	units are left, their market value on as_of. Returns None if units are
+	left but the commodity has no price.
+	"""
+	flows = [(date, -float(book_value)) for (date, units, book_value) in postings if book_value != 0]
+	units = sum([units for (date, units, book_value) in postings])
+
+	if units != 0:
+		value = price_store.value(units, commodity, as_of)
+		if value == None:
+			return None
+		flows.append((as_of, float(value[0])))
+
+	return flows
+
+
+
+#========================================================
+#	XIRR
+#========================================================
+
+def xirr(flow_sets):
+	"""
+	Returns the XIRR of each list of cash flows in flow_sets (a list of lists
+	of (date, amount)), or None for those without a solution (ie all flows
+	the same sign) or that do not converge.
+	"""
+	count = len(flow_sets)
+	rates = [GUESS] * count
+	active = list()
+
+	# flatten: owner, years since the owner's first flow, amount
+	owners = list()
+	years = list()
+	amounts = list()
+
+	for (index, flows) in enumerate(flow_sets):
+		if flows == None or not has_both_signs(flows):
+			rates[index] = None
+			continue
+
+		first = min([date for (date, amount) in flows])
+		for (date, amount) in flows:
+			owners.append(index)
+			years.append((date - first).days / DAYS_PER_YEAR)
+			amounts.append(amount)
+		active.append(index)
+
+	for iteration in range(MAX_ITERATIONS):
+		if len(active) == 0:
+			break
+
+		npv = [0.0] * count
+		derivative = [0.0] * count
+		growth = [1.0 + rate if rate != None else 1.0 for rate in rates]
+
+		for (owner, t, amount) in zip(owners, years, amounts):
+			discounted = amount * growth[owner] ** -t
+			npv[owner] += discounted
+			derivative[owner] -= t * discounted / growth[owner]
+
+		still_active = list()
+		for index in active:
+			if derivative[index] == 0:
+				rates[index] = None
+				continue
+
+			step = npv[index] / derivative[index]
+			# keep the rate above -100%, where (1 + rate) ** -t is defined
+			rates[index] = max(rates[index] - step, (rates[index] - 1.0) / 2)
+
+			if abs(step) >= TOLERANCE:
+				still_active.append(index)
+
+		# drop the flows of the investments that are done from the next pass
+		if len(still_active) < len(active):
+			keep = set(still_active)
+			flows = [flow for flow in zip(owners, years, amounts) if flow[0] in keep]
+			owners = [owner for (owner, t, amount) in flows]
+			years = [t for (owner, t, amount) in flows]
+			amounts = [amount for (owner, t, amount) in flows]
+		active = still_active
+
+	for index in active:
+		rates[index] = None
+
+	return rates
+
+
+def has_both_signs(flows):
+	return any([amount > 0 for (date, amount) in flows]) and any([amount < 0 for (date, amount) in flows])
+
+
+
+#========================================================
+#	Time Weighted Return
+#========================================================
+
+def time_weighted_return(postings, price_store, as_of):
+	"""
+	Returns the time weighted return of a group of investments, from their
+	postings: a list of (date, commodity, units), in date order. The value is
+	taken before and after the postings of each day, and the return of each
+	period between them chained. Returns None if a commodity has no price
+	when it is needed.
+	"""
+	units = dict()
+	growth = 1.0
+	value_after = 0.0
+	index = 0
+
+	while index < len(postings):
+		date = postings[index][0]
+
+		value_before = holdings_value(units, price_store, date)
+		if value_before == None:
+			return None
+		if value_after != 0:
+			growth *= value_before / value_after
+
+		while index < len(postings) and postings[index][0] == date:
+			(date, commodity, quantity) = postings[index]
+			units[commodity] = units.get(commodity, 0) + quantity
+			index += 1
+
+		value_after = holdings_value(units, price_store, date)
+		if value_after == None:
+			return None
+
+	value_end = holdings_value(units, price_store, as_of)
+	if value_end == None:
+		return None
+	if value_after != 0:
+		growth *= value_end / value_after
+
+	return growth - 1.0
+
+
+def holdings_value(units, price_store, date):
+	"""
+	Returns the market value (float) of units (commodity -> units) on date,
+	or None if a commodity held has no price
+	"""
+	total = 0.0
+
+	for (commodity, quantity) in units.iteritems():
+		if quantity == 0:
+			continue
+		value = price_store.value(quantity, commodity, date)
+		if value == None:
+			return None
+		total += float(value[0])
+
+	return total
+
+
+
+#========================================================
+#	Returns
+#========================================================
+
+def generate_returns(journal_data, as_of):
+	"""
+	Returns (returns per investment, portfolio returns): a dict of (account,
+	commodity) -> (xirr, time weighted return), and the same pair for all
+	investments together. Any of them can be None if it cannot be computed.
+	"""
+	postings = get_investment_postings(journal_data, as_of)
+	keys = sorted(postings.keys())
+	price_store = journal_data.price_store
+
+	flow_sets = [get_cash_flows(postings[key], key[1], price_store, as_of) for key in keys]
+
+	# the portfolio's flows are all the investments' flows (if all have them)
+	if len(flow_sets) > 0 and None not in flow_sets:
+		flow_sets.append([flow for flows in flow_sets for flow in flows])
+	else:
+		flow_sets.append(None)
+
+	rates = xirr(flow_sets)
+
+	returns = dict()
+	for (index, key) in enumerate(keys):
+		returns[key] = (rates[index], time_weighted_return(
+			[(date, key[1], units) for (date, units, book_value) in postings[key]],
+			price_store, as_of))
+
+	all_postings = sorted([(date, key[1], units)
+		for key in keys
+			for (date, units, book_value) in postings[key]],
+		key=lambda posting: posting[0])
+
+	portfolio = (rates[-1], time_weighted_return(all_postings, price_store, as_of) if len(keys) > 0 else None)
+
+	return (returns, portfolio)
@@ -0,0 +1,233 @@
+"""
+SQL Report Backend
+
+Runs balance, register and monthly summary reports as SQL queries against a
+database exported with journal/database.py, so sums, filters and sorting run
+in SQLite using its indexes rather than in Python loops. Results are
+formatted with the same functions as balance.py, so the reports are the same
+as the ones generated from the journal in memory.
+
+SqliteBackend has the report functions of balance.py that the web app uses,
+and can be used in its place. Reports by period (:by) and searches (:search,
+:payee, which use the journal's search index) are generated from the journal
+in memory, as are all reports once the database file is gone (an old
+snapshot's export that has been cleaned up, see database.link_snapshot).
+"""
+
+import os
+import re
+import sqlite3
+import datetime
+import threading
+from decimal import Decimal
+
+import webledger.journal.journal as journal
+import webledger.journal.database as database
+import webledger.report.balance as balance
+import webledger.utilities.metrics as metrics
+
+
+# decimal places of a sum: the most places of the amounts summed (as with Decimal)
+PLACES = "MAX(CASE WHEN instr(p.amount, '.') > 0 THEN length(p.amount) - instr(p.amount, '.') ELSE 0 END)"
+
+
+#========================================================
+#	SQLite Backend
+#========================================================
+
+class SqliteBackend:
+	"""
+	Report functions backed by a SQLite database. Each thread gets its own
+	connection, opened on first use.
+	"""
+
+	def __init__(self, database_filename):
+		self.database_filename = database_filename
+		self.local = threading.local()
+
+
+	def available(self):
+		"""
+		Returns true if the database can be queried: a connection is already
+		open, or the file is still there (connecting to a missing file would
+		create an empty database)
+		"""
+		return hasattr(self.local, "connection") or os.path.exists(self.database_filename)
+
+
+	def connection(self):
+		if not hasattr(self.local, "connection"):
+			connection = sqlite3.connect(self.database_filename)
+			connection.create_function("REGEXP", 2, regexp)
+			self.local.connection = connection
+		return self.local.connection
+
+
+	def commodities(self):
+		"""
+		Returns the commodities exported, in id order (the same order as
+		journal.commodities)
+		"""
+		return [symbol for (commodity_id, symbol) in
+			self.connection().execute("SELECT id, symbol FROM commodities ORDER BY id")]
+
+
+	def generate_balance_report(self, journal_data, parameters):
+		"""
+		Returns balance report data based on report parameters provided
+		"""
+		if parameters.by != None or parameters.search or parameters.payee or not self.available():
+			return balance.generate_balance_report(journal_data, parameters)
+
+		connection = self.connection()
+		commodities = self.commodities()
+		(where, arguments) = posting_filter(parameters)
+
+		if parameters.depth != None:
+			where += " AND a.depth <= ?"
+			arguments.append(parameters.depth)
+
+		with metrics.timer("aggregate"):
+			balances = dict()
+			rows = connection.execute(
+				"SELECT a.name, p.commodity_id, SUM(p.amount_micros), " + PLACES + " "
+				"FROM postings p "
+				"JOIN account_lineage l ON l.account_id = p.account_id "
+				"JOIN accounts a ON a.id = l.ancestor_id "
+				"WHERE " + where + " "
+				"GROUP BY a.name, p.commodity_id", arguments)
+
+			for (account, commodity_id, micros, places) in rows:
+				if account not in balances:
+					balances[account] = [0] * len(commodities)
+				balances[account][commodity_id] = database.from_micros(micros, places)
+
+			(where, arguments) = posting_filter(parameters)
+			total = [0] * len(commodities)
+			for (commodity_id, micros, places) in connection.execute(
+					"SELECT p.commodity_id, SUM(p.amount_micros), " + PLACES + " FROM postings p "
+					"WHERE " + where + " GROUP BY p.commodity_id", arguments):
+				total[commodity_id] = database.from_micros(micros, places)
+
+		with metrics.timer("format"):
+			return balance.generate_balance_report_from_balances(parameters, commodities, balances, total)
+
+
+	def generate_register_report(self, journal_data, parameters):
+		"""
+		Returns register report data based on report parameters provided
+		"""
+		if parameters.search or parameters.payee or not self.available():
+			return balance.generate_register_report(journal_data, parameters)
+
+		commodities = self.commodities()
+		(where, arguments) = posting_filter(parameters)
+
+		with metrics.timer("filter"):
+			headers = dict()
+			entries = list()
+			rows = self.connection().execute(
+				"SELECT h.id, h.date, h.status, h.code, h.description, h.note, "
+				"a.name, p.entry_type, p.amount, p.commodity_id, p.note "
+				"FROM postings p "
+				"JOIN headers h ON h.id = p.header_id "
+				"JOIN accounts a ON a.id = p.account_id "
+				"WHERE " + where + " "
+				"ORDER BY p.id", arguments)
+
+			for (header_id, date, status, code, description, header_note,
+					account, entry_type, amount, commodity_id, note) in rows:
+				header = headers.get(header_id)
+				if header == None:
+					header = headers[header_id] = journal.Header(parse_date(date),
+						status, code, description, header_note)
+
+				entry = journal.Entry(header, account, entry_type,
+					(Decimal(amount), commodities[commodity_id]), None, note)
+				entry.commodity_id = commodity_id
+				entries.append(entry)
+
+		with metrics.timer("format"):
+			return balance.generate_register_report_from_entries(parameters, commodities, entries)
+
+
+	def generate_monthly_summary_tuples(self, journal_data, parameters):
+		"""
+		Returns a list with the total (book value) per month
+		"""
+		if not self.available():
+			return balance.generate_monthly_summary_tuples(journal_data, parameters)
+
+		(where, arguments) = posting_filter(parameters, dated=False)
+
+		with metrics.timer("aggregate"):
+			rows = self.connection().execute(
+				"SELECT substr(p.date, 1, 7), SUM(p.book_value_micros) "
+				"FROM postings p "
+				"WHERE " + where + " "
+				"GROUP BY substr(p.date, 1, 7) "
+				"ORDER BY substr(p.date, 1, 7)", arguments)
+
+			# a running total, shown for the months with entries in the period
+			monthly_amounts = list()
+			total = 0
+			for (month, micros) in rows:
+				month = parse_date(month + "-01")
+				total += database.from_micros(micros)
+				if balance.within_period(month, parameters):
+					monthly_amounts.append((month, total))
+
+		with metrics.timer("format"):
+			return balance.generate_monthly_summary_data(monthly_amounts)
+
+
+
+#========================================================
+#	Query Helpers
+#========================================================
+
+regexp_cache = dict()
+
+
+def regexp(pattern, string):
+	"""
+	SQLite REGEXP function: case insensitive search, as for account terms
+	"""
+	regex = regexp_cache.get(pattern)
+	if regex == None:
+		if len(regexp_cache) > 256:
+			regexp_cache.clear()
+		regex = regexp_cache[pattern] = re.compile(pattern, re.IGNORECASE)
+	return regex.search(string) != None
+
+
+def posting_filter(parameters, dated=True):
+	"""
+	Returns (where clause, arguments) selecting the postings (p) of the
+	accounts and (if dated) within the period of the report parameters
+	"""
+	conditions = list()
+	arguments = list()
+
+	if parameters.accounts_with:
+		conditions.append("name REGEXP ?")
+		arguments.append("|".join(parameters.accounts_with))
+	if parameters.exclude_accounts_with:
+		conditions.append("NOT name REGEXP ?")
+		arguments.append("|".join(parameters.exclude_accounts_with))
+
+	where = "p.account_id IN (SELECT id FROM accounts"
+	where += (" WHERE " + " AND ".join(conditions) + ")") if len(conditions) > 0 else ")"
+
+	if dated and parameters.period_start != None:
+		where += " AND p.date >= ?"
+		arguments.append(parameters.period_start.isoformat())
+	if dated and parameters.period_end != None:
+		where += " AND p.date <= ?"
+		arguments.append(parameters.period_end.isoformat())
+
+	return (where, arguments)
+
+
+def parse_date(date_string):
+	return datetime.datetime.strptime(date_string, "%Y-%m-%d").date()
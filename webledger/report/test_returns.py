@@ -0,0 +1,134 @@
+"""
+Tests for portfolio returns
+
+Run with: python -m unittest webledger.report.test_returns
+"""
+import os
+import datetime
+import unittest
+from decimal import Decimal
+
+import webledger.parser.ledgertree as ledgertree
+import webledger.journal.journal as journal
+import webledger.journal.prices as prices
+import webledger.report.returns as returns
+
+
+COMMODITIES_LEDGER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	"..", "..", "input", "commodities.ledger")
+
+START = datetime.date(2013, 1, 1)
+
+
+def flows(*amounts_by_day):
+	"""
+	Returns cash flows from (days after START, amount) pairs
+	"""
+	return [(START + datetime.timedelta(days=days), amount) for (days, amount) in amounts_by_day]
+
+
+class XirrTest(unittest.TestCase):
+
+	def test_one_year(self):
+		[rate] = returns.xirr([flows((0, -1000.0), (365, 1100.0))])
+		self.assertAlmostEqual(rate, 0.10, places=6)
+
+	def test_loss(self):
+		[rate] = returns.xirr([flows((0, -1000.0), (365, 900.0))])
+		self.assertAlmostEqual(rate, -0.10, places=6)
+
+	def test_several_flows(self):
+		# 100 invested now and in a year, worth 231 in two years: 10% a year
+		[rate] = returns.xirr([flows((0, -100.0), (365, -100.0), (730, 231.0))])
+		self.assertAlmostEqual(rate, 0.10, places=6)
+
+	def test_flows_out_of_order(self):
+		[rate] = returns.xirr([flows((730, 1210.0), (0, -1000.0))])
+		self.assertAlmostEqual(rate, 0.10, places=6)
+
+	def test_same_sign_flows(self):
+		self.assertEqual(returns.xirr([
+			flows((0, 100.0), (365, 50.0)),
+			flows((0, -100.0), (365, -50.0)),
+			[],
+			None]), [None, None, None, None])
+
+	def test_no_solution(self):
+		# the net present value is negative at every rate
+		self.assertEqual(returns.xirr([flows((0, -100.0), (365, 50.0), (730, -100.0))]), [None])
+
+	def test_not_converging(self):
+		max_iterations = returns.MAX_ITERATIONS
+		returns.MAX_ITERATIONS = 2
+		try:
+			self.assertEqual(returns.xirr([flows((0, -100.0), (1095, 1000.0))]), [None])
+		finally:
+			returns.MAX_ITERATIONS = max_iterations
+
+	def test_portfolio(self):
+		# the first converges in a few iterations, the second takes longer,
+		# the third has no solution; each is solved as if on its own
+		flow_sets = [
+			flows((0, -1000.0), (365, 1100.0)),
+			flows((0, -100.0), (1095, 1000.0)),
+			flows((0, 100.0), (365, 100.0)),
+			flows((0, -100.0), (365, -100.0), (730, 231.0))]
+		rates = returns.xirr(flow_sets)
+
+		self.assertAlmostEqual(rates[0], 0.10, places=6)
+		self.assertAlmostEqual(rates[1], 10 ** (1 / 3.0) - 1, places=6)
+		self.assertEqual(rates[2], None)
+		self.assertAlmostEqual(rates[3], 0.10, places=6)
+		self.assertEqual(rates, [returns.xirr([flow_set])[0] for flow_set in flow_sets])
+
+
+class TimeWeightedReturnTest(unittest.TestCase):
+
+	def setUp(self):
+		self.price_store = prices.PriceStore()
+		self.price_store.add(START, "COM", Decimal("10.00"))
+		self.price_store.add(START + datetime.timedelta(days=100), "COM", Decimal("11.00"))
+		self.price_store.add(START + datetime.timedelta(days=200), "COM", Decimal("12.10"))
+
+	def test_chained_periods(self):
+		# 10% between each price, however much was invested when
+		postings = [
+			(START, "COM", Decimal("10")),
+			(START + datetime.timedelta(days=100), "COM", Decimal("90"))]
+		twr = returns.time_weighted_return(postings, self.price_store, START + datetime.timedelta(days=200))
+		self.assertAlmostEqual(twr, 0.21, places=9)
+
+	def test_sold_out(self):
+		postings = [
+			(START, "COM", Decimal("10")),
+			(START + datetime.timedelta(days=100), "COM", Decimal("-10"))]
+		twr = returns.time_weighted_return(postings, self.price_store, START + datetime.timedelta(days=200))
+		self.assertAlmostEqual(twr, 0.10, places=9)
+
+	def test_no_price(self):
+		postings = [(START, "XYZ", Decimal("10"))]
+		self.assertEqual(returns.time_weighted_return(postings, self.price_store, START), None)
+
+
+class GenerateReturnsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.journal = journal.ledgertree_to_journal(ledgertree.parse_into_ledgertree(COMMODITIES_LEDGER))
+		self.journal.price_store.build()
+
+	def test_commodities_ledger(self):
+		# 30 COM bought for $150.00, 15 sold for $79.20 three days later and
+		# the rest worth $79.20 that day
+		(investments, portfolio) = returns.generate_returns(self.journal, datetime.date(2011, 12, 1))
+		(rate, twr) = investments[("Assets:Investments:MutualFund", "COM")]
+
+		self.assertAlmostEqual(twr, 0.056, places=9)
+		self.assertAlmostEqual(rate, 1.056 ** (365 / 3.0) - 1, delta=1e-7 * rate)
+		self.assertEqual(portfolio, (rate, twr))
+
+	def test_before_any_investment(self):
+		self.assertEqual(returns.generate_returns(self.journal, datetime.date(2011, 1, 1)), (dict(), (None, None)))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,97 @@
+"""
+Tests for the SQL report backend: its reports must match the reports from
+the journal in memory
+
+Run with: python -m unittest webledger.report.test_sql_backend
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import webledger.parser.ledgertree as ledgertree
+import webledger.journal.journal as journal
+import webledger.journal.database as database
+import webledger.report.balance as balance
+import webledger.report.sql_backend as sql_backend
+
+
+INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "input")
+
+FIXTURES = ["stan.dat", "test.dat", "commodities.ledger"]
+
+BALANCE_COMMANDS = [
+	"assets liabilities :excluding units :title Balance Sheet",
+	"income expenses",
+	"expenses :period 2010",
+	"expenses :since 2009/01/01 :upto 2009/12/31",
+	":period q2 2011",
+	"assets :depth 2",
+	":depth 1",
+	"",
+	"nothing"]
+
+REGISTER_COMMANDS = [
+	"checking :period 2011/03",
+	"assets :excluding units",
+	"",
+	"nothing"]
+
+SUMMARY_COMMANDS = [
+	"assets liabilities :excluding units",
+	"expenses :period 2010",
+	""]
+
+
+class SqlBackendTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.directory = tempfile.mkdtemp()
+		cls.journals = dict()
+		cls.backends = dict()
+
+		for fixture in FIXTURES:
+			journal_data = journal.ledgertree_to_journal(
+				ledgertree.parse_into_ledgertree(os.path.join(INPUT, fixture)))
+			database_filename = os.path.join(cls.directory, fixture + ".db")
+			database.export_journal(journal_data, os.path.join(INPUT, fixture), database_filename)
+
+			cls.journals[fixture] = journal_data
+			cls.backends[fixture] = sql_backend.SqliteBackend(database_filename)
+
+	@classmethod
+	def tearDownClass(cls):
+		shutil.rmtree(cls.directory)
+
+	def assertReportsMatch(self, report, parameters_class, commands):
+		for fixture in FIXTURES:
+			for command in commands:
+				parameters = parameters_class.from_command(command.split())
+				self.assertEqual(
+					getattr(self.backends[fixture], report)(self.journals[fixture], parameters),
+					getattr(balance, report)(self.journals[fixture], parameters),
+					"%s: %s" % (fixture, command))
+			# the reports came from the database, not from the journal
+			self.assertTrue(hasattr(self.backends[fixture].local, "connection"))
+
+	def test_balance_reports(self):
+		self.assertReportsMatch("generate_balance_report", balance.BalanceReportParameters, BALANCE_COMMANDS)
+
+	def test_register_reports(self):
+		self.assertReportsMatch("generate_register_report", balance.BalanceReportParameters, REGISTER_COMMANDS)
+
+	def test_monthly_summaries(self):
+		self.assertReportsMatch("generate_monthly_summary_tuples", balance.MonthlySummaryParameters, SUMMARY_COMMANDS)
+
+	def test_missing_database(self):
+		# once a snapshot's export is gone, reports come from the journal
+		backend = sql_backend.SqliteBackend(os.path.join(self.directory, "missing.db"))
+		parameters = balance.BalanceReportParameters.from_command(["assets"])
+		self.assertEqual(backend.generate_balance_report(self.journals["test.dat"], parameters),
+			balance.generate_balance_report(self.journals["test.dat"], parameters))
+		self.assertFalse(os.path.exists(os.path.join(self.directory, "missing.db")))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -2,13 +2,30 @@ import os
 import time
 import datetime
 import calendar
+import hashlib
+import json
 
-from flask import Flask, render_template, request, url_for
+from flask import Flask, abort, g, make_response, render_template, request, url_for
+from werkzeug.exceptions import BadRequest
 
 import webledger.parser.ledgertree as ledgertree
 import webledger.journal.journal as j
+import webledger.journal.watcher as watcher
+import webledger.journal.memory_report as memory_report
+import webledger.journal.prices as prices
+import webledger.journal.lots as lots
+import webledger.journal.database as database
+import webledger.server.prefork as prefork
 import webledger.report.balance as balance
+import webledger.report.query as query
+import webledger.report.expenses as expenses
+import webledger.report.chart as chart
+import webledger.report.networth as networth
+import webledger.report.portfolio as portfolio
+import webledger.report.sql_backend as sql_backend
 import webledger.utilities.utilities as utilities
+import webledger.utilities.metrics as metrics
+import webledger.utilities.profiling as profiling
 
 
 ################################################
@@ -17,6 +34,9 @@ import webledger.utilities.utilities as utilities
 app = Flask(__name__)
 app.debug = True
 
+# part of every ETag, so pages cached by browsers are not reused across releases
+started = time.time()
+
 
 
 ################################################
@@ -27,69 +47,577 @@ def command():
 	"""
 	Generate a report based on cmd query parameter.
 	"""
-	command = request.args.get("cmd", "")
-	result = "Unknown command: " + command
+	command = normalize_command(request.args.get("cmd", ""))
+	snapshot = journal_watcher.snapshot
 
-	reload_journal_if_modified(source_filename)
+	return conditional_response(snapshot, command,
+		lambda: run_command(snapshot, command))
 
-	if len(command) == 0:
-		# default command for now
-		command = "balance assets liabilities :excluding units :title Balance Sheet"
 
+@app.route("/networth")
+def networth_chart():
+	"""
+	Net worth per month, at book value and at market value
+	"""
+	snapshot = journal_watcher.snapshot
+
+	return conditional_response(snapshot, "networth",
+		lambda: generate_networth(snapshot))
+
+
+@app.route("/chart")
+def income_expense_chart():
+	"""
+	Income, expenses, net and net worth chart. The page loads its data from
+	/api/chart, passing along the query parameters.
+	"""
+	(key, parameters) = get_chart_parameters()
+	interval = request.args.get("interval", "month")
+	period = " ".join(request.args.get("period", "").split())
+	snapshot = journal_watcher.snapshot
+
+	def generate():
+		data = {
+			"title": "Income and Expenses",
+			"data_url": url_for("api_chart", interval=interval, period=period)
+		}
+		page = get_page_data(snapshot, data)
+		return render_page("chart.html", page=page, command=None, path="income_expense_chart")
+
+	return conditional_response(snapshot, "chart " + key, generate)
+
+
+@app.route("/expenses")
+def expense_report():
+	"""
+	Expense averages, top categories and runway. Takes optional period (for
+	the top categories, ie "last 3 months") and top query parameters.
+	"""
+	(key, parameters) = get_expense_parameters()
+	snapshot = journal_watcher.snapshot
+
+	return conditional_response(snapshot, "expenses " + key,
+		lambda: generate_expenses(snapshot, parameters))
+
+
+
+@app.route("/portfolio")
+def portfolio_report():
+	"""
+	Holdings, cost basis and gains of every investment. Takes an optional
+	method query parameter (fifo or average).
+	"""
+	method = get_portfolio_method()
+	snapshot = journal_watcher.snapshot
+
+	return conditional_response(snapshot, "portfolio " + method,
+		lambda: generate_portfolio(snapshot, method))
+
+
+
+@app.route("/metrics")
+def show_metrics():
+	"""
+	Stage latency histograms and journal size in a plain text scrape format
+	"""
+	snapshot = journal_watcher.snapshot
+	gauges = {
+		"webledger_journal_entries": len(snapshot.journal.entries),
+		"webledger_journal_accounts": len(snapshot.journal.all_accounts),
+		"webledger_journal_bytes": snapshot.size
+	}
+
+	return app.response_class(metrics.render(gauges), mimetype="text/plain")
+
+
+@app.before_request
+def start_request_timer():
+	g.request_start = time.time()
+
+
+@app.after_request
+def stop_request_timer(response):
+	metrics.observe("request", time.time() - g.request_start)
+	return response
+
+
+@app.errorhandler(query.QueryError)
+def invalid_query(error):
+	"""
+	A command or period that does not compile is a bad request, for every
+	route (the same response as abort(400))
+	"""
+	return BadRequest(str(error))
+
+
+
+################################################
+# JSON API
+#   Same reports as the pages, without rendering templates. The cmd query
+#   parameter takes the report parameters, ie "assets :period this month".
+
+@app.route("/api/balance")
+def api_balance():
+	"""
+	Balance report as JSON
+	"""
+	cmd = " ".join(request.args.get("cmd", "").split())
+	snapshot = journal_watcher.snapshot
+
+	def generate():
+		parameters = balance.BalanceReportParameters.from_command(cmd.split())
+		return json_response(reports_for(snapshot).generate_balance_report(snapshot.journal, parameters))
+
+	return conditional_response(snapshot, "api/balance " + cmd, generate)
+
+
+@app.route("/api/register")
+def api_register():
+	"""
+	Register report as JSON. The lines are encoded as they are sent, as
+	registers can get large.
+	"""
+	cmd = " ".join(request.args.get("cmd", "").split())
+	snapshot = journal_watcher.snapshot
+
+	def generate():
+		parameters = balance.BalanceReportParameters.from_command(cmd.split())
+		data = reports_for(snapshot).generate_register_report(snapshot.journal, parameters)
+		return app.response_class(stream_json_lines(data), mimetype="application/json")
+
+	return conditional_response(snapshot, "api/register " + cmd, generate)
+
+
+@app.route("/api/summary")
+def api_summary():
+	"""
+	Monthly summary (running total per month) as JSON
+	"""
+	cmd = " ".join(request.args.get("cmd", "").split())
+	snapshot = journal_watcher.snapshot
+
+	def generate():
+		parameters = balance.MonthlySummaryParameters.from_command(cmd.split())
+		return json_response({
+			"title": parameters.title,
+			"tuples": reports_for(snapshot).generate_monthly_summary_tuples(snapshot.journal, parameters)
+		})
+
+	return conditional_response(snapshot, "api/summary " + cmd, generate)
+
+
+@app.route("/api/chart")
+def api_chart():
+	"""
+	Income, expenses, net and net worth series as JSON. Takes optional
+	interval (day or month), period (ie "last 2 years") and max_points query
+	parameters.
+	"""
+	(key, parameters) = get_chart_parameters()
+	snapshot = journal_watcher.snapshot
+
+	return conditional_response(snapshot, "api/chart " + key,
+		lambda: json_response(chart.generate_chart_data(snapshot.journal, parameters)))
+
+
+@app.route("/api/networth")
+def api_networth():
+	"""
+	Book and market value net worth per month as JSON. Takes an optional
+	period query parameter (ie "last 2 years"; default: all months).
+	"""
+	period = " ".join(request.args.get("period", "").split())
+	snapshot = journal_watcher.snapshot
+
+	def generate():
+		(period_start, period_end) = query.parse_period(period, datetime.date.today()) if period != "" else (None, None)
+		parameters = networth.NetWorthParameters(period_start=period_start, period_end=period_end)
+		return json_response({
+			"title": parameters.title,
+			"tuples": networth.generate_networth_tuples(snapshot.journal, parameters)
+		})
+
+	return conditional_response(snapshot, "api/networth " + period, generate)
+
+
+@app.route("/api/expenses")
+def api_expenses():
+	"""
+	Expense report as JSON. Takes the same query parameters as /expenses.
+	"""
+	(key, parameters) = get_expense_parameters()
+	snapshot = journal_watcher.snapshot
+
+	return conditional_response(snapshot, "api/expenses " + key,
+		lambda: json_response(expenses.generate_expense_report(snapshot.journal, parameters)))
+
+
+
+@app.route("/api/portfolio")
+def api_portfolio():
+	"""
+	Portfolio report as JSON. Takes the same query parameters as /portfolio.
+	"""
+	method = get_portfolio_method()
+	snapshot = journal_watcher.snapshot
+
+	return conditional_response(snapshot, "api/portfolio " + method,
+		lambda: json_response(portfolio.generate_portfolio_report(snapshot.journal,
+			portfolio.PortfolioReportParameters(method=method))))
+
+
+
+@app.route("/api/batch")
+def api_batch():
+	"""
+	Several reports as JSON. Takes one cmd query parameter per report, each a
+	full balance or register command, ie "balance income expenses :period
+	this month".
+	"""
+	commands = [" ".join(cmd.split()) for cmd in request.args.getlist("cmd")]
+	snapshot = journal_watcher.snapshot
+
+	def generate():
+		reports = [parse_report_command(command) for command in commands]
+		data = balance.generate_reports(snapshot.journal, reports)
+		return json_response([
+			{"command": command, "report": report}
+			for (command, report) in zip(commands, data)])
+
+	return conditional_response(snapshot, "api/batch " + "|".join(commands), generate)
+
+
+
+################################################
+# Debug
+#   Only available when the WEBLEDGER_PROFILING environment variable is set.
+
+@app.route("/debug/profile")
+def debug_profile():
+	"""
+	Run a command (cmd query parameter, as in the command bar) under the
+	profiler and return the results instead of the page. With format=collapsed,
+	returns time per call stack ready for flame graph tools; otherwise returns
+	cProfile stats sorted by the sort query parameter (default: cumulative).
+	"""
+	if os.getenv("WEBLEDGER_PROFILING", "") == "":
+		abort(404)
+
+	command = normalize_command(request.args.get("cmd", ""))
+	snapshot = journal_watcher.snapshot
+	sort = request.args.get("sort", "cumulative")
+	limit = request.args.get("limit", "60")
+
+	if sort not in profiling.SORT_KEYS:
+		abort(400, "Invalid sort (one of " + ", ".join(profiling.SORT_KEYS) + "): " + sort)
+	if not limit.isdigit():
+		abort(400, "Invalid limit (a number): " + limit)
+
+	if request.args.get("format", "") == "collapsed":
+		result = profiling.profile_collapsed_stacks(run_command, (snapshot, command))
+	else:
+		result = profiling.profile_stats(run_command, (snapshot, command),
+			sort=sort, limit=int(limit))
+
+	return app.response_class(result, mimetype="text/plain")
+
+
+
+################################################
+# Reports
+
+def run_command(snapshot, command):
+	"""
+	Generate the page for a (normalized) command
+	"""
+	journal = snapshot.journal
+	result = "Unknown command: " + command
 	cmd_parts = command.split(" ")
 
 	if cmd_parts[0] == "balance":
 		parameters = balance.BalanceReportParameters.from_command(cmd_parts[1:])
-		data = balance.generate_balance_report(journal, parameters)
+		data = reports_for(snapshot).generate_balance_report(journal, parameters)
 
-		page = get_page_data(data)
-		result = render_template("balance.html", page=page, command=command, path="/")
+		page = get_page_data(snapshot, data)
+		result = render_page("balance.html", page=page, command=command, path="/")
 	elif cmd_parts[0] == "register":
 		parameters = balance.BalanceReportParameters.from_command(cmd_parts[1:])
-		data = balance.generate_register_report(journal, parameters)
+		data = reports_for(snapshot).generate_register_report(journal, parameters)
 
-		page = get_page_data(data)
-		result = render_template("register.html", page=page, command=command, path="/")
+		page = get_page_data(snapshot, data)
+		result = render_page("register.html", page=page, command=command, path="/")
 
 	return result
 
 
-@app.route("/networth")
-def networth():
-	reload_journal_if_modified(source_filename)
+def parse_report_command(command):
+	"""
+	Returns a (report type, parameters) tuple for a balance or register command
+	"""
+	cmd_parts = command.split(" ")
+
+	if cmd_parts[0] not in ("balance", "register"):
+		raise query.QueryError("Unknown command: " + command)
+
+	return (cmd_parts[0], balance.BalanceReportParameters.from_command(cmd_parts[1:]))
 
+
+def generate_networth(snapshot):
+	"""
+	Generate the net worth chart page
+	"""
+	journal = snapshot.journal
 	two_years_ago = utilities.date_add_months(datetime.date.today(), -24)
 	two_years_ago = datetime.date(
 		year=two_years_ago.year,
 		month=two_years_ago.month,
 		day=1)
-	parameters = balance.MonthlySummaryParameters(
+	parameters = networth.NetWorthParameters(
 		title="Net Worth",
 		accounts_with=["assets","liabilities"],
 		exclude_accounts_with=["units"],
 		period_start=two_years_ago,
 		period_end=None)
-	data = balance.generate_monthly_summary(journal, parameters)
+	data = networth.generate_networth(journal, parameters)
+
+	page = get_page_data(snapshot, data)
+	return render_page("linechart.html", page=page, command=None, path="networth_chart")
 
-	page = get_page_data(data)
-	return render_template("linechart.html", page=page, command=None, path="networth")
+
+def generate_portfolio(snapshot, method):
+	"""
+	Generate the portfolio report page
+	"""
+	parameters = portfolio.PortfolioReportParameters(method=method)
+	data = portfolio.generate_portfolio_report(snapshot.journal, parameters)
+
+	page = get_page_data(snapshot, data)
+	return render_page("portfolio.html", page=page, command=None, path="portfolio_report")
+
+
+def get_portfolio_method():
+	"""
+	Returns the lot method from the method query parameter (default: fifo)
+	"""
+	method = request.args.get("method", "fifo")
+
+	if method not in lots.METHODS:
+		abort(400, "Invalid method (" + " or ".join(lots.METHODS) + "): " + method)
+
+	return method
+
+
+def get_chart_parameters():
+	"""
+	Returns (cache key, parameters) for the chart data from the interval,
+	period and max_points query parameters
+	"""
+	interval = request.args.get("interval", "month")
+	period = " ".join(request.args.get("period", "").split())
+	max_points = request.args.get("max_points", "")
+
+	if interval not in chart.INTERVALS:
+		abort(400, "Invalid interval (" + " or ".join(chart.INTERVALS) + "): " + interval)
+	if max_points != "" and (not max_points.isdigit() or int(max_points) < 3):
+		abort(400, "Invalid max_points (a number, 3 or more): " + max_points)
+
+	(period_start, period_end) = query.parse_period(period, datetime.date.today()) if period != "" else (None, None)
+	parameters = chart.ChartParameters(interval=interval,
+		period_start=period_start, period_end=period_end,
+		max_points=int(max_points) if max_points != "" else None)
+
+	return ("%s|%s|%s" % (interval, period, max_points), parameters)
+
+
+def get_expense_parameters():
+	"""
+	Returns (cache key, parameters) for the expense report from the period
+	and top query parameters
+	"""
+	period = " ".join(request.args.get("period", "last month").split())
+	top = request.args.get("top", "10")
+
+	if not top.isdigit() or int(top) < 1:
+		abort(400, "Invalid top (a number, 1 or more): " + top)
+	top = int(top)
+
+	return ("%s|%d" % (period, top), expenses.ExpenseReportParameters(period=period, top=top))
+
+
+def generate_expenses(snapshot, parameters):
+	"""
+	Generate the expense report page
+	"""
+	data = expenses.generate_expense_report(snapshot.journal, parameters)
+
+	page = get_page_data(snapshot, data)
+	return render_page("expenses.html", page=page, command=None, path="expense_report")
+
+
+
+################################################
+# Conditional Requests
+
+def reports_for(snapshot):
+	"""
+	Returns the balance, register and monthly summary report functions for a
+	snapshot: its SQL backend if WEBLEDGER_SQLITE_DB is set, otherwise the
+	balance module (reports from the journal in memory)
+	"""
+	if snapshot.report_backend != None:
+		return snapshot.report_backend
+	return balance
+
+
+def conditional_response(snapshot, key, generate):
+	"""
+	Returns a response for a report identified by key (ie the normalized
+	command), tagged with an ETag and Last-Modified. A report only changes when
+	the journal is reloaded (the ledger file or the price history file
+	changes, so market values follow new prices) or the date rolls over, so if
+	the client already has the current version a 304 is returned without
+	calling generate().
+	"""
+	etag = report_etag(snapshot, key)
+	last_modified = report_last_modified(snapshot)
+
+	if request.if_none_match:
+		not_modified = request.if_none_match.contains(etag)
+	elif request.if_modified_since != None:
+		not_modified = request.if_modified_since >= last_modified
+	else:
+		not_modified = False
+
+	if not_modified:
+		response = app.response_class(status=304)
+	else:
+		response = make_response(generate())
+
+	response.set_etag(etag)
+	response.last_modified = last_modified
+	# let the browser keep the page, but make it check back every time
+	response.cache_control.no_cache = True
+
+	return response
+
+
+def report_etag(snapshot, key):
+	"""
+	ETag for a report: depends on the journal version, the report and today's
+	date (for reports relative to today, ie ":period this month"). The server
+	start time is included so a new release does not serve stale pages.
+	"""
+	tag = "%s|%s|%s|%s" % (snapshot.version, started, datetime.date.today().isoformat(), key)
+	return hashlib.sha1(tag.encode("utf-8")).hexdigest()
+
+
+def report_last_modified(snapshot):
+	"""
+	Last-Modified for a report: the latest of when the ledger file (or the
+	snapshot's other files, ie the price history file) was modified, the
+	start of today and when the server started. Truncated to seconds, as that
+	is all HTTP dates can represent.
+	"""
+	today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+	file_modified = max([snapshot.last_modified] + [modified
+		for (filename, modified, size) in snapshot.other_files
+		if modified != None])
+	modified = datetime.datetime.fromtimestamp(int(file_modified))
+	modified = max(modified, today, datetime.datetime.fromtimestamp(int(started)))
+	# werkzeug compares HTTP dates in UTC
+	return datetime.datetime.utcfromtimestamp(time.mktime(modified.timetuple()))
+
+
+################################################
+# JSON Encoding
+
+def json_response(data):
+	"""
+	Returns data encoded as compact JSON
+	"""
+	return app.response_class(encode_json(data), mimetype="application/json")
+
+
+def encode_json(data):
+	return json.dumps(data, separators=(",", ":"), default=encode_json_default)
+
+
+def encode_json_default(o):
+	"""
+	Encode the types used in report data that json does not handle
+	"""
+	if isinstance(o, datetime.date):
+		return o.isoformat()
+	raise TypeError(repr(o) + " is not JSON serializable")
+
+
+def stream_json_lines(data, chunk_size=500):
+	"""
+	Generator that encodes report data as JSON, chunk_size lines at a time
+	"""
+	header = dict(data)
+	lines = header.pop("lines")
+
+	if len(header) > 0:
+		yield encode_json(header)[:-1] + ',"lines":['
+	else:
+		yield '{"lines":['
+
+	for start in range(0, len(lines), chunk_size):
+		chunk = ",".join(encode_json(line) for line in lines[start:start+chunk_size])
+		yield chunk if start == 0 else "," + chunk
+
+	yield "]}"
 
 
 
 ################################################
 # Utilities
 
-def get_page_data(data):
+def normalize_command(command):
+	"""
+	Collapse whitespace in a command and substitute the default report for an
+	empty one.
+	"""
+	command = " ".join(command.split())
+
+	if len(command) == 0:
+		# default command for now
+		command = "balance assets liabilities :excluding units :title Balance Sheet"
+
+	return command
+
+
+def render_page(template, **context):
+	"""
+	Render a page template, recording how long it took
+	"""
+	with metrics.timer("render"):
+		return render_template(template, **context)
+
+
+def get_page_data(snapshot, data):
 	"""
 	Returns a dictionary of data to be rendered by the page. The "data" parameter is
-	data specific for the current page being rendered. Standard data for all pages will
-	be generated/fetched here.
+	data specific for the current page being rendered. Standard data for all pages is
+	taken from the snapshot's navigation data.
 	"""
 	return {
 		"title": "Webledger",
 		"data": data,
+		"reports": snapshot.navigation["reports"],
+		"payables_receivables": snapshot.navigation["payables_receivables"]
+	}
+
+
+def get_navigation(journal):
+	"""
+	Build the navigation list data. It only changes when the journal does, so
+	it is built once when the journal is loaded and shared by all requests.
+	"""
+	return {
 		"reports": get_reports(),
-		"payables_receivables": get_payables_receivables()
+		"payables_receivables": get_payables_receivables(journal)
 	}
 
 
@@ -103,7 +631,7 @@ def get_reports():
 			"title": "Balance Sheet"
 		},
 		{
-			"path": "networth",
+			"path": "networth_chart",
 			"title": "Net Worth"
 		},
 		{
@@ -113,11 +641,23 @@ def get_reports():
 		{
 			"command": "balance income expenses :period last month :title Income Statement",
 			"title": "Income Statement - Previous Month"
+		},
+		{
+			"path": "expense_report",
+			"title": "Expenses"
+		},
+		{
+			"path": "income_expense_chart",
+			"title": "Income and Expenses Chart"
+		},
+		{
+			"path": "portfolio_report",
+			"title": "Portfolio"
 		}
 	]
 
 
-def get_payables_receivables():
+def get_payables_receivables(journal):
 	"""
 	Get a list of accounts payable and receivable with balances
 	"""
@@ -142,33 +682,46 @@ def get_payables_receivables():
 ################################################
 # Main + Setup
 
-def reload_journal_if_modified(source_filename):
-	"""
-	Check if the journal source file has been modified since we last read it.
-	If it has, then reload it.
-	"""
-	global journal
-	global last_modified
-	if last_modified < os.stat(source_filename).st_mtime:
-		print "Detected change in ledger file, reloading"
-		(journal, last_modified) = read_journal_data(source_filename)
-
-
-
 def read_journal_data(source_filename):
 	"""
-	Read in and return the journal data
+	Read in the journal data and return it as a snapshot
 	"""
 	t1 = time.time()
-	tree = ledgertree.parse_into_ledgertree(source_filename)
-	last_modified = os.stat(source_filename).st_mtime
-	journal = j.ledgertree_to_journal(tree)
+	# stat before parsing so a change made while parsing is picked up next time
+	stat = os.stat(source_filename)
+	if os.getenv("WEBLEDGER_MEMORY_REPORT", "") != "":
+		(journal, report) = memory_report.load_journal_with_memory_report(source_filename)
+		print report.to_string()
+	else:
+		tree = ledgertree.parse_into_ledgertree(source_filename)
+		journal = j.ledgertree_to_journal(tree)
+
+	# price history kept outside the ledger file (read again on every reload,
+	# and watched along with the ledger file)
+	other_files = list()
+	price_filename = os.getenv("LEDGER_PRICE_DB", "")
+	if price_filename != "":
+		other_files.append(watcher.file_state(price_filename))
+		if os.path.exists(price_filename):
+			prices.read_price_file(price_filename, journal.price_store)
+	journal.price_store.build()
 	t2 = time.time()
 
 	print "Parsed ledger file in %0.3f ms" % ((t2-t1)*1000.0)
-	print "Ledger file last modified %s" % time.ctime(last_modified)
 
-	return (journal, last_modified)
+	# the snapshot's SQL reports read the export made from its own journal,
+	# so its ETags never describe a later export
+	report_backend = None
+	database_filename = os.getenv("WEBLEDGER_SQLITE_DB", "")
+	if database_filename != "":
+		mode = database.export_journal(journal, source_filename, database_filename)
+		version = watcher.snapshot_version(stat.st_mtime, stat.st_size, other_files)
+		report_backend = sql_backend.SqliteBackend(database.link_snapshot(database_filename, version))
+		print "Exported journal to %s (%s) in %0.3f ms" % (database_filename, mode, (time.time()-t2)*1000.0)
+	print "Ledger file last modified %s" % time.ctime(stat.st_mtime)
+
+	return watcher.JournalSnapshot(journal, stat.st_mtime, stat.st_size,
+		navigation=get_navigation(journal), report_backend=report_backend, other_files=other_files)
 
 
 
@@ -180,6 +733,20 @@ if __name__ == "__main__":
 	if source_filename == "":
 		print "Could not find path to ledger file in LEDGER_FILE enviornment variable."
 	else:
-		(journal, last_modified) = read_journal_data(source_filename)
-		
-		app.run()
+		journal_watcher = watcher.JournalWatcher(source_filename, read_journal_data)
+		workers = int(os.getenv("WEBLEDGER_WORKERS", "0"))
+
+		if workers > 0:
+			# production mode: the journal is loaded once and shared with
+			# forked workers; the master process handles reloads
+			app.debug = False
+			server = prefork.PreforkServer(app, journal_watcher, workers,
+				host=os.getenv("WEBLEDGER_HOST", "127.0.0.1"),
+				port=int(os.getenv("WEBLEDGER_PORT", "5000")))
+			server.serve_forever()
+		else:
+			# the watcher reloads the journal in the background; requests are
+			# served from its latest snapshot
+			journal_watcher.start()
+
+			app.run()
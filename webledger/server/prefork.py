@@ -0,0 +1,217 @@
+"""
+Pre-fork Server
+
+Production serving mode that loads the journal once in a master process and
+forks worker processes that share it copy-on-write:
+	PreforkServer - binds the socket, forks the workers and coordinates reloads
+"""
+
+import os
+import gc
+import sys
+import errno
+import signal
+import traceback
+from wsgiref.simple_server import make_server
+
+
+#========================================================
+#	Pre-fork Server
+#========================================================
+
+class PreforkServer:
+	"""
+	Serves a WSGI app from a number of forked worker processes.
+
+	The master process owns the journal watcher. It loads the journal before
+	forking, so every worker shares the same parsed journal pages instead of
+	parsing and holding its own copy. When the ledger file changes, the master
+	reloads it and then replaces the workers with a new generation forked from
+	the new snapshot. Old workers finish the request they are handling before
+	they exit, so no request is dropped during a reload.
+	"""
+
+	def __init__(self, app, journal_watcher, workers, host="127.0.0.1", port=5000):
+		self.app = app
+		self.journal_watcher = journal_watcher
+		self.num_workers = workers
+		self.host = host
+		self.port = port
+		self.server = None
+		self.workers = set()
+		self.stopping = False
+
+
+	def serve_forever(self):
+		"""
+		Bind the socket, fork the workers and supervise them until the master
+		is told to stop (SIGTERM or SIGINT).
+		"""
+		self.server = make_server(self.host, self.port, self.app)
+		# workers race for connections; the ones that lose should go back to
+		# waiting rather than block in accept()
+		self.server.socket.setblocking(0)
+
+		signal.signal(signal.SIGTERM, self.handle_stop)
+		signal.signal(signal.SIGINT, self.handle_stop)
+
+		print "Serving on http://%s:%d/ with %d workers" % (self.host, self.port, self.num_workers)
+		self.spawn_generation()
+
+		try:
+			while not self.stopping:
+				if self.journal_watcher.wait_for_change(timeout=1.0):
+					if self.journal_watcher.reload():
+						self.spawn_generation()
+				self.reap_workers()
+		finally:
+			self.stop_workers(self.workers)
+			self.server.server_close()
+
+
+	def handle_stop(self, signum, frame):
+		self.stopping = True
+
+
+	def spawn_generation(self):
+		"""
+		Fork a full set of workers from the current snapshot and then tell the
+		previous set to exit.
+		"""
+		freeze_heap()
+
+		old_workers = self.workers
+		self.workers = set()
+		for i in range(self.num_workers):
+			self.spawn_worker()
+
+		self.stop_workers(old_workers)
+
+
+	def spawn_worker(self):
+		pid = os.fork()
+
+		if pid == 0:
+			# never return into the master's code; a worker that crashes logs
+			# the traceback and exits with an error status for the master
+			status = 0
+			try:
+				self.run_worker()
+			except:
+				traceback.print_exc()
+				status = 1
+			finally:
+				sys.stderr.flush()
+				os._exit(status)
+
+		self.workers.add(pid)
+
+
+	def run_worker(self):
+		"""
+		Worker process main loop. Handles one request at a time until it gets
+		SIGTERM from the master.
+		"""
+		state = {"stopping": False}
+
+		def handle_term(signum, frame):
+			state["stopping"] = True
+
+		signal.signal(signal.SIGTERM, handle_term)
+		signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+		# wake up regularly to notice SIGTERM
+		self.server.timeout = 0.5
+		disable_full_collections()
+		while not state["stopping"]:
+			self.server.handle_request()
+			collect_young_garbage()
+
+
+	def stop_workers(self, workers):
+		for pid in workers:
+			try:
+				os.kill(pid, signal.SIGTERM)
+			except OSError as e:
+				if e.errno != errno.ESRCH:
+					raise
+
+
+	def reap_workers(self):
+		"""
+		Collect exited workers and replace any from the current generation
+		that died unexpectedly.
+		"""
+		while True:
+			try:
+				(pid, status) = os.waitpid(-1, os.WNOHANG)
+			except OSError as e:
+				if e.errno == errno.ECHILD:
+					return
+				raise
+
+			if pid == 0:
+				return
+
+			if pid in self.workers:
+				print "Worker %d exited unexpectedly (%s), restarting it" % (pid, describe_exit(status))
+				self.workers.remove(pid)
+				if not self.stopping:
+					self.spawn_worker()
+
+
+
+#========================================================
+#	Utility Functions
+#========================================================
+
+def freeze_heap():
+	"""
+	Clean up garbage left over from loading the journal and, where the
+	interpreter supports it (gc.freeze, Python 3.7+), move everything into the
+	permanent generation so collections in the workers do not touch (and
+	therefore copy) the shared pages.
+
+	Python 2.7 has no gc.freeze, and a full collection writes to every
+	tracked object, copying every shared page into the worker. The objects
+	left after the collection here are all in the oldest generation, so
+	workers there only collect the younger generations (see
+	disable_full_collections). Reading shared objects still updates their
+	reference counts, so the pages a request touches are copied either way.
+	"""
+	gc.collect()
+
+	if hasattr(gc, "freeze"):
+		gc.freeze()
+
+
+def disable_full_collections():
+	"""
+	In a worker without gc.freeze (Python 2.7), turn off automatic collection
+	so that it never runs a full collection over the shared heap;
+	collect_young_garbage collects the younger generations instead. Cycles
+	that survive into the oldest generation are kept until the worker is
+	replaced (on the next reload).
+	"""
+	if not hasattr(gc, "freeze"):
+		gc.disable()
+
+
+def collect_young_garbage():
+	"""
+	With automatic collection off, collect the two younger generations once
+	as many objects were allocated as would have started a collection. Those
+	only hold objects created in the worker, so the shared pages are left
+	alone.
+	"""
+	if not gc.isenabled() and gc.get_count()[0] > gc.get_threshold()[0]:
+		gc.collect(1)
+
+
+def describe_exit(status):
+	"""
+	Describe a waitpid status: the exit status, or the signal that killed it
+	"""
+	if os.WIFSIGNALED(status):
+		return "killed by signal %d" % os.WTERMSIG(status)
+	return "exit status %d" % os.WEXITSTATUS(status)
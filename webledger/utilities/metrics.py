@@ -0,0 +1,135 @@
+"""
+Metrics
+
+In-process latency histograms for the stages of loading a journal and
+generating a report, and a plain text (Prometheus style) scrape format for
+them. Metrics are per process, so with several workers each one reports its
+own.
+
+Usage:
+	with metrics.timer("filter"):
+		...
+	metrics.observe("lex", seconds)
+"""
+
+import time
+import threading
+
+
+#========================================================
+#	Histogram
+#========================================================
+
+class Histogram:
+	"""
+	Latency histogram for one stage. Keeps the count and sum of every
+	observation, and the most recent max_samples observations for percentiles.
+	"""
+
+	def __init__(self, max_samples=1024):
+		self.max_samples = max_samples
+		self.count = 0
+		self.total = 0.0
+		self.samples = list()
+		self.lock = threading.Lock()
+
+
+	def observe(self, seconds):
+		with self.lock:
+			if len(self.samples) < self.max_samples:
+				self.samples.append(seconds)
+			else:
+				self.samples[self.count % self.max_samples] = seconds
+			self.count += 1
+			self.total += seconds
+
+
+	def percentiles(self, quantiles):
+		"""
+		Returns the value at each quantile (0.0 - 1.0) of the recent samples
+		"""
+		with self.lock:
+			samples = sorted(self.samples)
+
+		if len(samples) == 0:
+			return [0.0 for quantile in quantiles]
+
+		return [samples[min(int(quantile * len(samples)), len(samples) - 1)]
+			for quantile in quantiles]
+
+
+
+#========================================================
+#	Registry
+#========================================================
+
+QUANTILES = [0.5, 0.95, 0.99]
+
+histograms = dict()
+histograms_lock = threading.Lock()
+
+
+def get_histogram(stage):
+	"""
+	Returns the histogram for stage, creating it if needed
+	"""
+	histogram = histograms.get(stage)
+
+	if histogram == None:
+		with histograms_lock:
+			histogram = histograms.setdefault(stage, Histogram())
+
+	return histogram
+
+
+def observe(stage, seconds):
+	"""
+	Record that stage took seconds
+	"""
+	get_histogram(stage).observe(seconds)
+
+
+class timer:
+	"""
+	Context manager that records how long its block took under stage
+	"""
+
+	def __init__(self, stage):
+		self.stage = stage
+
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		observe(self.stage, time.time() - self.start)
+		return False
+
+
+
+#========================================================
+#	Scrape Format
+#========================================================
+
+def render(gauges=None):
+	"""
+	Returns the stage histograms, plus any gauges (a dict of name -> value),
+	in the plain text scrape format.
+	"""
+	lines = list()
+
+	lines.append("# HELP webledger_stage_seconds Time spent in each stage of loading and reporting")
+	lines.append("# TYPE webledger_stage_seconds summary")
+	for stage in sorted(histograms.keys()):
+		histogram = histograms[stage]
+		for (quantile, value) in zip(QUANTILES, histogram.percentiles(QUANTILES)):
+			lines.append('webledger_stage_seconds{stage="%s",quantile="%s"} %f' % (stage, quantile, value))
+		lines.append('webledger_stage_seconds_count{stage="%s"} %d' % (stage, histogram.count))
+		lines.append('webledger_stage_seconds_sum{stage="%s"} %f' % (stage, histogram.total))
+
+	if gauges != None:
+		for name in sorted(gauges.keys()):
+			lines.append("# TYPE %s gauge" % name)
+			lines.append("%s %s" % (name, gauges[name]))
+
+	return "\n".join(lines) + "\n"
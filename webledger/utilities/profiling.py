@@ -0,0 +1,105 @@
+"""
+Profiling
+
+Run a function under a profiler and return the results as text:
+	profile_stats - cProfile stats, sorted
+	profile_collapsed_stacks - time per call stack in the "collapsed" format
+		used by flame graph tools (one "frame;frame;frame microseconds" line
+		per stack)
+"""
+
+import os
+import sys
+import time
+import cProfile
+import pstats
+import StringIO
+
+
+# sort keys pstats accepts (ie cumulative, time, calls)
+SORT_KEYS = sorted(pstats.Stats.sort_arg_dict_default.keys())
+
+
+def profile_stats(func, args, sort="cumulative", limit=60):
+	"""
+	Call func(*args) under cProfile and return the stats, sorted by sort and
+	limited to the top limit functions.
+	"""
+	profiler = cProfile.Profile()
+	profiler.runcall(func, *args)
+
+	stream = StringIO.StringIO()
+	stats = pstats.Stats(profiler, stream=stream)
+	stats.sort_stats(sort).print_stats(limit)
+
+	return stream.getvalue()
+
+
+def profile_collapsed_stacks(func, args):
+	"""
+	Call func(*args) while recording the time spent in each distinct call
+	stack, and return the stacks in the collapsed format.
+	"""
+	collector = StackCollector()
+
+	sys.setprofile(collector.event)
+	try:
+		func(*args)
+	finally:
+		sys.setprofile(None)
+
+	lines = ["%s %d" % (stack, int(seconds * 1000000))
+		for (stack, seconds) in collector.times.iteritems()
+		if int(seconds * 1000000) > 0]
+	lines.sort()
+
+	return "\n".join(lines) + "\n"
+
+
+
+#========================================================
+#	Stack Collector
+#========================================================
+
+class StackCollector:
+	"""
+	sys.setprofile callback that keeps track of the current call stack and
+	charges the time between events to it. cProfile only records caller and
+	callee pairs, which is not enough to rebuild full stacks.
+	"""
+
+	def __init__(self):
+		self.stacks = list()  # stacks[i] is the collapsed stack at depth i
+		self.times = dict()
+		self.last = time.time()
+
+
+	def event(self, frame, event, arg):
+		now = time.time()
+
+		if len(self.stacks) > 0:
+			stack = self.stacks[-1]
+			self.times[stack] = self.times.get(stack, 0.0) + (now - self.last)
+
+		if event == "call":
+			self.push(frame_name(frame))
+		elif event == "c_call":
+			self.push(getattr(arg, "__name__", "?"))
+		elif event in ("return", "c_return", "c_exception"):
+			# returns from the frame that installed the profiler have no push
+			if len(self.stacks) > 0:
+				self.stacks.pop()
+
+		self.last = time.time()
+
+
+	def push(self, name):
+		if len(self.stacks) > 0:
+			self.stacks.append(self.stacks[-1] + ";" + name)
+		else:
+			self.stacks.append(name)
+
+
+def frame_name(frame):
+	code = frame.f_code
+	return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)